@@ -1,23 +1,26 @@
+import math
 import os
 from datetime import timedelta
 
+import numpy as np
 import pandas as pd
 import plotly.graph_objects as go
 import streamlit as st
-from plotly.subplots import make_subplots
 
+from lib.categories import category_mapping, compute_category_flows
+from lib.charts import chart_series, flow_figure
+from lib.dashboard import DashboardData, fetch_artifact, load_artifact
+from lib.data_cache import SWRCache
+from lib.flow_index import top_page
+from lib.history_index import HistoryIndex
+from lib.rollups import FREQ_LABELS, Rollups, rollup_freq
 from lib.sheet import (
     SheetNotReady,
     load_credentials_from_json_string,
-    load_dataframe,
+    refresh_dataframe,
 )
-from lib.watchlist import (
-    add_stock,
-    get_categories,
-    load_watchlist,
-    remove_stock,
-)
-from settings import JSON_FILE_NAME
+from lib.watchlist import WatchlistCache, WatchlistConflict, get_category_emoji
+from settings import APP_DATA_TTL, APP_PAGE_SIZE, JSON_FILE_NAME
 
 # --- 1. 頁面設定 ---
 st.set_page_config(
@@ -119,21 +122,67 @@ def _prepare_credentials() -> None:
         load_credentials_from_json_string(st.secrets["GCP_CREDENTIALS"])
 
 
-@st.cache_data(ttl=60)
-def load_data() -> pd.DataFrame:
+def _load_dashboard_data(previous: DashboardData | None) -> DashboardData:
+    """先比對 Meta 分頁的修訂標記：沒變動沿用上一版，只有附加時只抓尾端列、只彙總尾端列。
+    索引在這裡 (背景執行緒) 建好，資料集換版時請求不必等待重建。
+    Drive 上有較新的每日快照時先換上它 (取回失敗只記 warning)，再照常比對修訂標記。
+    """
     _prepare_credentials()
-    df = load_dataframe()
-    return df if df is not None else pd.DataFrame()
-
-
-@st.cache_data(ttl=10)
-def load_watchlist_cached() -> dict[str, dict]:
-    return load_watchlist()
+    if fetch_artifact():
+        previous = load_artifact() or previous
+    sheet = refresh_dataframe(previous.sheet if previous is not None else None)
+    if previous is not None and sheet is previous.sheet:
+        return previous
+    return DashboardData.build(sheet, previous)
+
+
+@st.cache_resource
+def data_cache() -> SWRCache[DashboardData]:
+    """所有 session 共用的資料集；過期時背景重新載入，請求不必等待整份 Sheet 下載。
+    本機有每日 pipeline 預建的快照時直接以它開始 (只讀本機檔案)；Drive 上的新版與修訂標記都在背景比對，
+    第一位訪客不必等待。
+    """
+    return SWRCache(_load_dashboard_data, ttl=APP_DATA_TTL, initial=load_artifact())
+
+
+@st.cache_data(max_entries=128, show_spinner=False)
+def load_chart_series(
+    version: int,
+    stock_id: str,
+    start,
+    end,
+    freq: str | None,
+    _history: HistoryIndex,
+    _rollups: Rollups,
+) -> pd.DataFrame:
+    """單檔圖表序列，依 (資料版本, 代號, 區間, 彙總頻率) 快取；freq 為 None 時用逐日資料。
+    彙總時頭尾被區間切過的週 / 月只算區間內的日子。
+    """
+    if freq is None:
+        return chart_series(_history.stock_range(stock_id, start, end))
+    return chart_series(_rollups.stock_range(freq, stock_id, start, end, daily=_history))
+
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def load_flow_figure(
+    version: int, stock_id: str, start, end, freq: str | None, _series: pd.DataFrame
+) -> go.Figure:
+    """圖表規格同樣依 (資料版本, 代號, 區間, 彙總頻率) 快取；切回最近看過的股票不必重建"""
+    if freq is None:
+        return flow_figure(_series)
+    label = FREQ_LABELS[freq]
+    return flow_figure(_series, bar_name=f"每{label}", title=f"籌碼分佈趨勢 ({label}彙總)")
+
+
+@st.cache_resource
+def watchlist_cache() -> WatchlistCache:
+    """所有 session 共用；過期時只讀版本格驗證，⭐ 修改後直接更新快取 (不必重新讀取整頁)"""
+    return WatchlistCache()
 
 
 # --- 3. 載入資料 ---
 try:
-    df_raw = load_data()
+    data = data_cache().get()
 except SheetNotReady as e:
     st.error(f"連線設定錯誤: {e}")
     st.stop()
@@ -141,13 +190,16 @@ except Exception as e:
     st.error(f"連線錯誤: {e}")
     st.stop()
 
+df_raw = data.value.sheet.frame
 if df_raw.empty:
     st.warning("⚠️ 目前無資料")
     st.stop()
 
 min_db_date = df_raw["日期"].min().date()
 max_db_date = df_raw["日期"].max().date()
-watchlist = load_watchlist_cached()
+history = data.value.history
+flows = data.value.flows
+watchlist = watchlist_cache().watchlist()
 watchlist_ids = set(watchlist.keys())
 
 
@@ -197,36 +249,33 @@ with st.sidebar:
     st.markdown("---")
     st.caption(f"⭐ Watchlist：{len(watchlist)} 檔")
     if st.button("🔄 重新載入", use_container_width=True):
-        st.cache_data.clear()
+        data_cache().refresh()
+        watchlist_cache().invalidate()
         st.rerun()
 
 
 # --- 5. 資料篩選邏輯 ---
-mask_date = (df_raw["日期"].dt.date >= start_date) & (df_raw["日期"].dt.date <= end_date)
-df_period = df_raw.loc[mask_date].copy()
-
-df_period["is_buy_day"] = df_period["估算張數"] > 0
-df_period["is_sell_day"] = df_period["估算張數"] < 0
-
-stats = df_period.groupby(["代號", "名稱"]).agg(
-    累計金額=("買賣超金額(千)", "sum"),
-    累計張數=("估算張數", "sum"),
-    買超天數=("is_buy_day", "sum"),
-    賣超天數=("is_sell_day", "sum"),
-).reset_index()
-
-if is_buy:
-    final_list = stats[stats["累計張數"] > 0].copy()
-    final_list = final_list[final_list["買超天數"] >= min_appear_days]
-    final_list["顯示天數"] = final_list["買超天數"]
-else:
-    final_list = stats[stats["累計張數"] < 0].copy()
-    final_list = final_list[final_list["賣超天數"] >= min_appear_days]
-    final_list["顯示天數"] = final_list["賣超天數"]
+stats = flows.window(start_date, end_date)
+
+days_col = "買超天數" if is_buy else "賣超天數"
+direction = stats["累計張數"] > 0 if is_buy else stats["累計張數"] < 0
+keep = (
+    direction
+    & (stats[days_col] >= min_appear_days)
+    & (stats["累計金額"].abs() >= amount_threshold)
+)
+final_list = stats.loc[keep].assign(
+    顯示天數=stats[days_col],
+    金額絕對值=stats["累計金額"].abs(),
+    張數絕對值=stats["累計張數"].abs(),
+)
 
-final_list = final_list[final_list["累計金額"].abs() >= amount_threshold]
-final_list["金額絕對值"] = final_list["累計金額"].abs()
-final_list = final_list.sort_values(by="金額絕對值", ascending=False)
+
+SORT_OPTIONS = {
+    "淨金額 (絕對值)": "金額絕對值",
+    "淨張數 (絕對值)": "張數絕對值",
+    "出現天數": "顯示天數",
+}
 
 
 # --- 6. Session state ---
@@ -246,17 +295,21 @@ st.caption(
 if final_list.empty:
     st.info("💡 無符合條件股票，請於左側調整條件。")
 else:
-    st.markdown(f"**共 {len(final_list)} 檔** (點擊查看詳情)")
-
-    display_df = final_list[
-        ["代號", "名稱", "顯示天數", "累計金額", "累計張數"]
-    ].copy()
-    display_df["累計張數"] = display_df["累計張數"].astype(int)
-    display_df.insert(
-        0,
-        "⭐",
-        display_df["代號"].apply(lambda sid: "⭐" if str(sid) in watchlist_ids else ""),
-    )
+    page_count = max(1, math.ceil(len(final_list) / APP_PAGE_SIZE))
+    sort_col, page_col = st.columns([2, 1])
+    with sort_col:
+        sort_label = st.selectbox("排序", list(SORT_OPTIONS), key="list_sort")
+    with page_col:
+        # 條件變動使頁數變少時，先把目前頁碼夾回範圍內
+        if st.session_state.get("list_page", 1) > page_count:
+            st.session_state.list_page = page_count
+        page = int(st.number_input("頁", min_value=1, max_value=page_count, value=1, key="list_page"))
+    st.markdown(f"**共 {len(final_list)} 檔**，第 {page}/{page_count} 頁 (點擊查看詳情)")
+
+    # 只取目前這一頁 (前 page × APP_PAGE_SIZE 名用 nlargest)，瀏覽器只收到一頁資料
+    page_df = top_page(final_list, SORT_OPTIONS[sort_label], page, APP_PAGE_SIZE)
+    display_df = page_df[["代號", "名稱", "顯示天數", "累計金額", "累計張數"]].astype({"累計張數": int})
+    display_df.insert(0, "⭐", np.where(display_df["代號"].isin(watchlist_ids), "⭐", ""))
     display_df.columns = ["⭐", "代號", "名稱", "出現天數", "淨買賣超(千)", "淨張數"]
 
     event = st.dataframe(
@@ -273,6 +326,29 @@ else:
         st.session_state.selected_stock_name = row["名稱"]
 
 
+# --- 7b. Watchlist 分類動向 ---
+category_map = category_mapping(watchlist)
+df_period = flows.period(start_date, end_date)
+if not category_map.empty and not df_period.empty:
+    with st.expander("🗂️ Watchlist 分類動向", expanded=False):
+        category_flows = compute_category_flows(
+            df_period,
+            category_map,
+            pd.Timestamp(end_date),
+            window_days=flows.trading_days(start_date, end_date),
+            metric="net_amount_k",
+        )
+        if category_flows.empty:
+            st.caption("區間內 Watchlist 無成交紀錄")
+        else:
+            category_flows["分類"] = category_flows["分類"].map(
+                lambda cat: f"{get_category_emoji(cat)} {cat}".strip()
+            )
+            category_flows = category_flows.sort_values("total", ascending=False)
+            category_flows.columns = ["分類", "區間淨買賣超(千)", "最新一日(千)", "連買天數", "連賣天數"]
+            st.dataframe(category_flows, use_container_width=True, hide_index=True)
+
+
 # --- 8. 個股分析 (同頁下方) ---
 st.markdown("---")
 st.markdown("#### 📊 個股分析")
@@ -297,13 +373,15 @@ with header_col1:
 with header_col2:
     if in_watchlist:
         if st.button("🗑️ 從 Watchlist 移除", use_container_width=True, key="remove_btn"):
-            if remove_stock(stock_id):
-                st.cache_data.clear()
-                st.success(f"已移除 {stock_name}")
-                st.rerun()
+            try:
+                if watchlist_cache().remove(stock_id):
+                    st.success(f"已移除 {stock_name}")
+                    st.rerun()
+            except WatchlistConflict:
+                st.warning("Watchlist 正被其他人修改，請重試")
     else:
         with st.popover("➕ 加入 Watchlist", use_container_width=True):
-            categories = get_categories() or [
+            categories = watchlist_cache().categories() or [
                 "AI/高速傳輸", "車用/工控", "消費電子", "上游材料"
             ]
             new_category = st.selectbox(
@@ -314,13 +392,15 @@ with header_col2:
             )
             final_cat = custom_category.strip() or new_category
             if st.button("確認加入", key="confirm_add"):
-                if add_stock(stock_id, stock_name, final_cat):
-                    st.cache_data.clear()
-                    st.success(f"已將 {stock_name} 加入「{final_cat}」")
-                    st.rerun()
+                try:
+                    added = watchlist_cache().add(stock_id, stock_name, final_cat)
+                except WatchlistConflict:
+                    st.warning("Watchlist 正被其他人修改，請重試")
                 else:
-                    st.warning("已存在，已更新分類")
-                    st.cache_data.clear()
+                    if added:
+                        st.success(f"已將 {stock_name} 加入「{final_cat}」")
+                    else:
+                        st.warning("已存在，已更新分類")
                     st.rerun()
 
 
@@ -328,24 +408,18 @@ if selected_days_count < 30:
     chart_start_date = end_date - timedelta(days=29)
 else:
     chart_start_date = start_date
+# 長區間改用週 / 月彙總，掃描的列數少一個數量級
+chart_freq = rollup_freq((end_date - chart_start_date).days)
 
-mask_chart = (
-    (df_raw["代號"] == stock_id)
-    & (df_raw["日期"].dt.date >= chart_start_date)
-    & (df_raw["日期"].dt.date <= end_date)
+df_chart = load_chart_series(
+    data.version, stock_id, chart_start_date, end_date, chart_freq, history, data.value.rollups
 )
-df_chart = df_raw.loc[mask_chart].sort_values(by="日期").copy()
 
 if df_chart.empty:
     st.info("此區間無資料")
     st.stop()
 
-mask_stat = (
-    (df_raw["代號"] == stock_id)
-    & (df_raw["日期"].dt.date >= start_date)
-    & (df_raw["日期"].dt.date <= end_date)
-)
-df_stat = df_raw.loc[mask_stat]
+df_stat = history.stock_range(stock_id, start_date, end_date)
 
 total_amt = df_stat["買賣超金額(千)"].sum()
 total_sheets = df_stat["估算張數"].sum()
@@ -373,52 +447,7 @@ with col_m2:
 with col_m3:
     st.metric("收盤價", f"{current_price}")
 
-df_chart["累積張數"] = df_chart["估算張數"].cumsum()
-df_chart["顏色"] = df_chart["估算張數"].apply(
-    lambda x: "#E67F75" if x > 0 else "#6CB097"
-)
-
-fig = make_subplots(specs=[[{"secondary_y": True}]])
-fig.add_trace(
-    go.Bar(
-        x=df_chart["日期"],
-        y=df_chart["估算張數"],
-        name="每日",
-        marker_color=df_chart["顏色"],
-        opacity=0.8,
-    ),
-    secondary_y=False,
-)
-fig.add_trace(
-    go.Scatter(
-        x=df_chart["日期"],
-        y=df_chart["累積張數"],
-        name="庫存",
-        line=dict(color="#2C3E50", width=2),
-        mode="lines",
-    ),
-    secondary_y=True,
-)
-
-fig.update_layout(
-    title=dict(text="籌碼分佈趨勢", font=dict(color="#333333", size=16)),
-    plot_bgcolor="#FFFFFF",
-    paper_bgcolor="#FFFFFF",
-    font=dict(color="#333333"),
-    legend=dict(orientation="h", y=1.1, x=0, font=dict(color="#333333")),
-    height=350,
-    margin=dict(l=15, r=15, t=50, b=10),
-    xaxis=dict(
-        showgrid=False,
-        tickfont=dict(color="#333333", size=12),
-        title_font=dict(color="#333333"),
-    ),
-    yaxis=dict(
-        showgrid=True,
-        gridcolor="#F0F0F0",
-        tickfont=dict(color="#333333", size=12),
-    ),
-)
+fig = load_flow_figure(data.version, stock_id, chart_start_date, end_date, chart_freq, df_chart)
 
 st.plotly_chart(
     fig,
@@ -427,8 +456,12 @@ st.plotly_chart(
 )
 
 with st.expander("📄 詳細數據"):
+    # 圖表改畫週 / 月彙總時，明細仍列逐日資料
+    df_detail = df_chart if chart_freq is None else load_chart_series(
+        data.version, stock_id, chart_start_date, end_date, None, history, data.value.rollups
+    )
     st.dataframe(
-        df_chart[["日期", "收盤價", "估算張數", "累積張數"]],
+        df_detail[["日期", "收盤價", "估算張數", "累積張數"]],
         use_container_width=True,
         hide_index=True,
     )
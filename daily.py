@@ -0,0 +1,280 @@
+"""每日排程 pipeline — 爬蟲、股價、寫 Sheet、快照、LINE 通知在同一個 process 跑完。
+
+    python -m daily                  # 排程用
+    python -m daily --with-histock   # 通知完成後另跑 HiStock 成本修正 (儀表板快照排在修正之後)
+    python -m daily --skip-notify    # 只更新資料
+    python -m daily --deadline 19:55 # 趕時限：依即時耗時估計降級，確保通知準時送出
+
+settings.BROKERS 的各分點並行爬取 (共用富邦限速)，預設分點寫入主分頁並發通知，
+其他分點寫入各自的「分點_<代號>」分頁；各分點當日的列另併入 Parquet 歷史檔 (HISTORY_DIR)：
+runner 每次都是全新的，先從 Drive 取回既有歷史檔、併入當日的列後再上傳 (lib/drive_store.py)。
+寫完第一頁後另預建儀表板快照 (APP_ARTIFACT_DIR) 並上傳 Drive，app.py 啟動時取回直接載入。
+stage 之間直接以記憶體交接 DataFrame；互不依賴的 stage (例如爬蟲與讀 Watchlist、
+寫快照與發通知) 會併行執行，結束時列出各 stage 耗時。
+
+給了 --deadline 時，股價與通知兩個 stage 開始前會依剩餘時間與各 stage 耗時估計
+(上次實測值，執行中即時更新) 選擇模式：股價依序降級為「只補查 watchlist」、
+「只查 watchlist、其餘用快取價」；通知降級為略過排行 / 異常 / 分類區塊，並在訊息標示部分內容。
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import time
+
+import pandas as pd
+
+import main as crawler
+import notify
+import update_history
+from lib.dashboard import DashboardData, publish_artifact, write_artifact
+from lib.deadline import DeadlinePlanner, load_estimates, parse_deadline
+from lib.drive_store import fetch_directory, publish_directory
+from lib.history_store import write_history
+from lib.logger import get_logger
+from lib.pipeline import Pipeline, PipelineStop, Stage, StageResult, log_timings
+from lib.repair_queue import enqueue_missing
+from lib.sheet import refresh_dataframe
+from lib.snapshot import Snapshot
+from lib.watchlist import load_watchlist
+from settings import BROKER_ID, DRIVE_HISTORY_FILE, HISTORY_DIR, PRICE_STAGE_BUDGET
+
+log = get_logger(__name__)
+
+# 自行記錄「stage:模式」耗時的 stage (其餘由 on_stage_done 以 stage 名稱記錄)
+_MODED_STAGES = {"prices", "notify"}
+_PARTIAL_PRICE_NOTES = {
+    "watchlist": "非 watchlist 股票未逐檔補查股價",
+    "cached": "非 watchlist 股票使用快取股價",
+}
+
+
+def _target_date():
+    target_date = crawler.check_and_get_date()
+    if target_date is None:
+        raise PipelineStop("週末不開盤")
+    log.info(f"📅 目標日期: {target_date}")
+    return {"target_date": target_date}
+
+
+def _crawl(target_date):
+    stock_lists = crawler.crawl_all_brokers(target_date)
+    stock_list = crawler.unique_stocks(stock_lists)
+    if not stock_list:
+        raise PipelineStop("富邦無資料")
+    return {"stock_lists": stock_lists, "stock_list": stock_list}
+
+
+def _watchlist(target_date):
+    try:
+        watchlist = load_watchlist()
+    except Exception as e:  # gspread 例外類型多樣；notify 會再自行讀取
+        log.warning(f"⚠️ 讀取 Watchlist 失敗: {e}")
+        watchlist = None
+    return {"watchlist": watchlist}
+
+
+def _prices(stock_list, target_date, watchlist, planner):
+    downstream = ["rows", "sheet_write", "notify:full"]
+    mode = planner.choose(
+        "股價查詢", [(m, [f"prices:{m}", *downstream]) for m in crawler.PRICE_MODES]
+    )
+    started = time.perf_counter()
+    market, skipped = crawler.resolve_prices(
+        stock_list,
+        target_date,
+        mode=mode,
+        watchlist_ids=set(watchlist or {}),
+        budget_seconds=min(PRICE_STAGE_BUDGET, planner.budget(downstream)),
+    )
+    planner.record(f"prices:{mode}", time.perf_counter() - started)
+    return {"market": market, "price_skipped": skipped, "price_mode": mode}
+
+
+def _rows(stock_lists, market, target_date):
+    broker_rows = {
+        broker: crawler.build_rows(stock_list, market, target_date, broker)
+        for broker, stock_list in stock_lists.items()
+    }
+    rows = broker_rows.get(BROKER_ID, [])
+    log.info(f"✅ 分析完成，共 {sum(map(len, broker_rows.values()))} 筆 ({len(broker_rows)} 個分點)。")
+    return {"rows": rows, "rows_df": crawler.rows_frame(rows), "broker_rows": broker_rows}
+
+
+def _sheet_read(target_date):
+    existing = crawler.read_existing_sheet()
+    if existing is None:
+        raise RuntimeError("Sheet 連線失敗")
+    sheet, all_values = existing
+    return {"sheet": sheet, "existing_rows": all_values}
+
+
+def _sheet_write(sheet, existing_rows, rows, target_date):
+    return {"prev_date": crawler.write_sheet_overwrite(sheet, existing_rows, rows, target_date)}
+
+
+def _broker_writes(broker_rows, target_date):
+    failed = crawler.write_other_brokers(broker_rows, target_date)
+    if failed:
+        raise RuntimeError(f"分點分頁寫入失敗: {', '.join(failed)}")
+
+
+def _history_files(broker_rows, prev_date):
+    frames = [crawler.rows_frame(rows) for rows in broker_rows.values() if rows]
+    if not frames:
+        return
+    # 取回失敗時 raise (不上傳只有當日資料的歷史檔蓋掉遠端)
+    fetch_directory(HISTORY_DIR, DRIVE_HISTORY_FILE)
+    write_history(pd.concat(frames, ignore_index=True), HISTORY_DIR)
+    publish_directory(HISTORY_DIR, DRIVE_HISTORY_FILE)
+
+
+def _dashboard_artifact(prev_date):
+    # 重新讀取寫入後的第一頁 (含修訂標記)，app 啟動時直接載入，不必再下載 / 建索引；
+    # runner 用完即丟，寫好後上傳 Drive 給 app 取回
+    publish_artifact(write_artifact(DashboardData.build(refresh_dataframe(None))))
+
+
+def _price_records(market, price_skipped, target_date, prev_date):
+    enqueue_missing(target_date, price_skipped)
+    crawler.remember_prices(market, price_skipped, target_date)
+
+
+def _snapshot(rows_df, market, target_date, prev_date, watchlist):
+    crawler.save_snapshot(rows_df, market, target_date, prev_date, watchlist)
+
+
+def _notify(rows_df, market, target_date, prev_date, watchlist, price_mode, planner):
+    mode = planner.choose("通知", [("full", ["notify:full"]), ("minimal", ["notify:minimal"])])
+    partial_reasons = [_PARTIAL_PRICE_NOTES[price_mode]] if price_mode in _PARTIAL_PRICE_NOTES else []
+    snapshot = Snapshot(
+        date=pd.Timestamp(target_date),
+        prev_date=prev_date,
+        created_at=datetime.datetime.now(),
+        rows=rows_df,
+        market=market,
+        watchlist=watchlist,
+    )
+    started = time.perf_counter()
+    notify.send_line_notify(
+        snapshot=snapshot,
+        skip_blocks=mode == "minimal",
+        partial_reasons=partial_reasons,
+    )
+    planner.record(f"notify:{mode}", time.perf_counter() - started)
+
+
+def _histock(prev_date):
+    update_history.main()
+
+
+def build_pipeline(with_histock: bool = False, skip_notify: bool = False) -> Pipeline:
+    stages = [
+        Stage("target_date", _target_date, outputs=("target_date",)),
+        # 各分點並行爬取；股價只對合併後的股票查一次
+        Stage("crawl", _crawl, inputs=("target_date",), outputs=("stock_lists", "stock_list")),
+        # 依賴 target_date 只是為了週末不開盤時不必連線
+        Stage("watchlist", _watchlist, inputs=("target_date",), outputs=("watchlist",)),
+        Stage(
+            "prices",
+            _prices,
+            inputs=("stock_list", "target_date", "watchlist", "planner"),
+            outputs=("market", "price_skipped", "price_mode"),
+        ),
+        Stage(
+            "rows",
+            _rows,
+            inputs=("stock_lists", "market", "target_date"),
+            outputs=("rows", "rows_df", "broker_rows"),
+        ),
+        # Sheet 授權與讀取與爬蟲 / 股價查詢併行
+        Stage("sheet_read", _sheet_read, inputs=("target_date",), outputs=("sheet", "existing_rows")),
+        Stage(
+            "sheet_write",
+            _sheet_write,
+            inputs=("sheet", "existing_rows", "rows", "target_date"),
+            outputs=("prev_date",),
+        ),
+        # 其他分點寫入各自的分頁，與預設分點的寫入 / 通知併行
+        Stage("broker_writes", _broker_writes, inputs=("broker_rows", "target_date"), optional=True),
+        # 寫完 Sheet 後把各分點當日的列併入 Parquet 歷史檔並上傳 Drive (跨分點比較頁查詢用)
+        Stage("history_files", _history_files, inputs=("broker_rows", "prev_date"), optional=True),
+        # 預建儀表板快照 (資料 + 索引 + 彙總)，與通知併行；有 HiStock 修正時等修正完再讀，快照才含修正後的成本
+        Stage(
+            "dashboard_artifact",
+            _dashboard_artifact,
+            inputs=("prev_date",),
+            optional=True,
+            after=("histock",),
+        ),
+        # 查無 / 快取股價的列寫入 Sheet 後才記進補修佇列，並更新股價快取
+        Stage(
+            "price_records",
+            _price_records,
+            inputs=("market", "price_skipped", "target_date", "prev_date"),
+            optional=True,
+        ),
+        Stage(
+            "snapshot",
+            _snapshot,
+            inputs=("rows_df", "market", "target_date", "prev_date", "watchlist"),
+            optional=True,
+        ),
+    ]
+    if not skip_notify:
+        stages.append(
+            Stage(
+                "notify",
+                _notify,
+                inputs=(
+                    "rows_df", "market", "target_date", "prev_date", "watchlist",
+                    "price_mode", "planner",
+                ),
+            )
+        )
+    if with_histock:
+        # HiStock 修正會改寫第一頁：等通知讀完 Sheet 再開始 (通知失敗也照常修正)
+        stages.append(
+            Stage("histock", _histock, inputs=("prev_date",), optional=True, after=("notify",))
+        )
+    return Pipeline(stages, provided=("planner",))
+
+
+def run(
+    with_histock: bool = False,
+    skip_notify: bool = False,
+    deadline: datetime.datetime | None = None,
+) -> bool:
+    planner = DeadlinePlanner(deadline, load_estimates())
+    if planner.enabled:
+        log.info(f"⏳ 期限 {deadline:%H:%M}，剩餘 {planner.remaining():.0f}s。")
+
+    def on_stage_done(stage_result: StageResult) -> None:
+        if stage_result.status == "ok" and stage_result.name not in _MODED_STAGES:
+            planner.record(stage_result.name, stage_result.seconds)
+
+    result = build_pipeline(with_histock, skip_notify).run(
+        {"planner": planner}, on_stage_done=on_stage_done
+    )
+    log_timings(result)
+    if planner.enabled and planner.decisions:
+        log.info(f"⏳ 降級決策: {planner.decisions}")
+    try:
+        planner.save()
+    except OSError as e:
+        log.warning(f"⚠️ stage 耗時檔寫入失敗: {e}")
+    return result.ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="每日爬蟲 + 通知 pipeline")
+    parser.add_argument("--with-histock", action="store_true", help="寫完 Sheet 後執行 HiStock 成本修正")
+    parser.add_argument("--skip-notify", action="store_true", help="不發送 LINE 通知")
+    parser.add_argument(
+        "--deadline",
+        type=parse_deadline,
+        help="通知最晚送出時間 (HH:MM 台灣時間，或 ISO 日期時間)；趕不及時自動降級",
+    )
+    args = parser.parse_args()
+    if not run(args.with_histock, args.skip_notify, args.deadline):
+        raise SystemExit(1)
@@ -4,22 +4,23 @@ from __future__ import annotations
 import datetime
 import time
 from datetime import timedelta
+from functools import partial
 
 import requests
 import urllib3
 import yfinance as yf
 
+from lib.brokers import fubon_url
 from lib.logger import get_logger
 from lib.parsers import parse_fubon_html
-from lib.sheet import SheetNotReady, open_sheet
+from lib.prices import CircuitBreaker, PriceResolver
+from lib.repair_queue import enqueue_missing
+from lib.sheet import APPEND, SheetNotReady, bump_revision, open_sheet
+from settings import BROKER_ID, PRICE_CALL_TIMEOUT
 
 log = get_logger(__name__)
 
-BASE_URL = (
-    "https://fubon-ebrokerdj.fbs.com.tw/z/zg/zgb/zgb0.djhtm"
-    "?a=9A00&b=0039004100390031&c=B"
-)
-HEADER_ROW = ["日期", "代號", "名稱", "買賣別", "買賣超金額(千)", "收盤價", "估算張數"]
+HEADER_ROW = ["日期", "代號", "名稱", "買賣別", "買賣超金額(千)", "收盤價", "估算張數", "分點"]
 DAYS_TO_CRAWL = 30
 REQUEST_SLEEP = 3
 
@@ -27,53 +28,70 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 
 def get_historical_price(stock_id: str, date_str: str) -> float | None:
-    """查詢指定日期的收盤價，依序嘗試 .TW / .TWO。"""
+    """查詢指定日期的收盤價，依序嘗試 .TW / .TWO。查無回傳 None，兩者皆出錯時 raise。"""
     try:
         date_obj = datetime.datetime.strptime(date_str, "%Y-%m-%d").date()
         next_day_str = (date_obj + timedelta(days=1)).strftime("%Y-%m-%d")
     except ValueError:
         return None
 
+    error: Exception | None = None
     for suffix in (".TW", ".TWO"):
         ticker = f"{stock_id}{suffix}"
         try:
             data = yf.download(
-                ticker, start=date_str, end=next_day_str, progress=False
+                ticker,
+                start=date_str,
+                end=next_day_str,
+                progress=False,
+                timeout=PRICE_CALL_TIMEOUT,
             )
         except Exception as e:  # yfinance 內部例外類型多變
             log.debug(f"   yfinance {ticker} 失敗: {e}")
+            error = e
             continue
         if not data.empty:
             price = data["Close"].iloc[0]
             return float(price) if not isinstance(price, list) else float(price[0])
+        error = None
+    if error is not None:
+        raise error
     return None
 
 
-def _fetch_day(date_str: str) -> list[list]:
-    """抓取單一日期的分點買賣超資料"""
-    target_url = f"{BASE_URL}&e={date_str}&f={date_str}"
+def _fetch_day(
+    date_str: str, breaker: CircuitBreaker | None = None
+) -> tuple[list[list], dict[str, str]]:
+    """抓取單一日期的分點買賣超資料，回傳 (列, 查無股價的 stock_id → 原因)。
+
+    breaker 跨日共用，yfinance 持續異常時後續日期直接略過查價。
+    """
+    target_url = fubon_url(BROKER_ID, date_str)
     headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
 
     try:
         response = requests.get(target_url, headers=headers, verify=False, timeout=15)
     except requests.RequestException as e:
         log.error(f"   ❌ 富邦請求失敗: {e}")
-        return []
+        return [], {}
 
     response.encoding = "cp950"
     stocks = parse_fubon_html(response.text)
     if not stocks:
         log.warning("   ⚠️  該日期無資料 (可能是國定假日或颱風假)。")
-        return []
+        return [], {}
 
     log.info(f"   🔍 找到 {len(stocks)} 筆分點資料，開始查歷史股價...")
+    resolver = PriceResolver(partial(get_historical_price, date_str=date_str), breaker=breaker)
+    resolution = resolver.resolve(s["id"] for s in stocks)
+    prices = resolution.prices
 
     daily_data: list[list] = []
     for s in stocks:
         stock_id = s["id"]
         net_amt = s["net_amt"]
         status = "買超" if net_amt > 0 else ("賣超" if net_amt < 0 else "平")
-        price = get_historical_price(stock_id, date_str)
+        price = prices.get(stock_id)
         estimated_sheets = int(round(net_amt / price)) if price and price > 0 else "N/A"
         daily_data.append(
             [
@@ -84,9 +102,10 @@ def _fetch_day(date_str: str) -> list[list]:
                 net_amt,
                 price if price else "查無",
                 estimated_sheets,
+                BROKER_ID,
             ]
         )
-    return daily_data
+    return daily_data, resolution.skipped
 
 
 def crawl_history() -> None:
@@ -96,10 +115,14 @@ def crawl_history() -> None:
         log.error(f"❌ Sheet 連線失敗: {e}")
         return
 
-    if len(sheet.get_all_values()) == 0:
+    existing_rows = len(sheet.get_all_values())
+    if existing_rows == 0:
         sheet.append_row(HEADER_ROW)
+        existing_rows = 1
+    appended = 0
 
     today = datetime.date.today()
+    breaker = CircuitBreaker()
     log.info(f"🚀 啟動歷史爬蟲：預計爬取過去 {DAYS_TO_CRAWL} 天資料...")
     log.info("-" * 50)
 
@@ -113,14 +136,18 @@ def crawl_history() -> None:
             continue
 
         log.info(f"[{date_str}] 正在處理中...")
-        daily_data = _fetch_day(date_str)
+        daily_data, skipped = _fetch_day(date_str, breaker)
         if daily_data:
             sheet.append_rows(daily_data)
+            appended += len(daily_data)
             log.info(f"   ✅ 已寫入 {len(daily_data)} 筆資料。")
+            enqueue_missing(date_str, skipped)
 
         log.info(f"   💤 休息 {REQUEST_SLEEP} 秒後繼續...")
         time.sleep(REQUEST_SLEEP)
 
+    if appended:
+        bump_revision(sheet, APPEND, existing_rows - 1)
     log.info("🎉 歷史資料補完計畫執行完畢！")
 
 
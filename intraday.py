@@ -0,0 +1,134 @@
+"""盤中輪詢 — 交易時段內定期重抓富邦分點頁，只推播新命中的條件告警。
+
+    python -m intraday                 # 盤中每 INTRADAY_POLL_INTERVAL 秒輪詢，收盤後結束
+    python -m intraday --once          # 只輪詢一次 (交給外部排程)
+    python -m intraday --dry-run       # 只印出訊息，不推播
+
+每次輪詢把解析出的列與上一次比對 (lib/intraday.py)，只對數字有變動的 watchlist 股票
+查價、跑 condition 規則；連續天數以上一交易日的增量告警狀態 (.alert_state.json) 推估，
+不讀 Sheet 歷史、也不寫 Sheet (收盤後仍由每日 pipeline 寫入)。
+排行 / 異常 / 分類規則需要完整的當日資料，不在盤中評估。
+"""
+from __future__ import annotations
+
+import argparse
+import datetime
+import time
+from zoneinfo import ZoneInfo
+
+import main as crawler
+import notify
+from lib.alert_state import AlertState, load_state
+from lib.alerts import AlertHit, history_window, load_alerts
+from lib.intraday import IntradayState, in_trading_hours, project_streaks
+from lib.logger import get_logger
+from lib.watchlist import load_watchlist
+from settings import BROKER_ID, DEADLINE_TZ, INTRADAY_POLL_INTERVAL, PRICE_STAGE_BUDGET
+
+log = get_logger(__name__)
+
+
+def _base_streaks(alert_state: AlertState | None, stock_id: str, date_str: str) -> tuple[int, int]:
+    """上一交易日結束時的 (連買, 連賣)；每日通知已套用今日時改用套用前的天數"""
+    if alert_state is None:
+        return 0, 0
+    stock = alert_state.stocks.get(stock_id)
+    if stock is None:
+        return 0, 0
+    return stock.prev_streaks if alert_state.last_date == date_str else stock.streaks
+
+
+def poll_once(
+    state: IntradayState,
+    watchlist: dict,
+    alert_rules: list[dict],
+    alert_state: AlertState | None = None,
+    broker: str = BROKER_ID,
+    budget_seconds: float = PRICE_STAGE_BUDGET,
+) -> list[AlertHit]:
+    """輪詢一次，回傳本次新命中 (今天尚未推播過) 的告警。
+
+    沒有新命中的股票跑完告警即 commit 摘要；有新命中的等呼叫端推播成功後 mark_notified，
+    查無股價的股票不跑告警也不 commit，下次輪詢重試。
+    """
+    stocks = crawler.get_today_stock_list_from_fubon(state.date, broker)
+    changed = []
+    for stock in state.diff(stocks):
+        if stock["id"] in watchlist:
+            changed.append(stock)
+        else:
+            state.commit([stock["id"]])  # 盤中不處理 watchlist 以外的股票
+    if not changed:
+        log.info("💤 watchlist 股票無變動。")
+        return []
+
+    log.info(f"🔄 {len(changed)} 檔 watchlist 股票有變動，查價並跑告警...")
+    market, skipped = crawler.resolve_prices(changed, state.date, budget_seconds=budget_seconds)
+    priced = [s for s in changed if s["id"] in market.index and s["id"] not in skipped]
+    if len(priced) < len(changed):
+        log.info(f"⏩ {len(changed) - len(priced)} 檔查無股價，下次輪詢重試。")
+    if not priced:
+        return []
+    rows_df = crawler.rows_frame(crawler.build_rows(priced, market, state.date, broker))
+    streaks = {
+        sid: project_streaks(_base_streaks(alert_state, sid, state.date), sheets)
+        for sid, sheets in zip(rows_df["代號"], rows_df["估算張數"], strict=True)
+    }
+    hits = state.new_hits(
+        notify.evaluate_intraday(rows_df, market, state.date, watchlist, alert_rules, streaks=streaks)
+    )
+    hit_ids = {hit.stock_id for hit in hits}
+    state.commit(s["id"] for s in priced if s["id"] not in hit_ids)
+    return hits
+
+
+def run(interval: float = INTRADAY_POLL_INTERVAL, once: bool = False, dry_run: bool = False) -> None:
+    tz = ZoneInfo(DEADLINE_TZ)
+    now = datetime.datetime.now(tz)
+    if not once and not in_trading_hours(now):
+        log.info("🌙 非盤中時段，不輪詢。")
+        return
+
+    watchlist = load_watchlist()
+    if not watchlist:
+        log.warning("⚠️ Watchlist 為空，不輪詢。")
+        return
+    rules = load_alerts()
+    alert_rules = [rule for rule in rules if rule.get("kind") == "condition"]
+    alert_state = load_state(history_window(rules))
+    state = IntradayState.load(now.strftime("%Y-%m-%d"))
+
+    while True:
+        started = time.monotonic()
+        hits = poll_once(
+            state,
+            watchlist,
+            alert_rules,
+            alert_state,
+            budget_seconds=min(PRICE_STAGE_BUDGET, interval / 2),
+        )
+        message = notify.build_intraday_message(datetime.datetime.now(tz), hits)
+        if message:
+            log.info(f"🔔 {len(hits)} 筆新命中。")
+            if dry_run:
+                log.info(f"🧪 dry-run，不推播：\n{message}")
+                state.mark_notified(hits)
+            elif notify.push_line_message(message):
+                state.mark_notified(hits)
+        state.save()
+
+        if once or not in_trading_hours():
+            break
+        time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    log.info("✅ 盤中輪詢結束。")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="盤中輪詢富邦分點，推播新命中的告警")
+    parser.add_argument(
+        "--interval", type=float, default=INTRADAY_POLL_INTERVAL, help="輪詢間隔 (秒)"
+    )
+    parser.add_argument("--once", action="store_true", help="只輪詢一次")
+    parser.add_argument("--dry-run", action="store_true", help="只印出訊息，不推播")
+    args = parser.parse_args()
+    run(args.interval, args.once, args.dry_run)
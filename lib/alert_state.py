@@ -0,0 +1,280 @@
+"""每日告警增量狀態 — 連續買賣超天數 + 排行視窗 ring buffer。
+
+notify 每天只多一個交易日，狀態只需套用當日出現的股票 (O(當日檔數))，
+不必每次從整份歷史重算連續天數與排行視窗。
+狀態檔記下同步時 Sheet 的修訂標記 (Meta 分頁)；之後若有附加以外的寫入 (改寫歷史、補資料)
+或錯過多次寫入，增量結果可能已與歷史不符，load_or_rebuild 會改以完整歷史重建。
+verify_state() 可與全量重算逐項比對，確認兩者輸出一致。
+"""
+from __future__ import annotations
+
+import json
+from collections import deque
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pandas as pd
+
+from lib.alerts import _compute_consecutive_days, evaluate_rankings
+from lib.history_index import HistoryIndex
+from lib.logger import get_logger
+from lib.sheet import APPEND, SheetRevision
+from settings import ALERT_STATE_FILE
+
+log = get_logger(__name__)
+
+STATE_VERSION = 1
+
+_SHEETS_COL = "估算張數"
+_AMOUNT_COL = "買賣超金額(千)"
+
+
+@dataclass
+class StockState:
+    """單檔狀態。entries 為視窗內每日 [date, name, net_sheets, net_amount_k]。"""
+    buy_streak: int = 0
+    sell_streak: int = 0
+    # 套用最後一日之前的連續天數；同一日重跑時用來回滾
+    prev_streaks: tuple[int, int] = (0, 0)
+    entries: list[list] = field(default_factory=list)
+
+    @property
+    def streaks(self) -> tuple[int, int]:
+        return self.buy_streak, self.sell_streak
+
+
+class AlertState:
+    """跨日累積的告警狀態。window 為 ring buffer 保留的交易日數。"""
+
+    def __init__(self, window: int) -> None:
+        self.window = max(1, int(window))
+        self.dates: deque[str] = deque(maxlen=self.window)
+        self.stocks: dict[str, StockState] = {}
+        self.touched: list[str] = []  # 最後一日有套用到的股票
+        self.revision: int | None = None  # 上次同步時 Sheet 的修訂編號 (未知為 None)
+
+    @property
+    def last_date(self) -> str | None:
+        return self.dates[-1] if self.dates else None
+
+    def streaks(self, stock_id: str) -> tuple[int, int]:
+        stock = self.stocks.get(str(stock_id))
+        return stock.streaks if stock else (0, 0)
+
+    def outdated_by(self, revision: SheetRevision | None) -> bool:
+        """上次同步後 Sheet 是否有附加以外的寫入 (或中間錯過多次寫入)。
+
+        revision 未知 (無 Meta 分頁) 時無從判斷，沿用日期檢查；狀態檔沒有記錄修訂編號則保守視為過期。
+        """
+        if revision is None or revision.revision == self.revision:
+            return False
+        if self.revision is None:
+            return True
+        return not (revision.revision == self.revision + 1 and revision.kind == APPEND)
+
+    # ---- 更新 ----
+
+    def _rollback_last_day(self) -> None:
+        """撤銷最後一日的套用結果 (同日重跑前呼叫)"""
+        last = self.last_date
+        for stock_id in self.touched:
+            stock = self.stocks[stock_id]
+            stock.buy_streak, stock.sell_streak = stock.prev_streaks
+            stock.entries = [e for e in stock.entries if e[0] != last]
+        self.touched = []
+
+    def apply_day(self, daily_df: pd.DataFrame, date: pd.Timestamp | str) -> None:
+        """套用單一交易日的資料。日期須遞增；與最後一日相同時視為重跑，先回滾再套用。"""
+        date_str = pd.Timestamp(date).strftime("%Y-%m-%d")
+        last = self.last_date
+        if last is not None and date_str < last:
+            raise ValueError(f"日期倒退: {date_str} < {last}")
+
+        if date_str == last:
+            self._rollback_last_day()
+        else:
+            self.dates.append(date_str)
+            self.touched = []
+        oldest = self.dates[0]
+
+        touched: set[str] = set()
+        for stock_id, name, sheets, amount in zip(
+            daily_df["代號"].astype(str),
+            daily_df["名稱"],
+            daily_df[_SHEETS_COL].tolist(),
+            daily_df[_AMOUNT_COL].tolist(),
+            strict=True,
+        ):
+            stock = self.stocks.setdefault(stock_id, StockState())
+            if stock_id not in touched:
+                touched.add(stock_id)
+                self.touched.append(stock_id)
+                stock.prev_streaks = stock.streaks
+                stock.entries = [e for e in stock.entries if e[0] >= oldest]
+
+            value = sheets or 0
+            stock.buy_streak = stock.buy_streak + 1 if value > 0 else 0
+            stock.sell_streak = stock.sell_streak + 1 if value < 0 else 0
+            stock.entries.append([date_str, str(name), sheets, amount])
+
+    def sync(self, df_full: pd.DataFrame, target_date: pd.Timestamp) -> bool:
+        """把 df_full 中 last_date ~ target_date 的交易日依序套用。
+
+        df_full 未涵蓋 last_date (中間有缺口) 或 target_date 早於 last_date 時回傳 False，
+        代表需要以完整歷史 rebuild。
+        """
+        target_str = pd.Timestamp(target_date).strftime("%Y-%m-%d")
+        last = self.last_date
+        if last is None or target_str < last:
+            return False
+
+        dates = df_full["日期"]
+        in_range = df_full[(dates >= pd.Timestamp(last)) & (dates <= pd.Timestamp(target_str))]
+        if in_range.empty or in_range["日期"].min() != pd.Timestamp(last):
+            return False
+
+        for date, daily_df in in_range.groupby("日期", sort=True):
+            self.apply_day(daily_df, date)
+        return True
+
+    @classmethod
+    def rebuild(
+        cls, df_full: pd.DataFrame, target_date: pd.Timestamp, window: int
+    ) -> AlertState:
+        """從完整歷史 (截至 target_date) 重建狀態"""
+        state = cls(window)
+        history = df_full[df_full["日期"] <= pd.Timestamp(target_date)]
+        for date, daily_df in history.groupby("日期", sort=True):
+            state.apply_day(daily_df, date)
+        return state
+
+    # ---- 讀取 ----
+
+    def window_frame(self) -> pd.DataFrame:
+        """視窗內資料還原成與 Sheet 相同欄位的 DataFrame，可直接餵給排行計算"""
+        kept = set(self.dates)
+        records = [
+            {
+                "日期": pd.Timestamp(date),
+                "代號": stock_id,
+                "名稱": name,
+                _SHEETS_COL: sheets,
+                _AMOUNT_COL: amount,
+            }
+            for stock_id, stock in self.stocks.items()
+            for date, name, sheets, amount in stock.entries
+            if date in kept
+        ]
+        columns = ["日期", "代號", "名稱", _SHEETS_COL, _AMOUNT_COL]
+        return pd.DataFrame(records, columns=columns)
+
+    # ---- 持久化 ----
+
+    def to_dict(self) -> dict:
+        kept = set(self.dates)
+        return {
+            "version": STATE_VERSION,
+            "window": self.window,
+            "dates": list(self.dates),
+            "touched": list(self.touched),
+            "revision": self.revision,
+            "stocks": {
+                stock_id: {
+                    "buy": stock.buy_streak,
+                    "sell": stock.sell_streak,
+                    "prev": list(stock.prev_streaks),
+                    "entries": [e for e in stock.entries if e[0] in kept],
+                }
+                for stock_id, stock in self.stocks.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> AlertState:
+        state = cls(int(data.get("window", 1)))
+        state.dates.extend(data.get("dates", []))
+        state.touched = list(data.get("touched", []))
+        revision = data.get("revision")
+        state.revision = int(revision) if revision is not None else None
+        for stock_id, raw in (data.get("stocks") or {}).items():
+            state.stocks[stock_id] = StockState(
+                buy_streak=int(raw.get("buy", 0)),
+                sell_streak=int(raw.get("sell", 0)),
+                prev_streaks=tuple(raw.get("prev", (0, 0))),
+                entries=[list(e) for e in raw.get("entries", [])],
+            )
+        return state
+
+    def save(self, path: Path = ALERT_STATE_FILE) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False)
+
+
+def load_state(window: int, path: Path = ALERT_STATE_FILE) -> AlertState | None:
+    """讀取狀態檔。不存在、格式不符或視窗比需求小時回傳 None (需 rebuild)。"""
+    if not path.exists():
+        return None
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        log.warning(f"⚠️ 告警狀態檔讀取失敗，將重建: {e}")
+        return None
+    if data.get("version") != STATE_VERSION or int(data.get("window", 0)) < window:
+        return None
+    return AlertState.from_dict(data)
+
+
+def load_or_rebuild(
+    df_full: pd.DataFrame,
+    target_date: pd.Timestamp,
+    window: int,
+    path: Path = ALERT_STATE_FILE,
+    load_full: Callable[[], pd.DataFrame | None] | None = None,
+    revision: SheetRevision | None = None,
+) -> AlertState:
+    """讀取並增量同步到 target_date；無法同步或 Sheet 在上次同步後被改寫時重建。
+
+    df_full 可以只是最近幾個交易日；重建需要完整歷史時由 load_full 另外載入
+    (未提供則直接用 df_full)。revision 為 Sheet 目前的修訂標記，會記入回傳的狀態。
+    """
+    state = load_state(window, path)
+    if state is not None and state.outdated_by(revision):
+        log.info("ℹ️ Sheet 於上次同步後有附加以外的寫入，增量狀態作廢。")
+        state = None
+    if state is None or not state.sync(df_full, target_date):
+        log.info("🔁 告警狀態需重建 (以完整歷史計算)...")
+        history = load_full() if load_full is not None else None
+        state = AlertState.rebuild(history if history is not None else df_full, target_date, window)
+    if revision is not None:
+        state.revision = revision.revision
+    return state
+
+
+def verify_state(
+    state: AlertState,
+    df_full: pd.DataFrame,
+    target_date: pd.Timestamp,
+    rules: list[dict],
+    stock_ids: Iterable[str] | None = None,
+) -> list[str]:
+    """比對增量狀態與全量重算的結果，回傳差異描述 (空 list 代表一致)"""
+    diffs: list[str] = []
+    history = HistoryIndex(df_full[df_full["日期"] <= pd.Timestamp(target_date)])
+    ids = history.stock_ids if stock_ids is None else [str(s) for s in stock_ids]
+    for stock_id in ids:
+        full = _compute_consecutive_days(history, stock_id, target_date)
+        incremental = state.streaks(stock_id)
+        if full != incremental:
+            diffs.append(f"連續天數 {stock_id}: 全量 {full} ≠ 增量 {incremental}")
+
+    full_rank = evaluate_rankings(df_full, target_date, rules)
+    incremental_rank = evaluate_rankings(state.window_frame(), target_date, rules)
+    for rule_name in sorted(set(full_rank) | set(incremental_rank)):
+        expected = full_rank.get(rule_name, {}).get("records")
+        actual = incremental_rank.get(rule_name, {}).get("records")
+        if expected != actual:
+            diffs.append(f"排行「{rule_name}」: 全量 {expected} ≠ 增量 {actual}")
+    return diffs
@@ -1,23 +1,22 @@
 """通知告警規則引擎 — 由 config/alerts.yaml 驅動"""
 from __future__ import annotations
 
+import ast
+from collections.abc import Callable, Iterable
 from dataclasses import dataclass, field
+from functools import lru_cache
+from graphlib import TopologicalSorter
 from pathlib import Path
+from typing import Any
 
 import pandas as pd
 import yaml
 
+from lib.history_index import HistoryIndex
+from lib.logger import get_logger
 from settings import ALERTS_FILE
 
-_ALLOWED_VARS = {
-    "net_sheets",
-    "net_amount_k",
-    "concentration",
-    "market_price",
-    "avg_cost",
-    "consecutive_buy_days",
-    "consecutive_sell_days",
-}
+log = get_logger(__name__)
 
 
 @dataclass
@@ -31,13 +30,26 @@ class AlertHit:
 
 
 def load_alerts(path: Path = ALERTS_FILE) -> list[dict]:
-    """讀取並過濾掉 disabled 規則"""
+    """讀取並過濾掉 disabled 規則。
+
+    condition 規則會先解析 when 表達式，引用未知變數時記 warning (該變數會被當成 0)。
+    """
     if not path.exists():
         return []
     with path.open("r", encoding="utf-8") as f:
         data = yaml.safe_load(f) or {}
     rules = data.get("alerts") or []
-    return [r for r in rules if r.get("enabled", True)]
+    enabled = [r for r in rules if r.get("enabled", True)]
+    for rule in enabled:
+        if rule.get("kind") != "condition":
+            continue
+        unknown = _expression_names(rule.get("when", "")) - _ALLOWED_VARS
+        if unknown:
+            log.warning(
+                f"⚠️ 規則「{rule.get('name', '未命名規則')}」引用未知變數: "
+                f"{', '.join(sorted(unknown))}"
+            )
+    return enabled
 
 
 def _safe_eval_condition(expr: str, variables: dict) -> bool:
@@ -54,20 +66,20 @@ def _safe_eval_condition(expr: str, variables: dict) -> bool:
 
 
 def _compute_consecutive_days(
-    df_full: pd.DataFrame,
+    df_full: pd.DataFrame | HistoryIndex,
     stock_id: str,
     target_date: pd.Timestamp,
 ) -> tuple[int, int]:
     """計算截至 target_date (含) 的連續買超 / 賣超日數"""
-    rows = df_full[
-        (df_full["代號"] == stock_id) & (df_full["日期"] <= target_date)
-    ].sort_values("日期", ascending=False)
+    rows = HistoryIndex.of(df_full).stock_range(stock_id, end=target_date)
+    if "估算張數" not in rows.columns:
+        return 0, 0
 
     buy_streak = 0
     sell_streak = 0
     first = True
-    for _, r in rows.iterrows():
-        sheets = r.get("估算張數", 0) or 0
+    for value in rows["估算張數"].to_numpy()[::-1]:
+        sheets = value or 0
         if first:
             if sheets > 0:
                 buy_streak = 1
@@ -86,66 +98,193 @@ def _compute_consecutive_days(
     return buy_streak, sell_streak
 
 
+@dataclass(frozen=True)
+class _MetricContext:
+    """單檔股票計算變數時共用的輸入"""
+    history: HistoryIndex
+    stock_id: str
+    target_date: pd.Timestamp
+    market_price: float
+    concentration: float
+    streaks: tuple[int, int] | None = None
+
+
+def _feature_today_row(ctx: _MetricContext, values: dict) -> pd.Series | None:
+    return ctx.history.row(ctx.stock_id, ctx.target_date)
+
+
+def _feature_streaks(ctx: _MetricContext, values: dict) -> tuple[int, int]:
+    if ctx.streaks is not None:
+        return ctx.streaks
+    return _compute_consecutive_days(ctx.history, ctx.stock_id, ctx.target_date)
+
+
+# 變數相依圖：name → (相依特徵, 計算函式)。
+# 底線開頭為中間特徵 (不開放給規則)；_today_row 為所有變數的共同前置，查無當日資料即停止。
+_FEATURES: dict[str, tuple[tuple[str, ...], Callable[[_MetricContext, dict], Any]]] = {
+    "_today_row": ((), _feature_today_row),
+    "_streaks": (("_today_row",), _feature_streaks),
+    "net_sheets": (
+        ("_today_row",),
+        lambda ctx, v: int(v["_today_row"].get("估算張數", 0) or 0),
+    ),
+    "net_amount_k": (
+        ("_today_row",),
+        lambda ctx, v: int(v["_today_row"].get("買賣超金額(千)", 0) or 0),
+    ),
+    "concentration": (("_today_row",), lambda ctx, v: float(ctx.concentration or 0)),
+    "market_price": (("_today_row",), lambda ctx, v: float(ctx.market_price or 0)),
+    "avg_cost": (
+        ("_today_row",),
+        lambda ctx, v: float(v["_today_row"].get("收盤價", 0) or 0),
+    ),
+    "consecutive_buy_days": (("_streaks",), lambda ctx, v: v["_streaks"][0]),
+    "consecutive_sell_days": (("_streaks",), lambda ctx, v: v["_streaks"][1]),
+}
+
+_ALLOWED_VARS = frozenset(name for name in _FEATURES if not name.startswith("_"))
+
+# 通知內文 (notify._format_condition_group) 會顯示的變數；規則命中時一律補算
+DISPLAY_VARIABLES = frozenset(
+    {"concentration", "consecutive_buy_days", "consecutive_sell_days", "market_price", "avg_cost"}
+)
+
+
+@lru_cache(maxsize=256)
+def _expression_names(expr: str) -> frozenset[str]:
+    """解析表達式中引用到的所有名稱；語法錯誤回傳空集合。"""
+    try:
+        tree = ast.parse(expr, mode="eval")
+    except SyntaxError:
+        return frozenset()
+    return frozenset(node.id for node in ast.walk(tree) if isinstance(node, ast.Name))
+
+
+def rule_variables(expr: str) -> frozenset[str]:
+    """回傳 condition 表達式實際用到的變數 (僅限允許的變數)"""
+    return _expression_names(expr) & _ALLOWED_VARS
+
+
+def required_variables(rules: list[dict]) -> frozenset[str]:
+    """所有 condition 規則用到的變數聯集"""
+    needed: set[str] = set()
+    for rule in rules:
+        if rule.get("kind") == "condition":
+            needed |= rule_variables(rule.get("when", ""))
+    return frozenset(needed)
+
+
+@lru_cache(maxsize=64)
+def _feature_plan(variables: frozenset[str]) -> tuple[str, ...]:
+    """展開相依後依拓撲順序排出要計算的特徵"""
+    graph: dict[str, tuple[str, ...]] = {}
+    pending = ["_today_row", *variables]
+    while pending:
+        name = pending.pop()
+        if name in graph:
+            continue
+        deps = _FEATURES[name][0]
+        graph[name] = deps
+        pending.extend(deps)
+    return tuple(TopologicalSorter(graph).static_order())
+
+
 def build_stock_metrics(
-    df_full: pd.DataFrame,
+    df_full: pd.DataFrame | HistoryIndex,
     stock_id: str,
     target_date: pd.Timestamp,
     market_price: float,
     concentration: float,
+    variables: Iterable[str] | None = None,
+    streaks: tuple[int, int] | None = None,
 ) -> dict:
-    """組出 condition 規則可用的變數集"""
-    today_row = df_full[
-        (df_full["代號"] == stock_id) & (df_full["日期"] == target_date)
-    ]
-    if today_row.empty:
-        return {}
+    """組出 condition 規則可用的變數集。
+
+    variables 指定要計算的變數 (預設全部)，只會依相依順序計算需要的特徵；
+    當日無資料時回傳空 dict。逐檔呼叫時請傳入共用的 HistoryIndex。
+    streaks 為已知的 (連續買超, 連續賣超) 天數 (如增量狀態)，給了就不再掃歷史。
+    """
+    wanted = _ALLOWED_VARS if variables is None else frozenset(variables) & _ALLOWED_VARS
+    ctx = _MetricContext(
+        HistoryIndex.of(df_full), stock_id, target_date, market_price, concentration, streaks
+    )
 
-    row = today_row.iloc[0]
-    buy_days, sell_days = _compute_consecutive_days(df_full, stock_id, target_date)
+    values: dict[str, Any] = {}
+    for name in _feature_plan(wanted):
+        values[name] = _FEATURES[name][1](ctx, values)
+        if name == "_today_row" and values[name] is None:
+            return {}
 
-    return {
-        "net_sheets": int(row.get("估算張數", 0) or 0),
-        "net_amount_k": int(row.get("買賣超金額(千)", 0) or 0),
-        "concentration": float(concentration or 0),
-        "market_price": float(market_price or 0),
-        "avg_cost": float(row.get("收盤價", 0) or 0),
-        "consecutive_buy_days": buy_days,
-        "consecutive_sell_days": sell_days,
-    }
+    return {name: values[name] for name in _FEATURES if name in wanted}
 
 
 def evaluate_conditions(
-    df_full: pd.DataFrame,
+    df_full: pd.DataFrame | HistoryIndex,
     stock_id: str,
     stock_name: str,
     target_date: pd.Timestamp,
     market_price: float,
     concentration: float,
     rules: list[dict],
+    streaks: tuple[int, int] | None = None,
 ) -> list[AlertHit]:
-    """對單檔股票跑所有 condition 規則"""
+    """對單檔股票跑所有 condition 規則。
+
+    判斷時只計算規則實際用到的變數；有規則命中時才補算通知要顯示的變數 (DISPLAY_VARIABLES)。
+    """
+    if not any(rule.get("kind") == "condition" for rule in rules):
+        return []
+
+    variables = required_variables(rules)
+    history = HistoryIndex.of(df_full)
     metrics = build_stock_metrics(
-        df_full, stock_id, target_date, market_price, concentration
+        history, stock_id, target_date, market_price, concentration, variables=variables, streaks=streaks
     )
     if not metrics:
         return []
 
-    hits: list[AlertHit] = []
-    for rule in rules:
-        if rule.get("kind") != "condition":
-            continue
-        expr = rule.get("when", "")
-        if _safe_eval_condition(expr, metrics):
-            hits.append(
-                AlertHit(
-                    rule_name=rule.get("name", "未命名規則"),
-                    emoji=rule.get("emoji", "📌"),
-                    stock_id=stock_id,
-                    stock_name=stock_name,
-                    extra=dict(metrics),
-                )
+    matched = [
+        rule
+        for rule in rules
+        if rule.get("kind") == "condition" and _safe_eval_condition(rule.get("when", ""), metrics)
+    ]
+    if matched and not DISPLAY_VARIABLES <= metrics.keys():
+        metrics.update(
+            build_stock_metrics(
+                history,
+                stock_id,
+                target_date,
+                market_price,
+                concentration,
+                variables=DISPLAY_VARIABLES - metrics.keys(),
+                streaks=streaks,
             )
-    return hits
+        )
+
+    return [
+        AlertHit(
+            rule_name=rule.get("name", "未命名規則"),
+            emoji=rule.get("emoji", "📌"),
+            stock_id=stock_id,
+            stock_name=stock_name,
+            extra=dict(metrics),
+        )
+        for rule in matched
+    ]
+
+
+def history_window(rules: list[dict]) -> int:
+    """規則需要回看的交易日數 (至少 1 日)"""
+    windows = [1]
+    for rule in rules:
+        kind = rule.get("kind")
+        if kind in {"ranking", "category_ranking"}:
+            windows.append(int(rule.get("window_days", 3)))
+        elif kind == "category_streak":
+            windows.append(int(rule.get("lookback_days", 20)))
+        elif kind == "anomaly":
+            windows.append(int(rule.get("window_days", 20)) + 1)  # 視窗 + 當日
+    return max(windows)
 
 
 def compute_rankings(
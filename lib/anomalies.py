@@ -0,0 +1,134 @@
+"""籌碼異常偵測 — 當日流量相對該股自身近期分布的 robust z-score。
+
+z = (今日值 - 中位數) / (1.4826 × MAD)，中位數與 MAD 取自前 window_days 個交易日。
+交易日以資料中出現的日期為準；該股沒有列的交易日視為淨買賣 0 (而不是略過)，
+冷門股的基準才不會只由有成交的日子構成而高估平常的量、蓋掉真正的爆量。
+視窗內多數日子數值相同時 MAD 為 0，改用平均絕對偏差 (× 1.2533)；仍為 0 (完全沒變化)
+時以 max(0.1 × |中位數|, 1) 作為尺度下限，長期平穩後突然爆量的股票照樣會被標出。
+全部股票在同一個 日期 × 股票 矩陣上一次向量化計算；視窗資料可直接來自
+AlertState.window_frame() (增量維護的 ring buffer)，不必讀整份歷史。
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+_METRIC_COLS = {"net_sheets": "估算張數", "net_amount_k": "買賣超金額(千)"}
+_MAD_SCALE = 1.4826  # 讓 MAD 在常態分布下對應標準差
+_MEAN_AD_SCALE = 1.2533  # 平均絕對偏差 → 標準差 (sqrt(pi / 2))
+_FLOOR_RATIO = 0.1  # 分布完全沒變化時的尺度下限：中位數的 10%，且至少 1 個單位
+
+
+def compute_anomalies(
+    df_full: pd.DataFrame,
+    target_date: pd.Timestamp,
+    metric: str,
+    window_days: int,
+    threshold: float,
+    min_periods: int = 5,
+    direction: str = "both",
+    watchlist_ids: set[str] | None = None,
+) -> pd.DataFrame:
+    """回傳當日 |z| (依 direction) 超過門檻的股票，依 |z| 由大到小排序。
+
+    欄位：代號 / 名稱 / value / median / z。該股在視窗內出現 (有列) 少於 min_periods 日或當日沒有列時不判定。
+    """
+    if metric not in _METRIC_COLS or direction not in {"buy", "sell", "both"}:
+        return pd.DataFrame()
+    target_col = _METRIC_COLS[metric]
+
+    dates = sorted(df_full.loc[df_full["日期"] <= target_date, "日期"].unique())
+    if not dates or pd.Timestamp(dates[-1]) != pd.Timestamp(target_date):
+        return pd.DataFrame()
+    window_dates = dates[-(window_days + 1):]
+
+    window_df = df_full[df_full["日期"].isin(window_dates)]
+    if watchlist_ids:
+        window_df = window_df[window_df["代號"].astype(str).isin(watchlist_ids)]
+    if window_df.empty:
+        return pd.DataFrame()
+
+    grouped = window_df.assign(代號=window_df["代號"].astype(str)).groupby(["日期", "代號"])[target_col]
+    calendar = pd.DatetimeIndex(window_dates)
+    # 沒有列的交易日補 0 (當日沒有淨買賣)；出現天數另外計算，供 min_periods 判定
+    matrix = grouped.sum().unstack("代號", fill_value=0).reindex(calendar, fill_value=0)
+    present = grouped.size().unstack("代號", fill_value=0).reindex(calendar, fill_value=0).to_numpy() > 0
+    today = matrix.iloc[-1].to_numpy(dtype=float)
+    trailing = matrix.iloc[:-1].to_numpy(dtype=float)
+
+    eligible = (present[:-1].sum(axis=0) >= min_periods) & present[-1]
+    if not eligible.any():
+        return pd.DataFrame()
+
+    trailing = trailing[:, eligible]
+    median = np.median(trailing, axis=0)
+    mad = np.median(np.abs(trailing - median), axis=0)
+    scale = _MAD_SCALE * mad
+    flat = scale == 0
+    if flat.any():
+        mean_ad = np.mean(np.abs(trailing[:, flat] - median[flat]), axis=0)
+        floor = np.maximum(_FLOOR_RATIO * np.abs(median[flat]), 1.0)
+        scale[flat] = np.maximum(_MEAN_AD_SCALE * mean_ad, floor)
+    z = (today[eligible] - median) / scale
+
+    result = pd.DataFrame({
+        "代號": matrix.columns[eligible].astype(str),
+        "value": today[eligible],
+        "median": median,
+        "z": z,
+    }).dropna(subset=["z"])
+
+    if direction == "buy":
+        result = result[result["z"] >= threshold]
+    elif direction == "sell":
+        result = result[result["z"] <= -threshold]
+    else:
+        result = result[result["z"].abs() >= threshold]
+    if result.empty:
+        return result
+
+    names = (
+        window_df[window_df["日期"] == pd.Timestamp(target_date)]
+        .assign(代號=lambda d: d["代號"].astype(str))
+        .drop_duplicates("代號")
+        .set_index("代號")["名稱"]
+    )
+    result.insert(1, "名稱", result["代號"].map(names))
+    order = result["z"].abs().sort_values(ascending=False).index
+    return result.loc[order].reset_index(drop=True)
+
+
+def evaluate_anomalies(
+    df_full: pd.DataFrame,
+    target_date: pd.Timestamp,
+    rules: list[dict],
+    watchlist_ids: set[str] | None = None,
+) -> dict[str, dict]:
+    """跑所有 anomaly 規則。回傳 {rule_name: {emoji, records, metric, direction, window_days}}"""
+    result: dict[str, dict] = {}
+    for rule in rules:
+        if rule.get("kind") != "anomaly":
+            continue
+        metric = str(rule.get("metric", "net_sheets"))
+        direction = str(rule.get("direction", "both"))
+        window_days = int(rule.get("window_days", 20))
+        flagged = compute_anomalies(
+            df_full=df_full,
+            target_date=target_date,
+            metric=metric,
+            window_days=window_days,
+            threshold=float(rule.get("threshold", 3.5)),
+            min_periods=int(rule.get("min_periods", 5)),
+            direction=direction,
+            watchlist_ids=watchlist_ids,
+        )
+        if flagged.empty:
+            continue
+        result[rule.get("name", "未命名異常規則")] = {
+            "emoji": rule.get("emoji", "📡"),
+            "records": flagged.head(int(rule.get("top_n", 5))).to_dict("records"),
+            "metric": metric,
+            "direction": direction,
+            "window_days": window_days,
+        }
+    return result
@@ -0,0 +1,77 @@
+"""多分點爬取 — 富邦分點網址、共用限速與並行爬取。
+
+富邦分點頁的參數：a = 券商代號 (分點前兩碼 + "00")，b = 分點代號每個字元的 4 位 16 進位碼，
+例如 9A91 → a=9A00、b=0039004100390031。
+所有分點共用同一個 RateLimiter，並行爬取時對富邦的請求頻率仍受限。
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import ThreadPoolExecutor
+
+from lib.logger import get_logger
+from settings import BROKER_CRAWL_CONCURRENCY, FUBON_MIN_INTERVAL
+
+log = get_logger(__name__)
+
+FUBON_BASE_URL = "https://fubon-ebrokerdj.fbs.com.tw/z/zg/zgb/zgb0.djhtm"
+
+
+def fubon_params(branch: str) -> tuple[str, str]:
+    """分點代號 → 富邦網址的 (a, b) 參數"""
+    branch = branch.strip().upper()
+    return branch[:2] + "00", "".join(f"{ord(c):04X}" for c in branch)
+
+
+def fubon_url(branch: str, date_str: str | None = None) -> str:
+    """分點買賣超網址；date_str 為 None 時不帶日期參數 (由呼叫端自行附加)"""
+    a, b = fubon_params(branch)
+    url = f"{FUBON_BASE_URL}?a={a}&b={b}&c=B"
+    if date_str is not None:
+        url += f"&e={date_str}&f={date_str}"
+    return url
+
+
+class RateLimiter:
+    """跨執行緒共用的最小請求間隔"""
+
+    def __init__(self, min_interval: float = FUBON_MIN_INTERVAL) -> None:
+        self.min_interval = min_interval
+        self._lock = threading.Lock()
+        self._next_at = 0.0
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_at)
+            self._next_at = start + self.min_interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def crawl_brokers(
+    branches: Iterable[str],
+    fetch: Callable[[str], list[dict]],
+    limiter: RateLimiter | None = None,
+    max_workers: int = BROKER_CRAWL_CONCURRENCY,
+) -> dict[str, list[dict]]:
+    """並行爬取多個分點，回傳 {分點: 股票清單} (依 branches 順序)。
+
+    fetch(branch) 負責單一分點的請求與解析；每次請求前都經過共用 limiter。
+    """
+    limiter = limiter or RateLimiter()
+    branches = list(dict.fromkeys(branches))
+
+    def limited(branch: str) -> list[dict]:
+        limiter.wait()
+        return fetch(branch)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        results = dict(zip(branches, pool.map(limited, branches), strict=True))
+    log.info(
+        "🏦 分點爬取完成: "
+        + ", ".join(f"{branch} {len(stocks)} 檔" for branch, stocks in results.items())
+    )
+    return results
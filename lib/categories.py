@@ -0,0 +1,161 @@
+"""分類層級資金流向 — 以 Watchlist 的 category 彙總每日 / N 日淨買賣超、連續天數與排行。
+
+整段計算只做一次 (日期, 分類) groupby，再用 日期 × 分類 矩陣向量化算連續天數，
+不逐檔迴圈。
+"""
+from __future__ import annotations
+
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+_METRIC_COLS = {"net_sheets": "估算張數", "net_amount_k": "買賣超金額(千)"}
+
+
+@lru_cache(maxsize=8)
+def _mapping_from_items(items: tuple[tuple[str, str], ...]) -> pd.Series:
+    return pd.Series(dict(items), dtype=object, name="分類")
+
+
+def category_mapping(watchlist: dict[str, dict]) -> pd.Series:
+    """stock_id → category 對照 (依 watchlist 內容快取，同一份 watchlist 只建一次)"""
+    items = tuple(sorted((str(sid), info["category"]) for sid, info in watchlist.items()))
+    return _mapping_from_items(items)
+
+
+def category_daily_flows(df_full: pd.DataFrame, mapping: pd.Series) -> pd.DataFrame:
+    """回傳 日期 × 分類 的每日淨張數 / 淨金額 (long format，欄位同 metric 名稱)"""
+    categories = df_full["代號"].astype(str).map(mapping)
+    tagged = df_full.loc[categories.notna(), ["日期", *_METRIC_COLS.values()]]
+    flows = (
+        tagged.assign(分類=categories[categories.notna()])
+        .groupby(["日期", "分類"], sort=True)[list(_METRIC_COLS.values())]
+        .sum()
+        .rename(columns={col: metric for metric, col in _METRIC_COLS.items()})
+        .reset_index()
+    )
+    return flows
+
+
+def _trading_dates(df_full: pd.DataFrame, target_date: pd.Timestamp, window_days: int) -> list:
+    """截至 target_date 最近 window_days 個有資料的交易日 (遞增)"""
+    dates = sorted(df_full.loc[df_full["日期"] <= target_date, "日期"].unique())
+    return dates[-window_days:]
+
+
+def _flows_summary(flows: pd.DataFrame, window_dates: list, metric: str) -> pd.DataFrame:
+    """由每日分類流向算出每個分類在 window_dates 的合計與連續天數。
+
+    分類當日無成交記為 0 (會中斷連續天數)，連續天數上限為視窗長度。
+    """
+    flows = flows[flows["日期"].isin(window_dates)]
+    if flows.empty:
+        return pd.DataFrame()
+    matrix = (
+        flows.pivot(index="日期", columns="分類", values=metric)
+        .reindex(pd.DatetimeIndex(window_dates))
+        .fillna(0)
+    )
+    values = matrix.to_numpy()
+    return pd.DataFrame({
+        "分類": matrix.columns.astype(str),
+        "total": values.sum(axis=0),
+        "today": values[-1],
+        "buy_streak": _trailing_streak(values > 0),
+        "sell_streak": _trailing_streak(values < 0),
+    })
+
+
+def _trailing_streak(mask: np.ndarray) -> np.ndarray:
+    """每一欄從最後一列往回連續為 True 的列數"""
+    reversed_mask = mask[::-1]
+    return np.where(
+        reversed_mask.all(axis=0), len(mask), reversed_mask.argmin(axis=0)
+    ).astype(int)
+
+
+def compute_category_flows(
+    df_full: pd.DataFrame,
+    mapping: pd.Series,
+    target_date: pd.Timestamp,
+    window_days: int,
+    metric: str = "net_amount_k",
+) -> pd.DataFrame:
+    """每個分類近 window_days 交易日的合計與截至 target_date 的連續買 / 賣超天數。
+
+    回傳欄位：分類 / total / today / buy_streak / sell_streak。
+    """
+    if metric not in _METRIC_COLS:
+        return pd.DataFrame()
+    window_dates = _trading_dates(df_full, target_date, window_days)
+    if not window_dates:
+        return pd.DataFrame()
+    flows = category_daily_flows(df_full[df_full["日期"].isin(window_dates)], mapping)
+    return _flows_summary(flows, window_dates, metric)
+
+
+def _rule_window(rule: dict) -> int:
+    if rule.get("kind") == "category_ranking":
+        return int(rule.get("window_days", 3))
+    return int(rule.get("lookback_days", 20))
+
+
+def evaluate_category_rules(
+    df_full: pd.DataFrame,
+    target_date: pd.Timestamp,
+    rules: list[dict],
+    mapping: pd.Series,
+) -> dict[str, dict]:
+    """跑 category_ranking / category_streak 規則。回傳 {rule_name: payload}
+
+    所有規則共用同一次 (日期, 分類) 彙總，各規則只切自己的視窗。
+    """
+    category_rules = [
+        rule for rule in rules
+        if rule.get("kind") in {"category_ranking", "category_streak"}
+        and rule.get("metric", "net_amount_k") in _METRIC_COLS
+        and rule.get("direction", "buy") in {"buy", "sell"}
+    ]
+    if not category_rules or mapping.empty:
+        return {}
+
+    all_dates = _trading_dates(
+        df_full, target_date, max(_rule_window(rule) for rule in category_rules)
+    )
+    if not all_dates:
+        return {}
+    flows = category_daily_flows(df_full[df_full["日期"].isin(all_dates)], mapping)
+
+    result: dict[str, dict] = {}
+    for rule in category_rules:
+        kind = rule["kind"]
+        metric = str(rule.get("metric", "net_amount_k"))
+        direction = str(rule.get("direction", "buy"))
+        window_days = _rule_window(rule)
+        summary = _flows_summary(flows, all_dates[-window_days:], metric)
+        if summary.empty:
+            continue
+
+        if kind == "category_ranking":
+            if direction == "buy":
+                picked = summary[summary["total"] > 0].sort_values("total", ascending=False)
+            else:
+                picked = summary[summary["total"] < 0].sort_values("total", ascending=True)
+            picked = picked.head(int(rule.get("top_n", 3)))
+        else:
+            streak_col = "buy_streak" if direction == "buy" else "sell_streak"
+            picked = summary[summary[streak_col] >= int(rule.get("min_days", 3))]
+            picked = picked.sort_values(streak_col, ascending=False)
+
+        if picked.empty:
+            continue
+        result[rule.get("name", "未命名分類規則")] = {
+            "kind": kind,
+            "emoji": rule.get("emoji", "🗂️"),
+            "records": picked.to_dict("records"),
+            "metric": metric,
+            "direction": direction,
+            "window_days": window_days,
+        }
+    return result
@@ -0,0 +1,72 @@
+"""儀表板個股圖表 — 單檔序列 (每日或每週 / 每月彙總張數、累積張數、顏色) 與 Plotly 圖表規格。
+
+兩者都只依 (資料版本, 代號, 區間) 決定，app.py 以此為 key 快取，
+切換回最近看過的股票時不必重算序列、也不必重建圖表。
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+
+BUY_COLOR = "#E67F75"
+SELL_COLOR = "#6CB097"
+_SERIES_COLS = ["日期", "收盤價", "估算張數"]
+
+
+def chart_series(rows: pd.DataFrame) -> pd.DataFrame:
+    """單檔區間列 (依日期遞增) → 日期 / 收盤價 / 估算張數 / 累積張數 / 顏色"""
+    series = rows[_SERIES_COLS].reset_index(drop=True)
+    sheets = series["估算張數"].to_numpy()
+    series["累積張數"] = np.cumsum(sheets)
+    series["顏色"] = np.where(sheets > 0, BUY_COLOR, SELL_COLOR)
+    return series
+
+
+def flow_figure(
+    series: pd.DataFrame, bar_name: str = "每日", title: str = "籌碼分佈趨勢"
+) -> go.Figure:
+    """每期 (預設每日) 張數長條 + 累積庫存折線"""
+    fig = make_subplots(specs=[[{"secondary_y": True}]])
+    fig.add_trace(
+        go.Bar(
+            x=series["日期"],
+            y=series["估算張數"],
+            name=bar_name,
+            marker_color=series["顏色"],
+            opacity=0.8,
+        ),
+        secondary_y=False,
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=series["日期"],
+            y=series["累積張數"],
+            name="庫存",
+            line=dict(color="#2C3E50", width=2),
+            mode="lines",
+        ),
+        secondary_y=True,
+    )
+
+    fig.update_layout(
+        title=dict(text=title, font=dict(color="#333333", size=16)),
+        plot_bgcolor="#FFFFFF",
+        paper_bgcolor="#FFFFFF",
+        font=dict(color="#333333"),
+        legend=dict(orientation="h", y=1.1, x=0, font=dict(color="#333333")),
+        height=350,
+        margin=dict(l=15, r=15, t=50, b=10),
+        xaxis=dict(
+            showgrid=False,
+            tickfont=dict(color="#333333", size=12),
+            title_font=dict(color="#333333"),
+        ),
+        yaxis=dict(
+            showgrid=True,
+            gridcolor="#F0F0F0",
+            tickfont=dict(color="#333333", size=12),
+        ),
+    )
+    return fig
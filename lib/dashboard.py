@@ -0,0 +1,166 @@
+"""儀表板資料集 — Sheet 資料 + 排序索引 + 區間索引 + 週 / 月彙總，以及每日預建的快照。
+
+app.py 的快取值就是 DashboardData：索引在載入資料的同一個 (背景) 執行緒建好，請求不必等待。
+每日 pipeline 寫完 Sheet 後另把整組資料寫成快照 (APP_ARTIFACT_DIR)：
+
+    manifest.json        版本、產生時間、修訂標記、各檔案名稱
+    frame.arrow          Sheet 原始順序的型別化資料 (Arrow IPC / Feather v2，未壓縮，可 memory-map)
+    flow_keys.arrow      區間索引的 (代號, 名稱)
+    rollup_W.arrow ...   週 / 月彙總表
+    *.npy                排序位置與前綴和陣列 (np.load mmap_mode="r")
+
+排程在 Actions runner 上產生快照後打包上傳到 Drive (publish_artifact)；app 啟動時直接 memory-map
+本機既有的快照還原索引，不必下載 Sheet、也不必重新排序 / 彙總；較新的副本在背景重新載入時取回 (fetch_artifact)。
+快照不存在、版本不符或超過 APP_ARTIFACT_MAX_AGE 時回傳 None，由呼叫端改讀 Sheet。
+"""
+from __future__ import annotations
+
+import datetime
+import json
+import shutil
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from lib.drive_store import fetch_directory, publish_directory
+from lib.flow_index import FlowIndex
+from lib.history_index import HistoryIndex
+from lib.logger import get_logger
+from lib.rollups import Rollups, sync_rollups
+from lib.sheet import SheetData, SheetRevision
+from settings import APP_ARTIFACT_DIR, APP_ARTIFACT_MAX_AGE, DRIVE_ARTIFACT_FILE
+
+log = get_logger(__name__)
+
+ARTIFACT_VERSION = 1
+_MANIFEST = "manifest.json"
+_FRAME = "frame.arrow"
+_FLOW_KEYS = "flow_keys.arrow"
+_HISTORY_ORDER = "history_order.npy"
+_FLOW_ORDER = "flow_order.npy"
+
+
+@dataclass(frozen=True)
+class DashboardData:
+    sheet: SheetData
+    history: HistoryIndex  # 依 (代號, 日期) 排序 (單檔查詢)
+    flows: FlowIndex  # 區間前綴和 (選股清單)
+    rollups: Rollups  # 週 / 月彙總 (長區間圖表)
+
+    @classmethod
+    def build(cls, sheet: SheetData, previous: DashboardData | None = None) -> DashboardData:
+        """資料集換版時重建索引；彙總在只有附加列時沿用 previous 增量更新"""
+        return cls(
+            sheet,
+            HistoryIndex(sheet.frame),
+            FlowIndex(sheet.frame),
+            sync_rollups(previous.rollups if previous is not None else None, sheet.frame, sheet.stable_rows),
+        )
+
+
+def _write_frame(frame: pd.DataFrame, path: Path) -> None:
+    frame.reset_index(drop=True).to_feather(path, compression="uncompressed")
+
+
+def _read_frame(path: Path) -> pd.DataFrame:
+    import pyarrow.feather as feather
+
+    return feather.read_table(path, memory_map=True).to_pandas()
+
+
+def write_artifact(data: DashboardData, directory: Path = APP_ARTIFACT_DIR) -> Path:
+    """寫出快照：先寫到暫存目錄再整個換上，app 不會讀到寫一半的快照"""
+    frame = data.sheet.frame
+    tmp = directory.with_name(directory.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    _write_frame(frame, tmp / _FRAME)
+    _write_frame(data.flows.keys, tmp / _FLOW_KEYS)
+    # 排序後的 frame 以原始位置記錄，還原時 iloc 取出即可 (不必重新排序)
+    np.save(tmp / _HISTORY_ORDER, frame.index.get_indexer(data.history.frame.index))
+    np.save(tmp / _FLOW_ORDER, frame.index.get_indexer(data.flows.frame.index))
+    arrays = {}
+    for i, (name, values) in enumerate(data.flows.arrays().items()):
+        arrays[name] = f"flow_{i}.npy"
+        np.save(tmp / arrays[name], values)
+    rollups = {}
+    for freq, table in data.rollups.tables.items():
+        rollups[freq] = f"rollup_{freq}.arrow"
+        _write_frame(table.reset_index(), tmp / rollups[freq])
+
+    manifest = {
+        "version": ARTIFACT_VERSION,
+        "created_at": data.sheet.loaded_at,
+        "revision": asdict(data.sheet.revision) if data.sheet.revision is not None else None,
+        "rows": len(frame),
+        "flow_arrays": arrays,
+        "rollups": rollups,
+    }
+    (tmp / _MANIFEST).write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+
+    shutil.rmtree(directory, ignore_errors=True)
+    tmp.rename(directory)
+    log.info(f"📦 已寫出儀表板快照 ({len(frame)} 筆) → {directory}")
+    return directory
+
+
+def publish_artifact(directory: Path = APP_ARTIFACT_DIR) -> None:
+    """把寫好的快照上傳到 Drive，app 在另一台機器上取回"""
+    publish_directory(directory, DRIVE_ARTIFACT_FILE)
+
+
+def fetch_artifact(directory: Path = APP_ARTIFACT_DIR) -> bool:
+    """Drive 上的快照較新時下載，回傳是否換上新快照；失敗只記 warning，沿用本機既有的快照 (或改讀 Sheet)"""
+    try:
+        return fetch_directory(directory, DRIVE_ARTIFACT_FILE)
+    except Exception as e:  # gspread / 網路例外類型多樣
+        log.warning(f"⚠️ 無法從 Drive 取回儀表板快照: {e}")
+        return False
+
+
+def load_artifact(
+    directory: Path = APP_ARTIFACT_DIR, max_age: float = APP_ARTIFACT_MAX_AGE
+) -> DashboardData | None:
+    """讀取快照；不存在、版本不符、過舊或檔案損毀時回傳 None"""
+    manifest_path = directory / _MANIFEST
+    if not manifest_path.exists():
+        return None
+    try:
+        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        if manifest.get("version") != ARTIFACT_VERSION:
+            log.info("ℹ️ 儀表板快照版本不符，改讀 Sheet。")
+            return None
+        age = time.time() - manifest["created_at"]
+        if age > max_age:
+            log.info(f"ℹ️ 儀表板快照已產生 {age / 3600:.1f} 小時，改讀 Sheet。")
+            return None
+
+        frame = _read_frame(directory / _FRAME)
+        history_order = np.load(directory / _HISTORY_ORDER, mmap_mode="r")
+        flow_order = np.load(directory / _FLOW_ORDER, mmap_mode="r")
+        arrays = {
+            name: np.load(directory / file, mmap_mode="r")
+            for name, file in manifest["flow_arrays"].items()
+        }
+        tables = {
+            freq: _read_frame(directory / file).set_index(["代號", "日期"])
+            for freq, file in manifest["rollups"].items()
+        }
+        flow_keys = _read_frame(directory / _FLOW_KEYS)
+        revision = SheetRevision(**manifest["revision"]) if manifest["revision"] else None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        log.warning(f"⚠️ 儀表板快照讀取失敗，改讀 Sheet: {e}")
+        return None
+
+    created = datetime.datetime.fromtimestamp(manifest["created_at"])
+    log.info(f"📦 使用儀表板快照 ({len(frame)} 筆，產生於 {created:%m-%d %H:%M})。")
+    return DashboardData(
+        SheetData(frame, revision, manifest["created_at"]),
+        HistoryIndex(frame.iloc[history_order], presorted=True),
+        FlowIndex.from_arrays(frame.iloc[flow_order], flow_keys, arrays),
+        Rollups(tables, manifest["rows"]),
+    )
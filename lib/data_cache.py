@@ -0,0 +1,105 @@
+"""Process 共用的 stale-while-revalidate 快取 — 過期時背景重新載入，期間繼續提供舊資料。
+
+給 app.py 的大型資料集使用：只有第一次載入會阻塞；之後過期的請求立刻拿到上一版，
+同時由背景執行緒重新載入 (同一時間最多一個)。載入失敗時保留舊資料並記 warning，
+下一個 ttl 再試。每次載入到新資料 version 加一，衍生的索引可以用 version 當快取 key。
+
+loader 收到上一版的值 (第一次為 None)，可以只做增量更新；
+資料沒有變動時回傳上一版的同一個物件，version 就不會改變。
+建立時可給 initial (例如每日預建的快照)：第一次 get 直接回傳它，同時在背景交給 loader 驗證。
+"""
+from __future__ import annotations
+
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass
+from typing import Generic, TypeVar
+
+from lib.logger import get_logger
+
+log = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+@dataclass(frozen=True)
+class CacheEntry(Generic[T]):
+    value: T
+    version: int
+    loaded_at: float
+
+
+class SWRCache(Generic[T]):
+    def __init__(
+        self,
+        loader: Callable[[T | None], T],
+        ttl: float,
+        clock: Callable[[], float] = time.monotonic,
+        initial: T | None = None,
+    ) -> None:
+        self.loader = loader
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._first_load = threading.Lock()
+        self._entry: CacheEntry[T] | None = None
+        self._checked_at = 0.0  # 上次成功或失敗的載入時間 (失敗也要等 ttl 再試)
+        if initial is not None:
+            # 預先給的值視為已過期：立刻可用，第一次 get 就在背景驗證
+            self._entry = CacheEntry(initial, 1, clock())
+            self._checked_at = float("-inf")
+        self._refreshing: threading.Thread | None = None
+
+    def _load(self, incremental: bool = True) -> CacheEntry[T]:
+        previous = self._entry
+        value = self.loader(previous.value if previous is not None and incremental else None)
+        with self._lock:
+            now = self.clock()
+            self._checked_at = now
+            if incremental and previous is not None and value is previous.value:
+                return previous
+            version = self._entry.version + 1 if self._entry is not None else 1
+            self._entry = CacheEntry(value, version, now)
+            return self._entry
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self._load()
+        except Exception as e:  # 載入來源 (gspread 等) 例外類型多樣；保留舊資料
+            log.warning(f"⚠️ 背景重新載入失敗，繼續使用舊資料: {e}")
+            with self._lock:
+                self._checked_at = self.clock()
+        finally:
+            with self._lock:
+                self._refreshing = None
+
+    def get(self) -> CacheEntry[T]:
+        """回傳目前的資料；過期時啟動背景重新載入 (不等待)。第一次呼叫會同步載入。"""
+        with self._lock:
+            entry = self._entry
+            stale = entry is not None and self.clock() - self._checked_at >= self.ttl
+            if stale and self._refreshing is None:
+                self._refreshing = threading.Thread(
+                    target=self._refresh_in_background, name="swr-refresh", daemon=True
+                )
+                self._refreshing.start()
+        if entry is not None:
+            return entry
+        with self._first_load:  # 同時多個首次請求只載入一次
+            return self._entry if self._entry is not None else self._load()
+
+    def refresh(self) -> CacheEntry[T]:
+        """同步完整重新載入 (不給 loader 上一版，例如使用者按下重新載入)"""
+        return self._load(incremental=False)
+
+    def invalidate(self) -> None:
+        """標記為過期；下一次 get 仍回傳舊資料，同時在背景重新載入"""
+        with self._lock:
+            self._checked_at = float("-inf")
+
+    def wait(self, timeout: float | None = None) -> None:
+        """等待進行中的背景載入結束 (測試 / 關閉時用)"""
+        thread = self._refreshing
+        if thread is not None:
+            thread.join(timeout)
@@ -0,0 +1,127 @@
+"""期限感知的降級規劃 — 依各 stage 的耗時估計決定還跑得完哪一種模式。
+
+耗時估計先取上次執行存下的數字 (STAGE_TIMINGS_FILE，沒有則用 settings 預設)，
+執行中每個 stage 完成就以實際耗時更新；需要做決定的 stage 把「由降級程度低到高」
+的候選方案交給 choose()，取第一個在期限內 (扣掉保留時間) 跑得完的方案。
+
+方案中的 stage key 可帶模式後綴 (例如 prices:watchlist)，代表同一 stage 的降級版本。
+"""
+from __future__ import annotations
+
+import datetime
+import json
+import math
+import time
+from collections.abc import Callable, Iterable
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+from lib.logger import get_logger
+from settings import (
+    DEADLINE_RESERVE_SECONDS,
+    DEADLINE_TZ,
+    STAGE_TIME_ESTIMATES,
+    STAGE_TIMINGS_FILE,
+)
+
+log = get_logger(__name__)
+
+# 平滑係數：新的實際耗時佔估計的比重
+_SMOOTHING = 0.5
+
+
+def parse_deadline(value: str, now: datetime.datetime | None = None) -> datetime.datetime:
+    """解析 --deadline：HH:MM (DEADLINE_TZ 當日) 或 ISO 8601 日期時間"""
+    tz = ZoneInfo(DEADLINE_TZ)
+    now = now or datetime.datetime.now(tz)
+    try:
+        clock = datetime.time.fromisoformat(value)
+    except ValueError:
+        parsed = datetime.datetime.fromisoformat(value)
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=tz)
+    return datetime.datetime.combine(now.astimezone(tz).date(), clock, tzinfo=tz)
+
+
+def _read_saved(path: Path) -> dict[str, float]:
+    if not path.exists():
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            saved = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        log.warning(f"⚠️ stage 耗時檔讀取失敗，改用預設估計: {e}")
+        return {}
+    return {str(k): float(v) for k, v in saved.items()}
+
+
+def load_estimates(path: Path = STAGE_TIMINGS_FILE) -> dict[str, float]:
+    """settings 預設估計，被上次執行存下的耗時覆蓋"""
+    return {**STAGE_TIME_ESTIMATES, **_read_saved(path)}
+
+
+class DeadlinePlanner:
+    def __init__(
+        self,
+        deadline: datetime.datetime | None,
+        estimates: dict[str, float] | None = None,
+        reserve: float = DEADLINE_RESERVE_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.clock = clock
+        self.reserve = reserve
+        self.estimates = dict(STAGE_TIME_ESTIMATES if estimates is None else estimates)
+        self.measured: dict[str, float] = {}
+        self.decisions: dict[str, str] = {}
+        if deadline is None:
+            self._end = math.inf
+        else:
+            now = datetime.datetime.now(deadline.tzinfo)
+            self._end = clock() + (deadline - now).total_seconds()
+
+    @property
+    def enabled(self) -> bool:
+        return self._end != math.inf
+
+    def remaining(self) -> float:
+        return self._end - self.clock()
+
+    def expected(self, stage_keys: Iterable[str]) -> float:
+        """預估依序跑完 stage_keys 所需秒數 (未知 stage 視為 0)"""
+        return sum(self.estimates.get(key, 0.0) for key in stage_keys)
+
+    def record(self, stage_key: str, seconds: float) -> None:
+        """以實際耗時更新估計"""
+        self.measured[stage_key] = seconds
+        previous = self.estimates.get(stage_key)
+        self.estimates[stage_key] = (
+            seconds if previous is None else previous + _SMOOTHING * (seconds - previous)
+        )
+
+    def budget(self, downstream: Iterable[str]) -> float:
+        """扣掉保留時間與下游預估後，目前 stage 還能用的秒數"""
+        return self.remaining() - self.reserve - self.expected(downstream)
+
+    def choose(self, decision: str, options: list[tuple[str, list[str]]]) -> str:
+        """options 依降級程度由低到高排列：[(模式名稱, 剩餘要跑的 stage keys)]。
+
+        回傳第一個跑得完的模式；都來不及時回傳最後一個 (降級最多)。
+        """
+        chosen = options[-1][0]
+        for mode, stage_keys in options:
+            if self.remaining() - self.reserve >= self.expected(stage_keys):
+                chosen = mode
+                break
+        if chosen != options[0][0]:
+            log.warning(
+                f"⏰ 距期限剩 {self.remaining():.0f}s，{decision} 降級為「{chosen}」模式。"
+            )
+        self.decisions[decision] = chosen
+        return chosen
+
+    def save(self, path: Path = STAGE_TIMINGS_FILE) -> None:
+        """存下本次更新後的估計 (只存有實測的 key)"""
+        saved = _read_saved(path)
+        saved.update({key: self.estimates[key] for key in self.measured})
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as f:
+            json.dump({k: round(v, 2) for k, v in saved.items()}, f, ensure_ascii=False, indent=2)
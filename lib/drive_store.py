@@ -0,0 +1,164 @@
+"""Google Drive 上的目錄副本 — 排程產出的本機目錄打包上傳，app 端再下載解開。
+
+GitHub Actions 的 runner 每次都是全新的，app (Streamlit) 也不在同一台機器上；
+兩邊共用的只有服務帳號，因此借用它的 Drive 交換檔案 (與 Sheet 同一組金鑰與 scope，
+經 gspread 已授權的 requests session 呼叫 Drive API v3)。
+
+    publish_directory(directory, name)   目錄打包成單一 tar 上傳 (同名檔案覆寫內容)
+    fetch_directory(directory, name)     遠端較新時下載並整個換上本機目錄
+
+tar 不再壓縮 (Parquet 已壓縮、Arrow / .npy 要保持可 memory-map)。下載後在目錄內記下遠端的
+modifiedTime (.drive_stamp)，遠端沒更新就只花一次列出檔案的請求。
+下載以串流寫到暫存檔再解開，不會把整個 tar 放進記憶體。
+服務帳號本身沒有儲存配額，檔案一律放在 DRIVE_FOLDER_ID (共用給服務帳號的資料夾，建議放在共用雲端硬碟)；
+未設定時 publish_directory 只記 warning 不上傳，fetch_directory 視為遠端不存在。
+"""
+from __future__ import annotations
+
+import io
+import shutil
+import tarfile
+import threading
+from pathlib import Path, PurePosixPath
+
+from lib.logger import get_logger
+from lib.sheet import get_client
+from settings import DRIVE_FOLDER_ID
+
+log = get_logger(__name__)
+
+_FILES_URL = "https://www.googleapis.com/drive/v3/files"
+_UPLOAD_URL = "https://www.googleapis.com/upload/drive/v3/files"
+_STAMP = ".drive_stamp"
+_ALL_DRIVES = {"supportsAllDrives": True}
+_TIMEOUT = 60  # 單次請求 (連線 / 兩次讀取之間) 的秒數
+_CHUNK = 1 << 20
+_fetch_lock = threading.Lock()  # 同一 process 的多個 session 不會同時下載到同一個暫存目錄
+
+
+def _http():
+    """gspread 6 的 HTTPClient 內已授權的 requests session (AuthorizedSession)"""
+    return get_client().http_client.session
+
+
+def _request(http, method: str, url: str, **kwargs):
+    response = http.request(method, url, timeout=_TIMEOUT, **kwargs)
+    response.raise_for_status()
+    return response
+
+
+def _find(http, name: str) -> dict | None:
+    """依檔名找 Drive 上最新的一份；找不到回傳 None"""
+    query = f"name = '{name}' and trashed = false and '{DRIVE_FOLDER_ID}' in parents"
+    response = _request(
+        http,
+        "get",
+        _FILES_URL,
+        params={
+            "q": query,
+            "fields": "files(id, modifiedTime)",
+            "orderBy": "modifiedTime desc",
+            "pageSize": 1,
+            "includeItemsFromAllDrives": True,
+            **_ALL_DRIVES,
+        },
+    )
+    files = response.json().get("files", [])
+    return files[0] if files else None
+
+
+def _pack(directory: Path) -> bytes:
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for path in sorted(directory.rglob("*")):
+            if path.is_file() and path.name != _STAMP:
+                tar.add(path, arcname=path.relative_to(directory).as_posix())
+    return buffer.getvalue()
+
+
+def publish_directory(directory: Path, name: str, http=None) -> None:
+    """把 directory 打包上傳為 Drive 上的 name；已存在時只覆寫內容 (檔案 id 不變)。
+
+    未設定 DRIVE_FOLDER_ID 時不上傳 (服務帳號自己的雲端硬碟沒有配額)，只記 warning。
+    """
+    if not DRIVE_FOLDER_ID:
+        log.warning(f"⚠️ 未設定 DRIVE_FOLDER_ID，{directory.name} 不上傳 Drive ({name})。")
+        return
+    http = http or _http()
+    payload = _pack(directory)
+    existing = _find(http, name)
+    if existing is not None:
+        file_id = existing["id"]
+    else:
+        metadata = {"name": name, "parents": [DRIVE_FOLDER_ID]}
+        file_id = _request(http, "post", _FILES_URL, params=_ALL_DRIVES, json=metadata).json()["id"]
+    _request(
+        http,
+        "patch",
+        f"{_UPLOAD_URL}/{file_id}",
+        params={"uploadType": "media", **_ALL_DRIVES},
+        data=payload,
+        headers={"Content-Type": "application/x-tar"},
+    )
+    log.info(f"☁️ 已上傳 {directory.name} → Drive {name} ({len(payload) / 1e6:.1f} MB)")
+
+
+def fetch_directory(directory: Path, name: str, http=None) -> bool:
+    """Drive 上的 name 比本機副本新時下載並整個換上 directory，回傳是否有更新。
+
+    遠端不存在 (或未設定 DRIVE_FOLDER_ID) 時回傳 False (本機不動)；下載或解開失敗時 raise，本機目錄保持原狀。
+    """
+    if not DRIVE_FOLDER_ID:
+        return False
+    with _fetch_lock:
+        return _fetch(directory, name, http or _http())
+
+
+def _extract(tar: tarfile.TarFile, target: Path) -> None:
+    """解開到 target；filter="data" 只有較新的 patch 版 (3.10.12+ / 3.11.4+) 才有，舊版自行擋掉不安全的成員"""
+    if hasattr(tarfile, "data_filter"):
+        tar.extractall(target, filter="data")
+        return
+    for member in tar.getmembers():
+        path = PurePosixPath(member.name)
+        if path.is_absolute() or ".." in path.parts or not (member.isfile() or member.isdir()):
+            raise ValueError(f"tar 內含不安全的成員: {member.name}")
+    tar.extractall(target)
+
+
+def _fetch(directory: Path, name: str, http) -> bool:
+    remote = _find(http, name)
+    if remote is None:
+        return False
+    stamp = directory / _STAMP
+    if stamp.exists() and stamp.read_text(encoding="utf-8") == remote["modifiedTime"]:
+        return False
+
+    archive = directory.with_name(directory.name + ".download.tar")
+    tmp = directory.with_name(directory.name + ".download")
+    shutil.rmtree(tmp, ignore_errors=True)
+    archive.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        with _request(
+            http, "get", f"{_FILES_URL}/{remote['id']}",
+            params={"alt": "media", **_ALL_DRIVES}, stream=True,
+        ) as response, archive.open("wb") as f:
+            for chunk in response.iter_content(_CHUNK):
+                f.write(chunk)
+        size = archive.stat().st_size
+        tmp.mkdir(parents=True)
+        with tarfile.open(name=archive) as tar:
+            _extract(tar, tmp)
+    finally:
+        archive.unlink(missing_ok=True)
+    (tmp / _STAMP).write_text(remote["modifiedTime"], encoding="utf-8")
+
+    # 先換上新目錄再刪舊的；已 memory-map 的舊檔在刪除後仍可讀到關閉為止
+    old = directory.with_name(directory.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if directory.exists():
+        directory.rename(old)
+    tmp.rename(directory)
+    shutil.rmtree(old, ignore_errors=True)
+    log.info(f"☁️ 已從 Drive 下載 {name} → {directory} ({size / 1e6:.1f} MB)")
+    return True
@@ -0,0 +1,135 @@
+"""區間流量前綴和索引 — 任意 [start, end] 的每檔累計只需每檔兩次查表。
+
+資料先彙總成 (代號, 名稱, 日期) 一列，依此排序後對 金額 / 張數 / 買超天數 / 賣超天數 /
+出現筆數 做累計和。每列編碼為 股票序號 × 交易日數 + 日期序號 (單調遞增)，
+區間 [start, end] 對每檔股票就是兩次 searchsorted 的差，整批以 numpy 向量化完成，
+不必再對區間內的列做日期比對與 groupby。
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from lib.history_index import DateLike
+
+ID_COL = "代號"
+NAME_COL = "名稱"
+DATE_COL = "日期"
+AMOUNT_COL = "買賣超金額(千)"
+SHEETS_COL = "估算張數"
+
+# 輸出欄位 → 每列的值
+_MEASURES = ("累計金額", "累計張數", "買超天數", "賣超天數", "_rows")
+
+
+class FlowIndex:
+    def __init__(self, df: pd.DataFrame) -> None:
+        sheets = df[SHEETS_COL]
+        per_day = (
+            df.assign(
+                **{
+                    ID_COL: df[ID_COL].astype(str),
+                    "累計金額": df[AMOUNT_COL],
+                    "累計張數": sheets,
+                    "買超天數": (sheets > 0).astype(np.int64),
+                    "賣超天數": (sheets < 0).astype(np.int64),
+                    "_rows": np.int64(1),
+                }
+            )
+            .groupby([ID_COL, NAME_COL, DATE_COL], sort=True)[list(_MEASURES)]
+            .sum()
+        )
+
+        # 依日期排序的原始資料，供需要逐列資料的區間查詢 (period) 切片
+        self.frame = df.sort_values(DATE_COL, kind="mergesort")
+        self._frame_dates = self.frame[DATE_COL].to_numpy()
+        self.dates = np.unique(self._frame_dates)
+
+        key_codes, keys = pd.factorize(per_day.index.droplevel(DATE_COL))
+        self.keys = pd.DataFrame(list(keys), columns=[ID_COL, NAME_COL])
+        date_codes = np.searchsorted(self.dates, per_day.index.get_level_values(DATE_COL))
+        self._codes = key_codes.astype(np.int64) * len(self.dates) + date_codes
+        self._key_base = np.arange(len(self.keys), dtype=np.int64) * len(self.dates)
+        self._cumsums = {
+            measure: np.concatenate(([0], np.cumsum(per_day[measure].to_numpy())))
+            for measure in _MEASURES
+        }
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """還原索引所需的陣列 (預建快照寫成 .npy；見 from_arrays)"""
+        return {
+            "dates": self.dates,
+            "codes": self._codes,
+            **{f"cumsum_{i}": self._cumsums[measure] for i, measure in enumerate(_MEASURES)},
+        }
+
+    @classmethod
+    def from_arrays(
+        cls, frame: pd.DataFrame, keys: pd.DataFrame, arrays: dict[str, np.ndarray]
+    ) -> FlowIndex:
+        """以 arrays() 的結果還原，不重新彙總。frame 須已依日期排序 (同 self.frame)。"""
+        index = cls.__new__(cls)
+        index.frame = frame
+        index._frame_dates = frame[DATE_COL].to_numpy()
+        index.dates = arrays["dates"]
+        index.keys = keys
+        index._codes = arrays["codes"]
+        index._key_base = np.arange(len(keys), dtype=np.int64) * len(index.dates)
+        index._cumsums = {measure: arrays[f"cumsum_{i}"] for i, measure in enumerate(_MEASURES)}
+        return index
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _date_bounds(self, start: DateLike | None, end: DateLike | None) -> tuple[int, int]:
+        lo = 0 if start is None else int(np.searchsorted(self.dates, _to_datetime64(start), "left"))
+        hi = (
+            len(self.dates)
+            if end is None
+            else int(np.searchsorted(self.dates, _to_datetime64(end), "right"))
+        )
+        return lo, max(lo, hi)
+
+    def trading_days(self, start: DateLike | None = None, end: DateLike | None = None) -> int:
+        """[start, end] 內有資料的交易日數"""
+        lo, hi = self._date_bounds(start, end)
+        return hi - lo
+
+    def window(self, start: DateLike | None = None, end: DateLike | None = None) -> pd.DataFrame:
+        """[start, end] (兩端皆含) 內每檔的 累計金額 / 累計張數 / 買超天數 / 賣超天數。
+
+        與對區間資料 groupby([代號, 名稱]).sum() 的結果相同，只含區間內有資料的股票。
+        """
+        lo_day, hi_day = self._date_bounds(start, end)
+        lo = np.searchsorted(self._codes, self._key_base + lo_day, "left")
+        hi = np.searchsorted(self._codes, self._key_base + hi_day, "left")
+        present = hi > lo
+
+        stats = self.keys[present].reset_index(drop=True)
+        for measure in _MEASURES[:-1]:
+            cumsum = self._cumsums[measure]
+            stats[measure] = (cumsum[hi] - cumsum[lo])[present]
+        return stats
+
+    def period(self, start: DateLike | None = None, end: DateLike | None = None) -> pd.DataFrame:
+        """[start, end] 內的原始列 (依日期排序的切片，修改前請自行 .copy())"""
+        lo = 0 if start is None else np.searchsorted(self._frame_dates, _to_datetime64(start), "left")
+        hi = (
+            len(self._frame_dates)
+            if end is None
+            else np.searchsorted(self._frame_dates, _to_datetime64(end), "right")
+        )
+        return self.frame.iloc[int(lo):max(int(lo), int(hi))]
+
+
+def top_page(frame: pd.DataFrame, by: str, page: int, page_size: int) -> pd.DataFrame:
+    """依 by 由大到小排序後的第 page 頁 (1 起算)。
+
+    只以 nlargest 取前 page × page_size 筆，不排序整張表；同值依原順序。
+    """
+    page = max(1, int(page))
+    return frame.nlargest(page * page_size, by).iloc[(page - 1) * page_size:]
+
+
+def _to_datetime64(value: DateLike) -> np.datetime64:
+    return pd.Timestamp(value).to_datetime64()
@@ -0,0 +1,119 @@
+"""跨分點查詢 — 以內嵌的 DuckDB 直接查本機歷史 Parquet 檔 (lib/history_store.py)。
+
+彙總以 SQL 在 DuckDB 內完成，日期 / 分點條件下推到 Parquet 掃描 (依檔案與 row group 的
+min / max 統計略過不相關的資料)，回到 Python 的只有彙總後的小表。
+duckdb 只有比較頁需要，延遲 import；未安裝時 HistoryDB() 拋出 ImportError。
+"""
+from __future__ import annotations
+
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from lib.history_index import DateLike
+from lib.history_store import history_files
+from settings import HISTORY_DIR
+
+BUY = "buy"
+SELL = "sell"
+
+_FLOWS_SQL = """
+    SELECT
+        "分點", "代號", arg_max("名稱", "日期") AS "名稱",
+        sum("買賣超金額(千)") AS "累計金額",
+        sum("估算張數") AS "累計張數",
+        count(*) FILTER (WHERE "估算張數" > 0) AS "買超天數",
+        count(*) FILTER (WHERE "估算張數" < 0) AS "賣超天數"
+    FROM history
+    WHERE "日期" BETWEEN ? AND ? AND list_contains(?, "分點")
+    GROUP BY "分點", "代號"
+"""
+
+
+class HistoryDB:
+    """本機歷史檔上的唯讀查詢。連線可跨執行緒共用 (每次查詢開一個 cursor)。"""
+
+    def __init__(self, directory: Path = HISTORY_DIR) -> None:
+        import duckdb  # 延遲 import：只有比較頁需要
+
+        self.directory = directory
+        self._con = duckdb.connect()
+        self._lock = threading.Lock()
+        self.available = bool(history_files(directory))
+        if self.available:
+            pattern = (directory / "*" / "*.parquet").as_posix().replace("'", "''")
+            self._con.execute(
+                f"CREATE VIEW history AS SELECT * FROM read_parquet('{pattern}', union_by_name = true)"
+            )
+
+    def query(self, sql: str, params: list | None = None) -> pd.DataFrame:
+        with self._lock:
+            cursor = self._con.cursor()
+        try:
+            return cursor.execute(sql, params or []).df()
+        finally:
+            cursor.close()
+
+    def brokers(self) -> list[str]:
+        if not self.available:
+            return []
+        return self.query('SELECT DISTINCT "分點" FROM history ORDER BY 1')["分點"].tolist()
+
+    def date_range(self) -> tuple[pd.Timestamp, pd.Timestamp] | None:
+        if not self.available:
+            return None
+        lo, hi = self.query('SELECT min("日期") AS lo, max("日期") AS hi FROM history').iloc[0]
+        return pd.Timestamp(lo), pd.Timestamp(hi)
+
+    def broker_flows(self, start: DateLike, end: DateLike, brokers: list[str]) -> pd.DataFrame:
+        """[start, end] 內各 (分點, 代號) 的 累計金額 / 累計張數 / 買超天數 / 賣超天數"""
+        if not self.available or not brokers:
+            return pd.DataFrame(columns=["分點", "代號", "名稱", "累計金額", "累計張數", "買超天數", "賣超天數"])
+        return self.query(
+            _FLOWS_SQL + ' ORDER BY "分點", "代號"',
+            [pd.Timestamp(start), pd.Timestamp(end), list(brokers)],
+        )
+
+    def shared_flows(
+        self,
+        start: DateLike,
+        end: DateLike,
+        brokers: list[str],
+        side: str = BUY,
+        min_brokers: int = 2,
+    ) -> pd.DataFrame:
+        """[start, end] 內至少 min_brokers 個分點同方向 (淨買超 / 淨賣超) 的股票。
+
+        每檔一列：代號 / 名稱 / 分點數 / 合計金額 / 合計張數，再加上每個分點的淨張數欄 (張數_<分點>)；
+        依合計金額絕對值由大到小排序。
+        """
+        if not self.available or not brokers:
+            return pd.DataFrame(columns=["代號", "名稱", "分點數", "合計金額", "合計張數"])
+        direction = '"累計張數" > 0' if side == BUY else '"累計張數" < 0'
+        shared = self.query(
+            f"""
+            WITH flows AS ({_FLOWS_SQL}),
+            picked AS (
+                SELECT * FROM flows
+                WHERE {direction}
+                QUALIFY count(*) OVER (PARTITION BY "代號") >= ?
+            )
+            SELECT "代號", "分點", "名稱", "累計金額", "累計張數" FROM picked
+            """,
+            [pd.Timestamp(start), pd.Timestamp(end), list(brokers), int(min_brokers)],
+        )
+        if shared.empty:
+            return pd.DataFrame(columns=["代號", "名稱", "分點數", "合計金額", "合計張數"])
+
+        # 符合條件的股票不多，轉寬表在 pandas 做即可
+        per_broker = shared.pivot(index="代號", columns="分點", values="累計張數").add_prefix("張數_")
+        totals = shared.groupby("代號").agg(
+            名稱=("名稱", "last"),
+            分點數=("分點", "count"),
+            合計金額=("累計金額", "sum"),
+            合計張數=("累計張數", "sum"),
+        )
+        result = totals.join(per_broker).reset_index()
+        order = result["合計金額"].abs().sort_values(ascending=False, kind="mergesort").index
+        return result.loc[order].reset_index(drop=True)
@@ -0,0 +1,99 @@
+"""歷史資料索引 — 依 (代號, 日期) 排序一次，單檔 / 單檔區間查詢不必再掃整張表。"""
+from __future__ import annotations
+
+import datetime
+from collections.abc import Iterator
+
+import numpy as np
+import pandas as pd
+
+ID_COL = "代號"
+DATE_COL = "日期"
+
+DateLike = datetime.date | pd.Timestamp | str
+
+
+class HistoryIndex:
+    """排序後的歷史資料 + 每檔股票的 [start, end) 位移。
+
+    - 單檔查詢：dict 查位移 O(1)
+    - 單檔日期區間：在該檔已排序的日期上 searchsorted，O(log n)
+    回傳的 DataFrame 皆為排序後 frame 的切片，保留原始 index label，
+    修改前請自行 .copy()。
+    """
+
+    def __init__(
+        self,
+        df: pd.DataFrame,
+        id_col: str = ID_COL,
+        date_col: str = DATE_COL,
+        presorted: bool = False,
+    ) -> None:
+        """presorted=True 表示 df 已依 (id_col, date_col) 排序 (例如預建快照)，略過排序"""
+        self.id_col = id_col
+        self.date_col = date_col
+        self.frame = df if presorted else df.sort_values([id_col, date_col], kind="mergesort")
+
+        ids = self.frame[id_col].astype(str).to_numpy()
+        self._dates = self.frame[date_col].to_numpy()
+
+        boundaries = np.flatnonzero(ids[1:] != ids[:-1]) + 1
+        starts = np.concatenate(([0], boundaries)) if len(ids) else np.array([], dtype=int)
+        ends = np.concatenate((boundaries, [len(ids)])) if len(ids) else np.array([], dtype=int)
+        self._offsets: dict[str, tuple[int, int]] = {
+            ids[s]: (int(s), int(e)) for s, e in zip(starts, ends, strict=True)
+        }
+
+    @classmethod
+    def of(cls, data: pd.DataFrame | HistoryIndex) -> HistoryIndex:
+        """已是索引就直接回傳，否則就地建立 (呼叫端應盡量重複使用同一個索引)"""
+        return data if isinstance(data, cls) else cls(data)
+
+    def __len__(self) -> int:
+        return len(self.frame)
+
+    def __contains__(self, stock_id: object) -> bool:
+        return str(stock_id) in self._offsets
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._offsets)
+
+    @property
+    def stock_ids(self) -> list[str]:
+        return list(self._offsets)
+
+    def _bounds(self, stock_id: str) -> tuple[int, int]:
+        return self._offsets.get(str(stock_id), (0, 0))
+
+    def stock(self, stock_id: str) -> pd.DataFrame:
+        """單檔全部資料 (依日期遞增)"""
+        start, end = self._bounds(stock_id)
+        return self.frame.iloc[start:end]
+
+    def stock_range(
+        self,
+        stock_id: str,
+        start: DateLike | None = None,
+        end: DateLike | None = None,
+    ) -> pd.DataFrame:
+        """單檔 [start, end] 區間資料 (兩端皆含，None 代表不限)"""
+        lo, hi = self._bounds(stock_id)
+        if lo == hi:
+            return self.frame.iloc[0:0]
+        dates = self._dates[lo:hi]
+        if start is not None:
+            lo += int(np.searchsorted(dates, _to_datetime64(start), side="left"))
+        if end is not None:
+            hi = lo + int(
+                np.searchsorted(self._dates[lo:hi], _to_datetime64(end), side="right")
+            )
+        return self.frame.iloc[lo:max(lo, hi)]
+
+    def row(self, stock_id: str, date: DateLike) -> pd.Series | None:
+        """單檔單日資料；查無回傳 None"""
+        rows = self.stock_range(stock_id, date, date)
+        return None if rows.empty else rows.iloc[0]
+
+
+def _to_datetime64(value: DateLike) -> np.datetime64:
+    return pd.Timestamp(value).to_datetime64()
@@ -0,0 +1,105 @@
+"""本機歷史檔 — 各分點的逐日資料以 Parquet 存在 HISTORY_DIR，供 lib/history_db.py 查詢。
+
+目錄結構：
+    <HISTORY_DIR>/<分點>/<YYYY-MM>.parquet   該分點該月的列 (欄位同 Sheet，依日期排序)
+
+每日 pipeline 寫完 Sheet 後把當日各分點的列併入當月檔案 (同一日期重跑會先移除舊列)；
+repair_prices.py 補到的股價以 repair_history 改寫受影響的月檔；
+既有 Sheet 資料可用 scripts/export_history.py 一次匯出。每月一檔讓 Parquet 的
+日期 min / max 統計就能略過區間外的檔案。
+"""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from lib.logger import get_logger
+from settings import HISTORY_DIR
+
+log = get_logger(__name__)
+
+BROKER_COL = "分點"
+DATE_COL = "日期"
+ID_COL = "代號"
+AMOUNT_COL = "買賣超金額(千)"
+PRICE_COL = "收盤價"
+SHEETS_COL = "估算張數"
+
+
+def history_files(directory: Path = HISTORY_DIR) -> list[Path]:
+    return sorted(directory.glob("*/*.parquet"))
+
+
+def history_stamp(directory: Path = HISTORY_DIR) -> float:
+    """歷史檔的最後修改時間 (無檔案為 0)；查詢結果以此當快取 key"""
+    return max((path.stat().st_mtime for path in history_files(directory)), default=0.0)
+
+
+def _month_path(directory: Path, broker: str, month: pd.Period) -> Path:
+    return directory / broker / f"{month.strftime('%Y-%m')}.parquet"
+
+
+def _replace(path: Path, frame: pd.DataFrame) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".parquet.tmp")
+    frame.to_parquet(tmp, index=False)
+    os.replace(tmp, path)  # 查詢端不會讀到寫一半的檔案
+
+
+def write_history(rows: pd.DataFrame, directory: Path = HISTORY_DIR) -> list[Path]:
+    """把 rows (需含 分點 / 日期 欄) 併入各 (分點, 月) 檔；rows 中的日期視為整日替換"""
+    if rows.empty:
+        return []
+    rows = rows.assign(**{DATE_COL: pd.to_datetime(rows[DATE_COL]), ID_COL: rows[ID_COL].astype(str)})
+    written = []
+    for (broker, month), part in rows.groupby(
+        [rows[BROKER_COL].astype(str), rows[DATE_COL].dt.to_period("M")], sort=True
+    ):
+        path = _month_path(directory, broker, month)
+        if path.exists():
+            existing = pd.read_parquet(path)
+            existing = existing[~existing[DATE_COL].isin(part[DATE_COL].unique())]
+            part = pd.concat([existing, part], ignore_index=True)
+        _replace(path, part.sort_values([DATE_COL, ID_COL], kind="mergesort"))
+        written.append(path)
+    log.info(f"🗄️ 本機歷史檔已更新 {len(written)} 個 (分點, 月)。")
+    return written
+
+
+def repair_history(
+    broker: str, prices: dict[tuple[str, str], float], directory: Path = HISTORY_DIR
+) -> list[Path]:
+    """把補到的股價 ((日期, 代號) → 收盤價) 寫回該分點的月檔，估算張數同 Sheet 以 int(金額 / 股價) 重算。
+
+    只改寫含有對應列的檔案；本機沒有該月檔案時略過。回傳改寫的檔案。
+    """
+    if not prices:
+        return []
+    lookup = pd.Series(prices)
+    lookup.index = pd.MultiIndex.from_arrays(
+        [pd.to_datetime(lookup.index.get_level_values(0)), lookup.index.get_level_values(1).astype(str)]
+    )
+    written = []
+    for month in sorted(set(lookup.index.get_level_values(0).to_period("M"))):
+        path = _month_path(directory, broker, month)
+        if not path.exists():
+            continue
+        frame = pd.read_parquet(path)
+        keys = pd.MultiIndex.from_arrays([frame[DATE_COL], frame[ID_COL].astype(str)])
+        price = lookup.reindex(keys).to_numpy(dtype=float)
+        amount = pd.to_numeric(frame[AMOUNT_COL].astype(str).str.replace(",", ""), errors="coerce").to_numpy()
+        hit = ~np.isnan(price) & ~np.isnan(amount)
+        if not hit.any():
+            continue
+        if pd.api.types.is_integer_dtype(frame[PRICE_COL]):
+            frame[PRICE_COL] = frame[PRICE_COL].astype(float)
+        frame.loc[hit, PRICE_COL] = price[hit]
+        frame.loc[hit, SHEETS_COL] = np.trunc(amount[hit] / price[hit]).astype(np.int64)
+        _replace(path, frame)
+        written.append(path)
+    if written:
+        log.info(f"🗄️ {broker} 歷史檔已補上股價 ({len(written)} 個月檔)。")
+    return written
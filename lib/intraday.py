@@ -0,0 +1,135 @@
+"""盤中輪詢的變動偵測 — 每次輪詢只處理數字有變動的股票，只推播新命中的告警。
+
+富邦分點頁盤中會持續更新；每次輪詢把解析出的每一列算成摘要 (hash)，
+與上一次輪詢比對，只有新出現或數字變動的股票才需要查價與跑告警。
+摘要要等該股跑完告警 (有新命中時要推播成功) 才記下 (commit / mark_notified)；
+查價失敗或推播失敗的股票下次輪詢仍視為有變動，會重試。
+已推播過的 (規則, 代號) 記在狀態檔 (INTRADAY_STATE_FILE)，同一天不重複推播；
+狀態跨日自動重置。
+"""
+from __future__ import annotations
+
+import datetime
+import hashlib
+import json
+from collections.abc import Iterable
+from pathlib import Path
+from zoneinfo import ZoneInfo
+
+from lib.alerts import AlertHit
+from lib.logger import get_logger
+from settings import (
+    DEADLINE_TZ,
+    INTRADAY_END,
+    INTRADAY_START,
+    INTRADAY_STATE_FILE,
+)
+
+log = get_logger(__name__)
+
+_DIGEST_FIELDS = ("name", "buy_sheets", "sell_sheets", "net_amt")
+
+
+def row_digest(stock: dict) -> str:
+    """單列解析結果的摘要 (名稱 + 買進 / 賣出張數 + 買賣超金額)"""
+    raw = "|".join(str(stock.get(key, "")) for key in _DIGEST_FIELDS)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def project_streaks(base: tuple[int, int], sheets) -> tuple[int, int]:
+    """以前一交易日的 (連買, 連賣) 天數推估含今日盤中的連續天數 (規則同 AlertState.apply_day)"""
+    buy, sell = base
+    value = sheets or 0
+    return (buy + 1 if value > 0 else 0, sell + 1 if value < 0 else 0)
+
+
+def in_trading_hours(
+    now: datetime.datetime | None = None,
+    start: str = INTRADAY_START,
+    end: str = INTRADAY_END,
+) -> bool:
+    """週一至週五、DEADLINE_TZ 時間 start ~ end 之間"""
+    tz = ZoneInfo(DEADLINE_TZ)
+    local = (now or datetime.datetime.now(tz)).astimezone(tz)
+    if local.weekday() >= 5:
+        return False
+    clock = local.time()
+    return datetime.time.fromisoformat(start) <= clock <= datetime.time.fromisoformat(end)
+
+
+class IntradayState:
+    """單日的輪詢狀態：各股上次的摘要與已推播的 (規則, 代號)"""
+
+    def __init__(
+        self,
+        date: str,
+        digests: dict[str, str] | None = None,
+        notified: Iterable[tuple[str, str]] = (),
+        path: Path = INTRADAY_STATE_FILE,
+    ) -> None:
+        self.date = date
+        self.digests = dict(digests or {})  # 已處理完的摘要 (會寫入狀態檔)
+        self.pending: dict[str, str] = {}  # diff 找到、尚未處理完的摘要
+        self.notified: set[tuple[str, str]] = {tuple(key) for key in notified}
+        self.path = path
+
+    def diff(self, stocks: list[dict]) -> list[dict]:
+        """回傳新出現或數字有變動的股票；本次的摘要先暫存，處理完再 commit"""
+        changed = []
+        for stock in stocks:
+            stock_id = str(stock["id"])
+            digest = row_digest(stock)
+            if self.digests.get(stock_id) != digest:
+                changed.append(stock)
+                self.pending[stock_id] = digest
+        return changed
+
+    def commit(self, stock_ids: Iterable[str]) -> None:
+        """記下已處理完的股票的摘要，之後數字沒變就不再處理"""
+        for stock_id in stock_ids:
+            digest = self.pending.pop(str(stock_id), None)
+            if digest is not None:
+                self.digests[str(stock_id)] = digest
+
+    def new_hits(self, hits: list[AlertHit]) -> list[AlertHit]:
+        """濾掉今天已推播過的命中 (同一批內重複的也只留一筆)"""
+        fresh: dict[tuple[str, str], AlertHit] = {}
+        for hit in hits:
+            key = (hit.rule_name, hit.stock_id)
+            if key not in self.notified:
+                fresh.setdefault(key, hit)
+        return list(fresh.values())
+
+    def mark_notified(self, hits: Iterable[AlertHit]) -> None:
+        """推播成功後記下，同一天不再推播；命中的股票也一併 commit 摘要"""
+        hits = list(hits)
+        self.notified.update((hit.rule_name, hit.stock_id) for hit in hits)
+        self.commit(hit.stock_id for hit in hits)
+
+    @classmethod
+    def load(cls, date: str, path: Path = INTRADAY_STATE_FILE) -> IntradayState:
+        """讀取狀態檔；不存在、損毀或不是同一天時回傳空狀態"""
+        if not path.exists():
+            return cls(date, path=path)
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            log.warning(f"⚠️ 盤中狀態檔讀取失敗，視為新的一天: {e}")
+            return cls(date, path=path)
+        if raw.get("date") != date:
+            return cls(date, path=path)
+        return cls(date, raw.get("digests"), raw.get("notified", []), path=path)
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "date": self.date,
+                    "digests": self.digests,
+                    "notified": sorted(list(key) for key in self.notified),
+                },
+                f,
+                ensure_ascii=False,
+            )
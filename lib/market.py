@@ -0,0 +1,148 @@
+"""批次行情 — 一次下載整批股票的收盤價 / 前一日收盤 / 成交量。
+
+取代逐檔 yf.Ticker(...).history()：先以 .TW (上市) 批次下載，缺的再以 .TWO (上櫃) 補一批，
+最多兩次請求。
+"""
+from __future__ import annotations
+
+from collections.abc import Iterable
+
+import numpy as np
+import pandas as pd
+import yfinance as yf
+
+from lib.logger import get_logger
+from settings import PRICE_CALL_TIMEOUT
+
+log = get_logger(__name__)
+
+MARKET_COLUMNS = ["close", "prev_close", "volume"]
+_SUFFIXES = (".TW", ".TWO")
+
+
+def _download(
+    tickers: list[str], period: str | None = None, auto_adjust: bool = True, **window
+) -> pd.DataFrame:
+    """window 可改用 start / end 指定區間 (end 不含)。
+
+    auto_adjust=False 時 Close 為當日實際成交收盤 (不做除權息還原)。
+    """
+    try:
+        data = yf.download(
+            tickers,
+            period=period,
+            **window,
+            auto_adjust=auto_adjust,
+            progress=False,
+            threads=True,
+            timeout=PRICE_CALL_TIMEOUT,
+        )
+    except Exception as e:  # yfinance 內部例外類型多變
+        log.warning(f"⚠️ yfinance 批次下載失敗 ({len(tickers)} 檔): {e}")
+        return pd.DataFrame()
+    return data if data is not None else pd.DataFrame()
+
+
+def _field(data: pd.DataFrame, name: str, tickers: list[str]) -> pd.DataFrame:
+    """取出單一欄位 (Close / Volume) 成為 日期 × ticker 的 DataFrame"""
+    values = data[name]
+    if isinstance(values, pd.Series):
+        values = values.to_frame(tickers[0])
+    index = pd.DatetimeIndex(values.index)
+    if index.tz is not None:
+        index = index.tz_localize(None)
+    values.index = index.normalize()
+    return values
+
+
+def _snapshot(data: pd.DataFrame, tickers: list[str], target: pd.Timestamp) -> pd.DataFrame:
+    """從批次結果取出 target 當日的 close / volume 與前一個有資料交易日的 close"""
+    if data.empty:
+        return pd.DataFrame(columns=MARKET_COLUMNS)
+    close = _field(data, "Close", tickers)
+    volume = _field(data, "Volume", tickers)
+    if target not in close.index:
+        return pd.DataFrame(columns=MARKET_COLUMNS)
+
+    before = close[close.index < target]
+    prev_close = before.ffill().iloc[-1] if not before.empty else pd.Series(np.nan, close.columns)
+    snap = pd.DataFrame({
+        "close": close.loc[target],
+        "prev_close": prev_close,
+        "volume": volume.loc[target],
+    })
+    return snap.dropna(subset=["close"])
+
+
+def fetch_market_data(
+    stock_ids: Iterable[str],
+    target_date: str | pd.Timestamp,
+    period: str = "1mo",
+) -> pd.DataFrame:
+    """批次取得 target_date 的行情。
+
+    回傳以代號為 index 的 DataFrame，欄位 close / prev_close / volume (股)；
+    查無資料的股票不會出現在結果中。prev_close 為前一個有資料交易日的收盤 (可能為 NaN)。
+    """
+    target = pd.Timestamp(target_date).normalize()
+    pending = sorted({str(s) for s in stock_ids})
+    frames: list[pd.DataFrame] = []
+
+    for suffix in _SUFFIXES:
+        if not pending:
+            break
+        tickers = [f"{sid}{suffix}" for sid in pending]
+        snap = _snapshot(_download(tickers, period), tickers, target)
+        snap.index = [str(t).removesuffix(suffix) for t in snap.index]
+        frames.append(snap)
+        pending = [sid for sid in pending if sid not in snap.index]
+
+    if pending:
+        log.debug(f"   yfinance 查無行情: {', '.join(pending)}")
+
+    frames = [f for f in frames if not f.empty]
+    if not frames:
+        return pd.DataFrame(columns=MARKET_COLUMNS, index=pd.Index([], name="代號"))
+    result = pd.concat(frames)[MARKET_COLUMNS].astype(float)
+    result.index.name = "代號"
+    return result
+
+
+def fetch_close_history(
+    stock_ids: Iterable[str],
+    start: str | pd.Timestamp,
+    end: str | pd.Timestamp,
+) -> pd.DataFrame:
+    """批次取得 start ~ end (含) 的收盤價，回傳 日期 × 代號 的 DataFrame。
+
+    與 fetch_market_data 相同：先 .TW 一批，整段查無的再以 .TWO 補一批。
+    用來回填 Sheet 的歷史收盤價，取未還原的實際收盤 (auto_adjust=False)：
+    還原價會隨之後的除權息變動，和當天寫入的收盤價對不上。
+    """
+    start_ts = pd.Timestamp(start).normalize()
+    end_ts = pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+    pending = sorted({str(s) for s in stock_ids})
+    frames: list[pd.DataFrame] = []
+
+    for suffix in _SUFFIXES:
+        if not pending:
+            break
+        tickers = [f"{sid}{suffix}" for sid in pending]
+        data = _download(
+            tickers,
+            auto_adjust=False,
+            start=start_ts.strftime("%Y-%m-%d"),
+            end=end_ts.strftime("%Y-%m-%d"),
+        )
+        if data.empty:
+            continue
+        close = _field(data, "Close", tickers).dropna(axis=1, how="all")
+        close.columns = [str(t).removesuffix(suffix) for t in close.columns]
+        frames.append(close)
+        pending = [sid for sid in pending if sid not in close.columns]
+
+    if not frames:
+        return pd.DataFrame(index=pd.DatetimeIndex([], name="日期"))
+    result = pd.concat(frames, axis=1).astype(float)
+    result.index.name = "日期"
+    return result
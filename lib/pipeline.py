@@ -0,0 +1,168 @@
+"""簡易 stage DAG 執行器 — 宣告每個 stage 的輸入 / 輸出，彼此獨立的 stage 併行執行。
+
+stage 之間以記憶體中的 dict 交接資料 (DataFrame 不落地)，每個 stage 記錄耗時與狀態。
+stage 函式以關鍵字參數接收 inputs，回傳 {output_name: value}；
+after 只排先後、不交接資料：列出的 stage 結束 (不論成功與否) 後才開始，不在 pipeline 中的名稱忽略。
+raise PipelineStop 代表「正常提早結束」(例如週末不開盤)，其餘 stage 一律略過。
+"""
+from __future__ import annotations
+
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from graphlib import CycleError, TopologicalSorter
+from typing import Any
+
+from lib.logger import get_logger
+
+log = get_logger(__name__)
+
+
+class PipelineStop(Exception):
+    """stage 要求整條 pipeline 正常結束 (不算失敗)"""
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    fn: Callable[..., dict[str, Any] | None]
+    inputs: tuple[str, ...] = ()
+    outputs: tuple[str, ...] = ()
+    # optional stage 失敗只記錄警告；下游仍會因缺少輸入而略過
+    optional: bool = False
+    # 須等這些 stage 結束才開始 (例如改寫 Sheet 前先讓讀取端跑完)；其結果不影響本 stage
+    after: tuple[str, ...] = ()
+
+
+@dataclass
+class StageResult:
+    name: str
+    status: str  # ok / failed / skipped / stopped
+    seconds: float = 0.0
+    error: str = ""
+    optional: bool = False
+
+
+@dataclass
+class PipelineResult:
+    results: dict[str, StageResult] = field(default_factory=dict)
+    outputs: dict[str, Any] = field(default_factory=dict)
+    stopped: bool = False
+
+    @property
+    def ok(self) -> bool:
+        """沒有非 optional 的 stage 失敗"""
+        return not any(r.status == "failed" for r in self.results.values() if not r.optional)
+
+    def timings(self) -> dict[str, float]:
+        return {name: r.seconds for name, r in self.results.items() if r.status != "skipped"}
+
+
+class Pipeline:
+    """由 stages 的 inputs / outputs 推出依賴關係並驗證 (重名輸出、缺少來源、循環)"""
+
+    def __init__(self, stages: Iterable[Stage], provided: Iterable[str] = ()) -> None:
+        self.stages = {stage.name: stage for stage in stages}
+        producers: dict[str, str] = {}
+        for stage in self.stages.values():
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError(f"輸出 {output} 重複: {producers[output]} / {stage.name}")
+                producers[output] = stage.name
+
+        provided = set(provided)
+        self.deps: dict[str, set[str]] = {}
+        for stage in self.stages.values():
+            missing = [i for i in stage.inputs if i not in producers and i not in provided]
+            if missing:
+                raise ValueError(f"stage {stage.name} 缺少輸入來源: {', '.join(missing)}")
+            self.deps[stage.name] = {producers[i] for i in stage.inputs if i in producers}
+        self.after = {
+            stage.name: {name for name in stage.after if name in self.stages} - self.deps[stage.name]
+            for stage in self.stages.values()
+        }
+        try:
+            graph = {name: self.deps[name] | self.after[name] for name in self.stages}
+            self.order = tuple(TopologicalSorter(graph).static_order())
+        except CycleError as e:
+            raise ValueError(f"stage 依賴有循環: {e.args[1]}") from e
+
+    def run(
+        self,
+        initial: dict[str, Any] | None = None,
+        max_workers: int = 4,
+        on_stage_done: Callable[[StageResult], None] | None = None,
+    ) -> PipelineResult:
+        """on_stage_done 在每個 stage 結束 (含略過) 時於主執行緒呼叫，可用來即時追蹤耗時"""
+        context: dict[str, Any] = dict(initial or {})
+        result = PipelineResult(outputs=context)
+        done: set[str] = set()
+        running: dict[Future, str] = {}
+        started: dict[str, float] = {}
+
+        def finish(name: str, status: str, error: str = "") -> None:
+            seconds = time.perf_counter() - started[name] if name in started else 0.0
+            stage_result = StageResult(
+                name, status, seconds, error, optional=self.stages[name].optional
+            )
+            result.results[name] = stage_result
+            done.add(name)
+            if on_stage_done is not None:
+                on_stage_done(stage_result)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while len(done) < len(self.stages):
+                for name in self.order:
+                    if name in done or name in started:
+                        continue
+                    if result.stopped:
+                        finish(name, "skipped")
+                        continue
+                    deps = self.deps[name]
+                    if not (deps | self.after[name]) <= done:
+                        continue
+                    if any(result.results[d].status != "ok" for d in deps):
+                        finish(name, "skipped", "上游未完成")
+                        continue
+                    stage = self.stages[name]
+                    kwargs = {i: context[i] for i in stage.inputs}
+                    log.info(f"▶️ stage {name} 開始")
+                    started[name] = time.perf_counter()
+                    running[pool.submit(stage.fn, **kwargs)] = name
+
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    stage = self.stages[name]
+                    try:
+                        outputs = future.result() or {}
+                    except PipelineStop as e:
+                        log.info(f"⏹️ stage {name} 要求結束 pipeline: {e}")
+                        result.stopped = True
+                        finish(name, "stopped", str(e))
+                        continue
+                    except Exception as e:  # stage 例外類型不一；記錄後讓下游略過
+                        level = log.warning if stage.optional else log.error
+                        level(f"❌ stage {name} 失敗: {e}")
+                        finish(name, "failed", str(e))
+                        continue
+                    absent = [o for o in stage.outputs if o not in outputs]
+                    if absent:
+                        log.error(f"❌ stage {name} 未產出: {', '.join(absent)}")
+                        finish(name, "failed", f"未產出 {', '.join(absent)}")
+                        continue
+                    context.update({o: outputs[o] for o in stage.outputs})
+                    finish(name, "ok")
+                    log.info(f"✅ stage {name} 完成 ({result.results[name].seconds:.2f}s)")
+        return result
+
+
+def log_timings(result: PipelineResult) -> None:
+    """依耗時列出各 stage 結果"""
+    log.info("⏱️ stage 耗時:")
+    for r in sorted(result.results.values(), key=lambda r: r.seconds, reverse=True):
+        suffix = f" ({r.error})" if r.error else ""
+        log.info(f"   {r.name:<12} {r.status:<8} {r.seconds:6.2f}s{suffix}")
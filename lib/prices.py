@@ -0,0 +1,221 @@
+"""逐檔股價查詢的保護層 — 單次呼叫期限、整段預算與斷路器。
+
+yfinance 狀況不好時，逐檔查詢每檔都會卡到逾時；這裡讓查詢：
+- 每次呼叫從開始執行起最多等 call_timeout 秒 (逾時的呼叫直接放棄，不等它結束)；
+  還在排隊、尚未開始的呼叫不算逾時，也不計入斷路器
+- 放棄的呼叫仍佔著執行緒；所有執行緒都卡住時不再排入新的查詢，其餘股票略過 (STALLED)
+- 整段最多花 budget_seconds 秒，超過後其餘股票略過
+- 連續失敗 (錯誤 / 逾時) 達門檻即斷路 (CircuitBreaker)，斷路期間其餘股票直接略過；
+  查無資料 (下市、代號錯誤) 代表服務有回應，不計入失敗
+
+略過 / 查無的股票記錄在 PriceResolution.skipped，供事後補修。
+趕時限時可改用 price cache (各股最近一次取得的收盤價) 代替即時查詢。
+lookup 的約定：查到回傳 float，查無回傳 None 或 0，服務錯誤直接 raise。
+"""
+from __future__ import annotations
+
+import json
+import time
+from collections.abc import Callable, Iterable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pandas as pd
+
+from lib.logger import get_logger
+from settings import (
+    PRICE_BREAKER_COOLDOWN,
+    PRICE_BREAKER_THRESHOLD,
+    PRICE_CACHE_FILE,
+    PRICE_CALL_TIMEOUT,
+    PRICE_LOOKUP_CONCURRENCY,
+    PRICE_STAGE_BUDGET,
+)
+
+log = get_logger(__name__)
+
+# 略過原因
+NOT_FOUND = "not_found"
+ERROR = "error"
+TIMEOUT = "timeout"
+BUDGET = "budget"
+CIRCUIT_OPEN = "circuit_open"
+STALLED = "stalled"  # 執行緒全被逾時的呼叫佔住
+
+
+class CircuitBreaker:
+    """連續失敗達 threshold 次後斷路；任何一次成功都會歸零。
+
+    斷路 cooldown 秒後進入半開：放行查詢，再失敗一次立刻重新斷路。
+    同一個 breaker 可跨多次 resolve 共用 (例如 history.py 逐日補抓)。
+    """
+
+    def __init__(
+        self,
+        threshold: int = PRICE_BREAKER_THRESHOLD,
+        cooldown: float = PRICE_BREAKER_COOLDOWN,
+    ) -> None:
+        self.threshold = max(1, int(threshold))
+        self.cooldown = cooldown
+        self.consecutive_failures = 0
+        self.opened_at: float | None = None
+
+    @property
+    def is_open(self) -> bool:
+        if self.opened_at is None:
+            return False
+        return time.monotonic() - self.opened_at < self.cooldown
+
+    def record_success(self) -> None:
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= self.threshold and not self.is_open:
+            self.opened_at = time.monotonic()
+            log.warning(
+                f"⛔ 股價查詢連續失敗 {self.consecutive_failures} 次，斷路 {self.cooldown:.0f}s，"
+                "期間其餘股票略過。"
+            )
+
+
+@dataclass
+class PriceResolution:
+    prices: dict[str, float] = field(default_factory=dict)
+    skipped: dict[str, str] = field(default_factory=dict)  # stock_id → 略過原因
+
+
+class PriceResolver:
+    def __init__(
+        self,
+        lookup: Callable[[str], float | None],
+        call_timeout: float = PRICE_CALL_TIMEOUT,
+        budget_seconds: float = PRICE_STAGE_BUDGET,
+        max_workers: int = PRICE_LOOKUP_CONCURRENCY,
+        breaker: CircuitBreaker | None = None,
+    ) -> None:
+        self.lookup = lookup
+        self.call_timeout = call_timeout
+        self.budget_seconds = budget_seconds
+        self.max_workers = max(1, int(max_workers))
+        self.breaker = breaker or CircuitBreaker()
+
+    def _finish(self, future: Future, stock_id: str, result: PriceResolution) -> None:
+        try:
+            price = future.result()
+        except Exception as e:  # yfinance 內部例外類型多變
+            log.debug(f"   股價查詢 {stock_id} 失敗: {e}")
+            result.skipped[stock_id] = ERROR
+            self.breaker.record_failure()
+            return
+        if price and price > 0:
+            result.prices[stock_id] = float(price)
+            self.breaker.record_success()
+        else:
+            result.skipped[stock_id] = NOT_FOUND  # 服務正常回應，只是該檔沒有資料：不影響斷路器
+
+    def _timed(self, stock_id: str, started: dict[str, float]) -> float | None:
+        """在執行緒內記下實際開始時間，期限從這裡起算 (排隊的時間不算)"""
+        started[stock_id] = time.monotonic()
+        return self.lookup(stock_id)
+
+    def resolve(self, stock_ids: Iterable[str]) -> PriceResolution:
+        result = PriceResolution()
+        pending = list(dict.fromkeys(str(s) for s in stock_ids))
+        budget_end = time.monotonic() + self.budget_seconds
+        in_flight: dict[Future, str] = {}
+        started: dict[str, float] = {}  # 由執行緒寫入
+        abandoned: list[Future] = []  # 逾時放棄、可能仍佔著執行緒的呼叫
+        pool = ThreadPoolExecutor(max_workers=self.max_workers)
+
+        def skip_pending(reason: str) -> None:
+            for stock_id in pending:
+                result.skipped[stock_id] = reason
+            pending.clear()
+
+        try:
+            while pending or in_flight:
+                now = time.monotonic()
+                abandoned = [f for f in abandoned if not f.done()]
+                if pending and self.breaker.is_open:
+                    skip_pending(CIRCUIT_OPEN)
+                elif pending and now >= budget_end:
+                    log.warning(f"⏰ 股價查詢超過預算 {self.budget_seconds:.0f}s，其餘股票略過。")
+                    skip_pending(BUDGET)
+                elif pending and len(abandoned) >= self.max_workers:
+                    log.warning(f"⏰ {len(abandoned)} 個股價查詢卡住未返回，其餘股票略過。")
+                    skip_pending(STALLED)
+                while pending and len(in_flight) + len(abandoned) < self.max_workers:
+                    stock_id = pending.pop(0)
+                    in_flight[pool.submit(self._timed, stock_id, started)] = stock_id
+                if not in_flight:
+                    break
+
+                # 尚未開始的呼叫最晚在 now + call_timeout 開始，醒來重新檢查即可趕上它的期限
+                deadlines = [
+                    started[sid] + self.call_timeout if sid in started else now + self.call_timeout
+                    for sid in in_flight.values()
+                ]
+                done, _ = wait(
+                    in_flight,
+                    timeout=max(0.0, min(budget_end, *deadlines) - time.monotonic()),
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    self._finish(future, in_flight.pop(future), result)
+
+                # 逾時的呼叫不再等待 (執行緒無法中斷，交給背景自然結束)
+                now = time.monotonic()
+                for future, stock_id in list(in_flight.items()):
+                    began = started.get(stock_id)
+                    if began is not None and now >= began + self.call_timeout:
+                        reason = TIMEOUT
+                        self.breaker.record_failure()
+                        abandoned.append(future)
+                    elif now >= budget_end:
+                        reason = BUDGET
+                        if began is not None:
+                            abandoned.append(future)
+                    else:
+                        continue
+                    del in_flight[future]
+                    future.cancel()  # 尚未開始的才會真的取消
+                    result.skipped[stock_id] = reason
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        if result.skipped:
+            log.warning(
+                f"⚠️ {len(result.skipped)} 檔股價未取得: "
+                + ", ".join(f"{sid}({reason})" for sid, reason in result.skipped.items())
+            )
+        return result
+
+
+def load_price_cache(path: Path = PRICE_CACHE_FILE) -> dict[str, tuple[str, float]]:
+    """讀取 stock_id → (日期, 收盤價)；檔案不存在或損毀時回傳空 dict"""
+    if not path.exists():
+        return {}
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            raw = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        log.warning(f"⚠️ 股價快取讀取失敗: {e}")
+        return {}
+    return {str(sid): (str(date), float(price)) for sid, (date, price) in raw.items()}
+
+
+def update_price_cache(
+    market: pd.DataFrame, date: str, path: Path = PRICE_CACHE_FILE
+) -> None:
+    """把 market (index 代號，含 close) 中取得的收盤價寫進快取"""
+    closes = market["close"].dropna() if "close" in market.columns else pd.Series(dtype=float)
+    if closes.empty:
+        return
+    cache = load_price_cache(path)
+    cache.update({str(sid): (date, float(price)) for sid, price in closes.items() if price > 0})
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("w", encoding="utf-8") as f:
+        json.dump({sid: list(value) for sid, value in cache.items()}, f, ensure_ascii=False)
@@ -0,0 +1,175 @@
+"""缺價補修佇列 — 記錄寫入 Sheet 時查無股價的 (日期, 代號)，事後批次補價。
+
+main.py / history.py 查不到股價時會寫入 收盤價 0 / "查無"、估算張數 0 / "N/A"，
+這些列若不修正會一直拉低 app.py 的均價與告警的集中度。
+佇列存成 JSON (PRICE_REPAIR_FILE)；repair_prices.py 批次抓價後只回寫受影響的儲存格。
+"""
+from __future__ import annotations
+
+import json
+from collections.abc import Iterable, Iterator
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from gspread.utils import rowcol_to_a1
+
+from lib.logger import get_logger
+from settings import PRICE_REPAIR_FILE
+
+log = get_logger(__name__)
+
+_DATE_COL = "日期"
+_ID_COL = "代號"
+_AMOUNT_COL = "買賣超金額(千)"
+_PRICE_COL = "收盤價"
+_SHEETS_COL = "估算張數"
+_MISSING_MARKERS = {"", "0", "0.0", "查無", "N/A"}
+
+
+def _normalize_date(value) -> str:
+    return str(value).strip().replace("/", "-")
+
+
+@dataclass
+class RepairItem:
+    date: str
+    stock_id: str
+    reason: str = ""
+    attempts: int = 0
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return self.date, self.stock_id
+
+
+class RepairQueue:
+    """以 (日期, 代號) 去重的補修佇列"""
+
+    def __init__(self, items: Iterable[RepairItem] = (), path: Path = PRICE_REPAIR_FILE) -> None:
+        self.path = path
+        self._items: dict[tuple[str, str], RepairItem] = {}
+        for item in items:
+            self._items.setdefault(item.key, item)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __iter__(self) -> Iterator[RepairItem]:
+        return iter(sorted(self._items.values(), key=lambda item: item.key))
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        return key in self._items
+
+    def add(self, date, stock_id, reason: str = "") -> bool:
+        """加入一筆；已在佇列中時不重複加入，回傳是否為新項目"""
+        item = RepairItem(_normalize_date(date), str(stock_id), reason)
+        if item.key in self._items:
+            return False
+        self._items[item.key] = item
+        return True
+
+    def remove(self, keys: Iterable[tuple[str, str]]) -> None:
+        for key in keys:
+            self._items.pop(key, None)
+
+    def record_attempt(self, keys: Iterable[tuple[str, str]], max_attempts: int) -> list[RepairItem]:
+        """累計補修失敗次數；超過 max_attempts 的項目移出佇列並回傳"""
+        dropped: list[RepairItem] = []
+        for key in keys:
+            item = self._items.get(key)
+            if item is None:
+                continue
+            item.attempts += 1
+            if item.attempts >= max_attempts:
+                dropped.append(self._items.pop(key))
+        return dropped
+
+    @classmethod
+    def load(cls, path: Path = PRICE_REPAIR_FILE) -> RepairQueue:
+        if not path.exists():
+            return cls(path=path)
+        try:
+            with path.open("r", encoding="utf-8") as f:
+                raw = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            log.warning(f"⚠️ 補修佇列讀取失敗，視為空佇列: {e}")
+            return cls(path=path)
+        return cls((RepairItem(**entry) for entry in raw.get("items", [])), path=path)
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("w", encoding="utf-8") as f:
+            json.dump({"items": [asdict(item) for item in self]}, f, ensure_ascii=False, indent=2)
+
+
+def enqueue_missing(
+    date, reasons: dict[str, str], path: Path = PRICE_REPAIR_FILE
+) -> int:
+    """把單日查無股價的股票 (stock_id → 原因) 加入佇列，回傳新增筆數"""
+    if not reasons:
+        return 0
+    queue = RepairQueue.load(path)
+    added = sum(queue.add(date, stock_id, reason) for stock_id, reason in reasons.items())
+    queue.save()
+    if added:
+        log.info(f"🧰 已將 {added} 筆缺價資料加入補修佇列 (共 {len(queue)} 筆)。")
+    return added
+
+
+def is_missing_price(price_cell, sheets_cell) -> bool:
+    """收盤價為 0 / 查無，或估算張數為 N/A 時視為缺價"""
+    price = str(price_cell).strip().replace(",", "")
+    return price in _MISSING_MARKERS or str(sheets_cell).strip() == "N/A"
+
+
+def find_missing_rows(all_values: list[list[str]]) -> list[tuple[str, str]]:
+    """掃描 Sheet 原始列，找出缺價的 (日期, 代號)"""
+    if not all_values:
+        return []
+    header = all_values[0]
+    date_i, id_i = header.index(_DATE_COL), header.index(_ID_COL)
+    price_i, sheets_i = header.index(_PRICE_COL), header.index(_SHEETS_COL)
+    width = max(date_i, id_i, price_i, sheets_i) + 1
+    missing = []
+    for row in all_values[1:]:
+        row = row + [""] * (width - len(row))
+        if row[date_i] and row[id_i] and is_missing_price(row[price_i], row[sheets_i]):
+            missing.append((_normalize_date(row[date_i]), str(row[id_i])))
+    return missing
+
+
+def plan_cell_updates(
+    all_values: list[list[str]],
+    prices: dict[tuple[str, str], float],
+) -> tuple[list[dict], set[tuple[str, str]]]:
+    """依補到的股價產生 batch_update 用的儲存格更新 (只含 收盤價 / 估算張數)。
+
+    回傳 (updates, 實際修到的 key)；估算張數沿用 main.py 的 int(金額 / 股價)。
+    """
+    if not all_values or not prices:
+        return [], set()
+    header = all_values[0]
+    date_i, id_i = header.index(_DATE_COL), header.index(_ID_COL)
+    amount_i = header.index(_AMOUNT_COL)
+    price_i, sheets_i = header.index(_PRICE_COL), header.index(_SHEETS_COL)
+
+    updates: list[dict] = []
+    repaired: set[tuple[str, str]] = set()
+    for row_no, row in enumerate(all_values[1:], start=2):
+        if len(row) <= max(date_i, id_i, amount_i):
+            continue
+        key = (_normalize_date(row[date_i]), str(row[id_i]))
+        price = prices.get(key)
+        if price is None or price <= 0:
+            continue
+        try:
+            amount = float(str(row[amount_i]).replace(",", ""))
+        except ValueError:
+            continue
+        updates.append({"range": rowcol_to_a1(row_no, price_i + 1), "values": [[price]]})
+        updates.append({
+            "range": rowcol_to_a1(row_no, sheets_i + 1),
+            "values": [[int(amount / price)]],
+        })
+        repaired.add(key)
+    return updates, repaired
@@ -0,0 +1,174 @@
+"""週 / 月彙總表 — 長區間的個股圖表改掃彙總列，不必每次重新彙總逐日資料。
+
+每檔每期 (週一 / 月初起算) 一列：買賣超金額(千) / 估算張數 / 買超天數 / 賣超天數 / 交易日數
+的合計、期末收盤價，以及 成本 = 金額(千) / 張數 (VWAP 式的平均成本)。
+金額等欄位皆可相加，新日期到來時只需彙總新增的列，再加回受影響的期 (extend)，
+不必重掃整份歷史。欄位名稱沿用原始資料 (日期 = 期初)，可直接交給 HistoryIndex / chart_series。
+查詢區間的頭尾若切過某一期，該期只用區間內的逐日列重新彙總 (stock_range 的 daily)，
+圖表不會混入區間外的日子。
+"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from lib.history_index import DateLike, HistoryIndex
+from settings import ROLLUP_MONTHLY_AFTER_DAYS, ROLLUP_WEEKLY_AFTER_DAYS
+
+ID_COL = "代號"
+NAME_COL = "名稱"
+DATE_COL = "日期"
+AMOUNT_COL = "買賣超金額(千)"
+SHEETS_COL = "估算張數"
+CLOSE_COL = "收盤價"
+COST_COL = "成本"
+
+WEEKLY = "W"
+MONTHLY = "M"
+FREQS = (WEEKLY, MONTHLY)
+FREQ_LABELS = {WEEKLY: "週", MONTHLY: "月"}
+
+# 可直接相加的欄位；名稱 / 收盤價取期內最後一筆
+_SUM_COLS = [AMOUNT_COL, SHEETS_COL, "買超天數", "賣超天數", "交易日數"]
+_LAST_COLS = [NAME_COL, CLOSE_COL]
+_KEY = [ID_COL, DATE_COL]
+
+
+def rollup_freq(
+    days: int,
+    weekly_after: int = ROLLUP_WEEKLY_AFTER_DAYS,
+    monthly_after: int = ROLLUP_MONTHLY_AFTER_DAYS,
+) -> str | None:
+    """區間天數超過門檻時改用的彙總頻率；較短的區間回傳 None (用逐日資料)"""
+    if days > monthly_after:
+        return MONTHLY
+    if days > weekly_after:
+        return WEEKLY
+    return None
+
+
+def period_start(value: DateLike, freq: str) -> pd.Timestamp:
+    """value 所在那一期的期初 (週一 / 月初)"""
+    return pd.Timestamp(value).to_period(freq).start_time
+
+
+def period_end(value: DateLike, freq: str) -> pd.Timestamp:
+    """value 所在那一期的最後一日 (週日 / 月底)"""
+    return pd.Timestamp(value).to_period(freq).end_time.normalize()
+
+
+def _aggregate(rows: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """逐日列 → 每 (代號, 期初) 一列的合計 (index 為 (代號, 日期))"""
+    rows = rows.sort_values(DATE_COL, kind="mergesort")
+    sheets = rows[SHEETS_COL]
+    return (
+        rows.assign(
+            **{
+                ID_COL: rows[ID_COL].astype(str),
+                DATE_COL: rows[DATE_COL].dt.to_period(freq).dt.start_time,
+                "買超天數": (sheets > 0).astype(np.int64),
+                "賣超天數": (sheets < 0).astype(np.int64),
+                "交易日數": np.int64(1),
+            }
+        )
+        .groupby(_KEY, sort=True)
+        .agg(
+            {
+                **{col: "sum" for col in _SUM_COLS},
+                **{col: "last" for col in _LAST_COLS},
+            }
+        )
+    )
+
+
+def _finish(table: pd.DataFrame) -> pd.DataFrame:
+    sheets = table[SHEETS_COL].to_numpy(dtype=float)
+    amount = table[AMOUNT_COL].to_numpy(dtype=float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cost = np.where(sheets != 0, amount / sheets, np.nan)
+    return table.assign(**{COST_COL: np.round(cost, 2)})
+
+
+class Rollups:
+    """各頻率的彙總表與其 (代號, 日期) 索引。extend 回傳新物件，舊物件可繼續被讀取。"""
+
+    def __init__(self, tables: dict[str, pd.DataFrame], rows: int) -> None:
+        self.tables = tables  # freq → index 為 (代號, 日期) 的彙總表 (不含成本)
+        self.rows = rows  # 已彙總的逐日列數
+        self.indexes = {
+            # 彙總表的 index 本來就依 (代號, 日期) 排序
+            freq: HistoryIndex(_finish(table).reset_index(), presorted=True)
+            for freq, table in tables.items()
+        }
+
+    @classmethod
+    def build(cls, df: pd.DataFrame) -> Rollups:
+        """從完整的逐日資料建立"""
+        if df.empty:
+            return cls({}, 0)
+        return cls({freq: _aggregate(df, freq) for freq in FREQS}, len(df))
+
+    def extend(self, new_rows: pd.DataFrame) -> Rollups:
+        """加入新增的逐日列：只彙總新列，再加回同一 (代號, 期) 的既有合計"""
+        if new_rows.empty:
+            return self
+        if not self.tables:
+            return Rollups.build(new_rows)
+        tables = {}
+        for freq, table in self.tables.items():
+            added = _aggregate(new_rows, freq)
+            overlap = added.index.intersection(table.index)
+            merged = table.copy()
+            merged.loc[overlap, _SUM_COLS] += added.loc[overlap, _SUM_COLS]
+            merged.loc[overlap, _LAST_COLS] = added.loc[overlap, _LAST_COLS]
+            fresh = added.loc[added.index.difference(overlap)]
+            tables[freq] = pd.concat([merged, fresh]).sort_index(kind="mergesort") if len(fresh) else merged
+        return Rollups(tables, self.rows + len(new_rows))
+
+    def stock_range(
+        self,
+        freq: str,
+        stock_id: str,
+        start: DateLike | None = None,
+        end: DateLike | None = None,
+        daily: HistoryIndex | None = None,
+    ) -> pd.DataFrame:
+        """單檔落在 [start, end] 的各期 (依期初遞增)。
+
+        頭尾只部分落在區間內的期：給了 daily (逐日資料的索引) 時只以區間內的逐日列重新彙總，
+        頭一期的日期改為區間起日；沒給 daily 則略過這兩期。
+        """
+        if freq not in self.indexes:
+            return pd.DataFrame()
+        start = None if start is None else pd.Timestamp(start)
+        end = None if end is None else pd.Timestamp(end)
+        table = self.indexes[freq].stock_range(
+            stock_id, None if start is None else period_start(start, freq), end
+        )
+        if table.empty:
+            return table
+
+        partial = np.zeros(len(table), dtype=bool)
+        if start is not None:
+            partial[0] |= table[DATE_COL].iloc[0] < start
+        if end is not None:
+            partial[-1] |= period_end(table[DATE_COL].iloc[-1], freq) > end
+        if not partial.any():
+            return table
+
+        parts = [table[~partial]]
+        if daily is not None:
+            for period in table.loc[partial, DATE_COL]:
+                lo = period if start is None else max(period, start)
+                hi = period_end(period, freq) if end is None else min(period_end(period, freq), end)
+                rows = daily.stock_range(stock_id, lo, hi)
+                if not rows.empty:
+                    parts.append(_finish(_aggregate(rows, freq)).reset_index().assign(**{DATE_COL: lo}))
+        return pd.concat(parts, ignore_index=True).sort_values(DATE_COL, kind="mergesort").reset_index(drop=True)
+
+
+def sync_rollups(previous: Rollups | None, frame: pd.DataFrame, stable_rows: int = 0) -> Rollups:
+    """資料集換版時更新彙總：前 stable_rows 列正是 previous 彙總過的列時只加尾端，否則重建"""
+    if previous is not None and stable_rows and previous.rows == stable_rows:
+        return previous.extend(frame.iloc[stable_rows:])
+    return Rollups.build(frame)
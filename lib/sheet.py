@@ -1,15 +1,29 @@
 """Google Sheet 共用連線與讀寫工具"""
 from __future__ import annotations
 
+import datetime
 import json
 import os
+import time
 from collections.abc import Iterable
+from dataclasses import dataclass
 
 import gspread
 import pandas as pd
+from gspread.utils import rowcol_to_a1
 from oauth2client.service_account import ServiceAccountCredentials
 
-from settings import JSON_FILE_NAME, SHEET_NAME
+from lib.logger import get_logger
+from settings import (
+    APP_DATA_MAX_AGE,
+    BROKER_ID,
+    BROKER_TAB_PREFIX,
+    JSON_FILE_NAME,
+    META_SHEET_TAB,
+    SHEET_NAME,
+)
+
+log = get_logger(__name__)
 
 SCOPE = [
     "https://spreadsheets.google.com/feeds",
@@ -51,20 +65,42 @@ def open_sheet(sheet_name: str = SHEET_NAME):
     return client.open(sheet_name).sheet1
 
 
-def load_dataframe(
-    sheet_name: str = SHEET_NAME,
+def broker_tab(broker: str) -> str | None:
+    """分點對應的分頁名稱；預設分點寫在第一頁，回傳 None"""
+    return None if broker == BROKER_ID else f"{BROKER_TAB_PREFIX}{broker}"
+
+
+def open_broker_sheet(
+    broker: str, header: list[str] | None = None, sheet_name: str = SHEET_NAME
+):
+    """打開分點的資料分頁 (預設分點為第一頁)。
+
+    分頁不存在時：有給 header 就建立並寫入標題列，否則拋出 WorksheetNotFound。
+    """
+    tab = broker_tab(broker)
+    if tab is None:
+        return open_sheet(sheet_name)
+    spreadsheet = get_client().open(sheet_name)
+    try:
+        return spreadsheet.worksheet(tab)
+    except gspread.exceptions.WorksheetNotFound:
+        if header is None:
+            raise
+        ws = spreadsheet.add_worksheet(title=tab, rows=1000, cols=len(header))
+        ws.update([header])
+        return ws
+
+
+def _to_dataframe(
+    headers: list[str],
+    rows: list[list[str]],
     numeric_cols: Iterable[str] = DEFAULT_NUMERIC_COLS,
     date_col: str = DEFAULT_DATE_COL,
     id_col: str = DEFAULT_ID_COL,
-) -> pd.DataFrame | None:
-    """讀取 sheet 並回傳預處理過的 DataFrame。Sheet 空時回傳 None。"""
-    sheet = open_sheet(sheet_name)
-    data = sheet.get_all_values()
-    if not data:
-        return None
-
-    headers = data[0]
-    rows = data[1:]
+) -> pd.DataFrame:
+    """原始字串列 → 型別化 DataFrame (數字去千分位、日期轉 datetime、代號轉字串)"""
+    width = len(headers)
+    rows = [row[:width] + [""] * (width - len(row)) for row in rows]
     df = pd.DataFrame(rows, columns=headers)
 
     for col in numeric_cols:
@@ -81,6 +117,187 @@ def load_dataframe(
     return df
 
 
+def load_dataframe(
+    sheet_name: str = SHEET_NAME,
+    numeric_cols: Iterable[str] = DEFAULT_NUMERIC_COLS,
+    date_col: str = DEFAULT_DATE_COL,
+    id_col: str = DEFAULT_ID_COL,
+) -> pd.DataFrame | None:
+    """讀取 sheet 並回傳預處理過的 DataFrame。Sheet 空時回傳 None。"""
+    sheet = open_sheet(sheet_name)
+    data = sheet.get_all_values()
+    if not data:
+        return None
+
+    return _to_dataframe(data[0], data[1:], numeric_cols, date_col, id_col)
+
+
+def load_broker_dataframe(broker: str, sheet_name: str = SHEET_NAME) -> pd.DataFrame | None:
+    """讀取分點分頁 (預設分點為第一頁) 的型別化 DataFrame；分頁不存在或為空時回傳 None"""
+    try:
+        sheet = open_broker_sheet(broker, sheet_name=sheet_name)
+    except gspread.exceptions.WorksheetNotFound:
+        return None
+    data = sheet.get_all_values()
+    if not data:
+        return None
+    return _to_dataframe(data[0], data[1:])
+
+
+def load_recent_dataframe(
+    trading_days: int,
+    sheet_name: str = SHEET_NAME,
+    numeric_cols: Iterable[str] = DEFAULT_NUMERIC_COLS,
+    date_col: str = DEFAULT_DATE_COL,
+    id_col: str = DEFAULT_ID_COL,
+) -> pd.DataFrame | None:
+    """只讀取最近 trading_days 個交易日的資料。Sheet 空時回傳 None。
+
+    先讀標題列與日期欄找出起始列，再只抓該列到最後一列的範圍。
+    日期欄仍是整欄讀取 (隨歷史長度成長，但只有一欄)；其餘欄位只讀視窗內的列
+    (Sheet 大致依日期附加，起始列之後幾乎都是視窗內的資料)。
+    """
+    sheet = open_sheet(sheet_name)
+    headers = sheet.row_values(1)
+    if not headers or date_col not in headers:
+        return None
+
+    date_idx = headers.index(date_col) + 1
+    raw_dates = sheet.col_values(date_idx)[1:]
+    if not raw_dates:
+        return None
+
+    dates = pd.to_datetime(
+        pd.Series(raw_dates).str.replace("/", "-"), errors="coerce"
+    )
+    recent = dates.dropna().drop_duplicates().nlargest(trading_days)
+    if recent.empty:
+        return None
+    in_window = dates >= recent.min()
+    first_row = int(in_window.to_numpy().argmax()) + 2  # +1 header, +1 1-based
+
+    last_cell = rowcol_to_a1(len(raw_dates) + 1, len(headers))
+    rows = sheet.get(f"A{first_row}:{last_cell}")
+    # 起始列之後若夾雜較舊日期 (非依序附加)，以日期欄過濾掉
+    keep = in_window.to_numpy()[first_row - 2:]
+    rows = [row for row, ok in zip(rows, keep, strict=False) if ok]
+
+    return _to_dataframe(headers, rows, numeric_cols, date_col, id_col)
+
+
+# ---- 修訂標記 (Meta 分頁) ----
+# 寫入端每次改動第一頁後遞增 revision，並記下這次是「附加」還是「改寫」：
+# append 代表前 stable_rows 筆資料列未變動、新資料接在其後，讀取端只需抓尾端。
+APPEND = "append"
+REWRITE = "rewrite"
+_META_HEADER = ["revision", "kind", "stable_rows", "updated_at"]
+
+
+@dataclass(frozen=True)
+class SheetRevision:
+    revision: int
+    kind: str
+    stable_rows: int
+    updated_at: str
+
+    def appended_to(self, cached: SheetRevision | None, cached_rows: int) -> bool:
+        """cached 之後只多了一次附加寫入，且附加前的資料列正是快取中的 cached_rows 筆"""
+        return (
+            cached is not None
+            and self.revision == cached.revision + 1
+            and self.kind == APPEND
+            and self.stable_rows == cached_rows
+        )
+
+
+def read_revision(spreadsheet) -> SheetRevision | None:
+    """讀取 Meta 分頁的修訂標記；分頁不存在或內容不完整時回傳 None"""
+    try:
+        values = spreadsheet.worksheet(META_SHEET_TAB).get("A2:D2")
+    except gspread.exceptions.WorksheetNotFound:
+        return None
+    if not values or len(values[0]) < len(_META_HEADER):
+        return None
+    revision, kind, stable_rows, updated_at = values[0][: len(_META_HEADER)]
+    try:
+        return SheetRevision(int(revision), kind, int(stable_rows), updated_at)
+    except ValueError:
+        return None
+
+
+def load_revision(sheet_name: str = SHEET_NAME) -> SheetRevision | None:
+    """讀取試算表目前的修訂標記"""
+    return read_revision(get_client().open(sheet_name))
+
+
+def bump_revision(sheet, kind: str, stable_rows: int = 0) -> None:
+    """sheet (第一頁) 寫入後遞增修訂標記。標記寫入失敗只記 warning，不影響資料寫入。"""
+    try:
+        spreadsheet = sheet.spreadsheet
+        current = read_revision(spreadsheet)
+        try:
+            meta = spreadsheet.worksheet(META_SHEET_TAB)
+        except gspread.exceptions.WorksheetNotFound:
+            meta = spreadsheet.add_worksheet(title=META_SHEET_TAB, rows=2, cols=len(_META_HEADER))
+        revision = current.revision + 1 if current is not None else 1
+        meta.update([
+            _META_HEADER,
+            [revision, kind, int(stable_rows), datetime.datetime.now().isoformat(timespec="seconds")],
+        ])
+    except Exception as e:  # gspread 例外類型多樣；app 最遲 APP_DATA_MAX_AGE 後仍會完整重新載入
+        log.warning(f"⚠️ 修訂標記寫入失敗: {e}")
+
+
+def load_rows_after(
+    skip_rows: int,
+    sheet_name: str = SHEET_NAME,
+    numeric_cols: Iterable[str] = DEFAULT_NUMERIC_COLS,
+    date_col: str = DEFAULT_DATE_COL,
+    id_col: str = DEFAULT_ID_COL,
+) -> pd.DataFrame:
+    """只讀取前 skip_rows 筆資料列之後的尾端 (型別處理同 load_dataframe)"""
+    sheet = open_sheet(sheet_name)
+    headers = sheet.row_values(1)
+    first_row = skip_rows + 2  # +1 header, +1 1-based
+    rows = sheet.get(f"{rowcol_to_a1(first_row, 1)}:{rowcol_to_a1(sheet.row_count, len(headers))}")
+    return _to_dataframe(headers, rows, numeric_cols, date_col, id_col)
+
+
+@dataclass(frozen=True)
+class SheetData:
+    """app.py 快取的資料集與其對應的修訂標記"""
+    frame: pd.DataFrame
+    revision: SheetRevision | None
+    loaded_at: float  # 上次完整載入的時間 (time.time())
+    stable_rows: int = 0  # 前幾列與上一版相同 (只讀尾端時)；完整載入為 0
+
+
+def refresh_dataframe(
+    previous: SheetData | None,
+    sheet_name: str = SHEET_NAME,
+    max_age: float = APP_DATA_MAX_AGE,
+) -> SheetData:
+    """依修訂標記更新 previous：沒變動回傳 previous 本身；只有一次附加寫入時只抓尾端列，
+    其餘情況 (改寫、錯過多次寫入、無標記、超過 max_age) 完整重新載入。
+    """
+    revision = load_revision(sheet_name)
+    if (
+        previous is not None
+        and revision is not None
+        and time.time() - previous.loaded_at < max_age
+    ):
+        if revision == previous.revision:
+            return previous
+        if revision.appended_to(previous.revision, len(previous.frame)):
+            tail = load_rows_after(len(previous.frame), sheet_name)
+            log.info(f"➕ 資料集只有附加寫入，讀取尾端 {len(tail)} 筆。")
+            frame = previous.frame if tail.empty else pd.concat([previous.frame, tail], ignore_index=True)
+            return SheetData(frame, revision, previous.loaded_at, len(previous.frame))
+
+    df = load_dataframe(sheet_name)
+    return SheetData(df if df is not None else pd.DataFrame(), revision, time.time())
+
+
 def overwrite_sheet(sheet, dataframe: pd.DataFrame) -> None:
     """以 DataFrame 全量覆寫 sheet (含 header)"""
     payload = [dataframe.columns.values.tolist()] + dataframe.values.tolist()
@@ -0,0 +1,123 @@
+"""每日快照 — main.py 寫出當日資料與行情，notify.py 直接取用，免重新讀 Sheet / 抓股價。
+
+目錄結構 (SNAPSHOT_DIR)：
+    manifest.json   日期、產生時間、前一個交易日、檔案清單
+    rows.parquet    當日寫入 Sheet 的列 (欄位同 Sheet)
+    market.parquet  當日行情 (index 代號；close / prev_close / volume)
+    watchlist.json  (選用) 當時的 watchlist，讓 notify 連 Watchlist 分頁都不必讀
+"""
+from __future__ import annotations
+
+import datetime
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+import pandas as pd
+
+from lib.logger import get_logger
+from settings import SNAPSHOT_DIR, SNAPSHOT_MAX_AGE_HOURS
+
+log = get_logger(__name__)
+
+SNAPSHOT_VERSION = 1
+_MANIFEST = "manifest.json"
+_ROWS = "rows.parquet"
+_MARKET = "market.parquet"
+_WATCHLIST = "watchlist.json"
+
+
+@dataclass
+class Snapshot:
+    date: pd.Timestamp
+    prev_date: str  # 寫入前 Sheet 中當日以前的最新日期；Sheet 原本為空時為 ""
+    created_at: datetime.datetime
+    rows: pd.DataFrame
+    market: pd.DataFrame
+    watchlist: dict[str, dict] | None = None
+
+    @property
+    def date_str(self) -> str:
+        return self.date.strftime("%Y-%m-%d")
+
+
+def write_snapshot(
+    rows: pd.DataFrame,
+    market: pd.DataFrame,
+    target_date: str,
+    prev_date: str,
+    watchlist: dict[str, dict] | None = None,
+    directory: Path = SNAPSHOT_DIR,
+) -> Path:
+    """寫出快照；manifest 最後寫入，讀取端看到 manifest 即代表資料檔已完整。"""
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest_path = directory / _MANIFEST
+    manifest_path.unlink(missing_ok=True)
+
+    rows.to_parquet(directory / _ROWS, index=False)
+    market.to_parquet(directory / _MARKET)
+    files = {"rows": _ROWS, "market": _MARKET}
+    if watchlist is not None:
+        with (directory / _WATCHLIST).open("w", encoding="utf-8") as f:
+            json.dump(watchlist, f, ensure_ascii=False)
+        files["watchlist"] = _WATCHLIST
+
+    manifest = {
+        "version": SNAPSHOT_VERSION,
+        "date": target_date,
+        "prev_date": prev_date,
+        "created_at": datetime.datetime.now().isoformat(timespec="seconds"),
+        "rows": len(rows),
+        "files": files,
+    }
+    with manifest_path.open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest_path
+
+
+def load_snapshot(
+    target_date: datetime.date | str,
+    directory: Path = SNAPSHOT_DIR,
+    max_age_hours: float = SNAPSHOT_MAX_AGE_HOURS,
+) -> Snapshot | None:
+    """讀取 target_date 的快照。不存在、日期不符或超過 max_age_hours 視為過期，回傳 None。"""
+    manifest_path = directory / _MANIFEST
+    if not manifest_path.exists():
+        return None
+    try:
+        with manifest_path.open("r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        log.warning(f"⚠️ 快照 manifest 讀取失敗: {e}")
+        return None
+
+    if manifest.get("version") != SNAPSHOT_VERSION:
+        return None
+    if manifest.get("date") != pd.Timestamp(target_date).strftime("%Y-%m-%d"):
+        return None
+    created_at = datetime.datetime.fromisoformat(manifest["created_at"])
+    if datetime.datetime.now() - created_at > datetime.timedelta(hours=max_age_hours):
+        return None
+
+    files = manifest.get("files", {})
+    try:
+        rows = pd.read_parquet(directory / files["rows"])
+        market = pd.read_parquet(directory / files["market"])
+        watchlist = None
+        if "watchlist" in files:
+            with (directory / files["watchlist"]).open("r", encoding="utf-8") as f:
+                watchlist = json.load(f)
+    except (KeyError, OSError, ValueError) as e:
+        log.warning(f"⚠️ 快照資料讀取失敗: {e}")
+        return None
+
+    rows["日期"] = pd.to_datetime(rows["日期"])
+    rows["代號"] = rows["代號"].astype(str)
+    return Snapshot(
+        date=pd.Timestamp(manifest["date"]),
+        prev_date=str(manifest.get("prev_date", "")),
+        created_at=created_at,
+        rows=rows,
+        market=market,
+        watchlist=watchlist,
+    )
@@ -1,14 +1,31 @@
 """Watchlist 讀寫模組 — 單一資料來源為 Google Sheet 的 Watchlist 分頁。
 
-欄位格式：id | name | category
+欄位格式：id | name | category；標題列的 E1 為版本格 (每次修改 +1)。
 此設計讓 Streamlit Cloud (會寫入) 與 GitHub Actions (會讀取) 看到同一份資料，
 避免檔案系統 ephemeral 導致的同步問題。
+
+增刪改都是列層級的操作 (附加一列 / 改兩格 / 刪一列)，與版本 +1 放在同一個 batchUpdate；
+送出前先比對版本格 (compare-and-set)，同一批內再建立以新版本號為 id 的 developer metadata：
+兩個 session 從同一版本同時送出時，後到的一批因 id 重複而整批失敗 (Sheets 對整批原子套用)，
+後到的一方重新讀取再試，不會互相蓋掉，也不會有清空整頁的空窗期。
+在 Sheets UI 手動插入 / 刪除 / 排序列不會改版本格，因此以列號寫入 (改兩格 / 刪列) 前
+另比對目標列的 A 欄仍是預期的代號 (與版本格同一個 batch_get)，不符同樣視為衝突。
+列操作回傳寫入後的新 snapshot (在本機推算，不必重新讀取)；WatchlistCache 以此在 process 內
+快取整份 watchlist，過期時只讀版本格驗證。
 """
 from __future__ import annotations
 
+import bisect
+import threading
+import time
+from collections.abc import Callable
+from dataclasses import dataclass, field
 from typing import Any
 
-from settings import SHEET_NAME, WATCHLIST_SHEET_TAB
+from lib.logger import get_logger
+from settings import SHEET_NAME, WATCHLIST_REVALIDATE_SECONDS, WATCHLIST_SHEET_TAB
+
+log = get_logger(__name__)
 
 _DEFAULT_CATEGORY_EMOJIS = {
     "AI/高速傳輸": "🚀",
@@ -18,6 +35,63 @@ _DEFAULT_CATEGORY_EMOJIS = {
 }
 
 _HEADERS = ["id", "name", "category"]
+# 版本格：D1 放標籤、E1 放版本號；放在標題列，刪除任何股票列都不會移動它
+_VERSION_LABEL = "version"
+_VERSION_CELL = "E1"
+_VERSION_COL = 4  # E (0 起算)
+_MAX_RETRIES = 3
+# 版本鎖的 developer metadata：id = 基底 + 版本號 (整份試算表唯一)
+_LOCK_KEY = "watchlist_version"
+_LOCK_ID_BASE = 1_000_000_000
+
+
+class WatchlistConflict(RuntimeError):
+    """Watchlist 在讀取之後被其他 session 改過 (版本格不符)"""
+
+
+@dataclass(frozen=True)
+class WatchlistSnapshot:
+    """某一版本的 Watchlist：rows 保留 Sheet 順序，row_numbers 為各代號所在的 Sheet 列號 (1 起算)"""
+    version: int
+    rows: list[dict[str, str]]
+    row_numbers: dict[str, int]
+    used_rows: int = 0  # A:C 有資料的列數 (含標題列)；附加的列落在其下一列
+    _watchlist: dict[str, dict] = field(default_factory=dict, repr=False, compare=False)
+
+    @property
+    def watchlist(self) -> dict[str, dict]:
+        """{stock_id: {name, category, category_display}}，同一 snapshot 只轉換一次"""
+        if not self._watchlist and self.rows:
+            self._watchlist.update(_to_watchlist(self.rows))
+        return self._watchlist
+
+    def appended(self, version: int, stock_id: str, name: str, category: str) -> WatchlistSnapshot:
+        row = max(self.used_rows, 1) + 1
+        return WatchlistSnapshot(
+            version,
+            [*self.rows, {"id": stock_id, "name": name, "category": category}],
+            {**self.row_numbers, stock_id: row},
+            row,
+        )
+
+    def updated(self, version: int, stock_id: str, name: str, category: str) -> WatchlistSnapshot:
+        rows = [
+            {"id": stock_id, "name": name, "category": category} if item["id"] == stock_id else item
+            for item in self.rows
+        ]
+        return WatchlistSnapshot(version, rows, self.row_numbers, self.used_rows)
+
+    def without(self, version: int, stock_ids: list[str]) -> WatchlistSnapshot:
+        removed = {str(sid) for sid in stock_ids}
+        deleted = sorted(self.row_numbers[sid] for sid in removed)
+        # 刪除的列以下的列號往上位移
+        row_numbers = {
+            sid: row - bisect.bisect_left(deleted, row)
+            for sid, row in self.row_numbers.items()
+            if sid not in removed
+        }
+        rows = [item for item in self.rows if item["id"] not in removed]
+        return WatchlistSnapshot(version, rows, row_numbers, self.used_rows - len(deleted))
 
 
 def _get_worksheet() -> Any:
@@ -32,28 +106,35 @@ def _get_worksheet() -> Any:
         return spreadsheet.worksheet(WATCHLIST_SHEET_TAB)
     except gspread.exceptions.WorksheetNotFound:
         ws = spreadsheet.add_worksheet(
-            title=WATCHLIST_SHEET_TAB, rows=100, cols=len(_HEADERS)
+            title=WATCHLIST_SHEET_TAB, rows=100, cols=len(_HEADERS) + 2
         )
-        ws.update([_HEADERS])
+        ws.update([_HEADERS + [_VERSION_LABEL, 0]])
         return ws
 
 
-def _load_rows(ws: Any = None) -> list[dict[str, str]]:
-    """從 Sheet 讀出 [{id, name, category}]，保留原始順序。"""
-    ws = ws if ws is not None else _get_worksheet()
-    values = ws.get_all_values()
+def _parse_version(values: list[list[str]]) -> int:
+    """E1 的版本號；舊分頁沒有版本格時為 0"""
+    try:
+        return int(str(values[0][0]).strip())
+    except (IndexError, ValueError):
+        return 0
+
+
+def _parse_rows(values: list[list[str]]) -> tuple[list[dict[str, str]], dict[str, int]]:
+    """原始儲存格 → ([{id, name, category}], {id: Sheet 列號})，保留原始順序。"""
     if not values:
-        return []
+        return [], {}
     header = values[0]
     try:
         idx_id = header.index("id")
         idx_name = header.index("name")
         idx_cat = header.index("category")
     except ValueError:
-        return []
+        return [], {}
 
     rows: list[dict[str, str]] = []
-    for row in values[1:]:
+    row_numbers: dict[str, int] = {}
+    for row_number, row in enumerate(values[1:], start=2):
         # 容忍列長度不足
         padded = row + [""] * (len(header) - len(row))
         stock_id = str(padded[idx_id]).strip()
@@ -64,13 +145,222 @@ def _load_rows(ws: Any = None) -> list[dict[str, str]]:
             "name": str(padded[idx_name]).strip() or stock_id,
             "category": str(padded[idx_cat]).strip() or "其他",
         })
-    return rows
+        row_numbers[stock_id] = row_number
+    return rows, row_numbers
+
+
+def _load_rows(ws: Any = None) -> list[dict[str, str]]:
+    """從 Sheet 讀出 [{id, name, category}]，保留原始順序。"""
+    ws = ws if ws is not None else _get_worksheet()
+    return _parse_rows(ws.get_all_values())[0]
+
+
+def read_snapshot(ws: Any = None) -> WatchlistSnapshot:
+    """一次請求讀出 id / name / category 三欄與版本格"""
+    ws = ws if ws is not None else _get_worksheet()
+    cells, version = ws.batch_get(["A:C", _VERSION_CELL])
+    rows, row_numbers = _parse_rows([list(row) for row in cells])
+    return WatchlistSnapshot(_parse_version(version), rows, row_numbers, len(cells))
+
+
+def read_version(ws: Any = None) -> int:
+    """只讀版本格 (一個儲存格的小請求)"""
+    ws = ws if ws is not None else _get_worksheet()
+    return _parse_version(ws.get(_VERSION_CELL))
+
+
+def _cell_text(values: list[list[str]]) -> str:
+    try:
+        return str(values[0][0]).strip()
+    except IndexError:
+        return ""
+
+
+def _check(ws: Any, snapshot: WatchlistSnapshot, rows: dict[int, str]) -> None:
+    """送出前比對版本格；要以列號寫入時 (rows = {列號: 代號}) 一併確認各列 A 欄仍是該代號。"""
+    if rows:
+        cells, *ids = ws.batch_get([_VERSION_CELL, *(f"A{row}" for row in rows)])
+        version = _parse_version(cells)
+        moved = [sid for sid, values in zip(rows.values(), ids, strict=True) if _cell_text(values) != sid]
+    else:
+        version, moved = read_version(ws), []
+    if version != snapshot.version:
+        raise WatchlistConflict(f"Watchlist 已被其他 session 修改 (讀取時版本 {snapshot.version})")
+    if moved:
+        raise WatchlistConflict(f"Watchlist 的列已被手動移動 ({', '.join(moved)})")
+
+
+def _text_cells(values: list[str]) -> dict:
+    return {"values": [{"userEnteredValue": {"stringValue": str(v)}} for v in values]}
+
+
+def _version_lock(ws: Any, version: int) -> list[dict]:
+    """批次內的版本鎖：刪掉前一版的 metadata、建立這一版的。
+
+    metadataId 重複時 createDeveloperMetadata 失敗，整批 (含列操作) 都不會套用；
+    刪除找不到的舊 id (舊分頁、一次性搬運後) 不會失敗。
+    """
+    return [
+        {
+            "deleteDeveloperMetadata": {
+                "dataFilter": {"developerMetadataLookup": {"metadataId": _LOCK_ID_BASE + version - 1}}
+            }
+        },
+        {
+            "createDeveloperMetadata": {
+                "developerMetadata": {
+                    "metadataId": _LOCK_ID_BASE + version,
+                    "metadataKey": _LOCK_KEY,
+                    "metadataValue": str(version),
+                    "location": {"sheetId": ws.id},
+                    "visibility": "DOCUMENT",
+                }
+            }
+        },
+    ]
+
+
+def _commit(
+    ws: Any, snapshot: WatchlistSnapshot, requests: list[dict], rows: dict[int, str] | None = None
+) -> int:
+    """比對版本後，把列操作、版本 +1 與版本鎖放在同一個 batchUpdate 送出 (Sheets 對整批原子套用)。
+
+    rows 為列操作會以列號寫入的 {列號: 代號}，送出前確認這些列沒有被手動移動。
+    版本或列內容與 snapshot 不同 (送出前比對，或比對後被搶先寫入而版本鎖失敗) 時拋出
+    WatchlistConflict，呼叫端應重新讀取後再試。回傳新版本。
+    """
+    _check(ws, snapshot, rows or {})
+    version = snapshot.version + 1
+    bump = {
+        "updateCells": {
+            "range": {
+                "sheetId": ws.id,
+                "startRowIndex": 0,
+                "endRowIndex": 1,
+                "startColumnIndex": _VERSION_COL - 1,
+                "endColumnIndex": _VERSION_COL + 1,
+            },
+            "rows": [{"values": [
+                {"userEnteredValue": {"stringValue": _VERSION_LABEL}},
+                {"userEnteredValue": {"numberValue": version}},
+            ]}],
+            "fields": "userEnteredValue",
+        }
+    }
+    try:
+        ws.spreadsheet.batch_update({"requests": [*requests, bump, *_version_lock(ws, version)]})
+    except Exception as e:  # gspread 的 APIError；版本已變表示是版本鎖擋下的
+        if read_version(ws) != snapshot.version:
+            raise WatchlistConflict(
+                f"Watchlist 已被其他 session 搶先修改 (讀取時版本 {snapshot.version})"
+            ) from e
+        raise
+    return version
+
+
+def append_stock(
+    ws: Any, snapshot: WatchlistSnapshot, stock_id: str, name: str, category: str
+) -> WatchlistSnapshot:
+    """在表尾附加一列 (不重寫其他列)；分頁還沒有股票時先補寫標題列。回傳寫入後的 snapshot。"""
+    header = [] if snapshot.rows else [{
+        "updateCells": {
+            "range": {
+                "sheetId": ws.id,
+                "startRowIndex": 0,
+                "endRowIndex": 1,
+                "startColumnIndex": 0,
+                "endColumnIndex": len(_HEADERS),
+            },
+            "rows": [_text_cells(_HEADERS)],
+            "fields": "userEnteredValue",
+        }
+    }]
+    version = _commit(ws, snapshot, [*header, {
+        "appendCells": {
+            "sheetId": ws.id,
+            "rows": [_text_cells([stock_id, name, category])],
+            "fields": "userEnteredValue",
+        }
+    }])
+    return snapshot.appended(version, stock_id, name, category)
+
+
+def update_stock(
+    ws: Any, snapshot: WatchlistSnapshot, stock_id: str, name: str, category: str
+) -> WatchlistSnapshot:
+    """只改該股票那一列的 name / category 兩格。回傳寫入後的 snapshot。"""
+    row = snapshot.row_numbers[str(stock_id)]
+    version = _commit(ws, snapshot, [{
+        "updateCells": {
+            "range": {
+                "sheetId": ws.id,
+                "startRowIndex": row - 1,
+                "endRowIndex": row,
+                "startColumnIndex": 1,
+                "endColumnIndex": 3,
+            },
+            "rows": [_text_cells([name, category])],
+            "fields": "userEnteredValue",
+        }
+    }], {row: str(stock_id)})
+    return snapshot.updated(version, str(stock_id), name, category)
+
+
+def delete_stocks(ws: Any, snapshot: WatchlistSnapshot, stock_ids: list[str]) -> WatchlistSnapshot:
+    """刪除多檔股票所在的列 (由下往上刪，前面的刪除不會讓後面的列號位移)。回傳寫入後的 snapshot。"""
+    targets = {snapshot.row_numbers[str(sid)]: str(sid) for sid in stock_ids}
+    version = _commit(ws, snapshot, [
+        {
+            "deleteDimension": {
+                "range": {"sheetId": ws.id, "dimension": "ROWS", "startIndex": row - 1, "endIndex": row}
+            }
+        }
+        for row in sorted(targets, reverse=True)
+    ], targets)
+    return snapshot.without(version, stock_ids)
+
+
+# 修改函式：(ws, snapshot) → (是否新增 / 移除, 寫入後的 snapshot)
+_Mutation = Callable[[Any, WatchlistSnapshot], tuple[bool, WatchlistSnapshot]]
+
+
+def _adding(stock_id: str, name: str, category: str) -> _Mutation:
+    """新增；已存在則只更新該列的 name/category (回傳 False)"""
+    def mutate(ws: Any, snapshot: WatchlistSnapshot) -> tuple[bool, WatchlistSnapshot]:
+        if stock_id in snapshot.row_numbers:
+            return False, update_stock(ws, snapshot, stock_id, name, category)
+        return True, append_stock(ws, snapshot, stock_id, name, category)
+
+    return mutate
+
+
+def _removing(stock_id: str) -> _Mutation:
+    """移除；找不到回傳 False (不寫入)"""
+    def mutate(ws: Any, snapshot: WatchlistSnapshot) -> tuple[bool, WatchlistSnapshot]:
+        if stock_id not in snapshot.row_numbers:
+            return False, snapshot
+        return True, delete_stocks(ws, snapshot, [stock_id])
+
+    return mutate
+
+
+def _with_retries(
+    ws: Any, mutate: _Mutation, snapshot: WatchlistSnapshot | None = None
+) -> tuple[bool, WatchlistSnapshot]:
+    """以 snapshot (未給則讀取最新版本) 套用 mutate；衝突時重新讀取再試，用完重試次數仍衝突則拋出"""
+    for attempt in range(1, _MAX_RETRIES):
+        try:
+            return mutate(ws, snapshot if snapshot is not None else read_snapshot(ws))
+        except WatchlistConflict:
+            log.info(f"🔁 Watchlist 版本衝突，重新讀取後再試 ({attempt}/{_MAX_RETRIES})")
+            snapshot = None
+    return mutate(ws, read_snapshot(ws))
 
 
 def _save_rows(rows: list[dict[str, str]], ws: Any = None) -> None:
-    """把完整 rows 覆寫回 Sheet (含 header)。"""
+    """把完整 rows 覆寫回 Sheet (含 header，版本 +1)。只給一次性搬運使用；日常增刪請用列操作。"""
     ws = ws if ws is not None else _get_worksheet()
-    payload: list[list[str]] = [list(_HEADERS)]
+    payload: list[list] = [_HEADERS + [_VERSION_LABEL, read_version(ws) + 1]]
     for item in rows:
         payload.append([
             str(item.get("id", "")),
@@ -83,7 +373,10 @@ def _save_rows(rows: list[dict[str, str]], ws: Any = None) -> None:
 
 def load_watchlist(ws: Any = None) -> dict[str, dict]:
     """回傳 {stock_id: {name, category, category_display}} dict。"""
-    rows = _load_rows(ws)
+    return _to_watchlist(_load_rows(ws))
+
+
+def _to_watchlist(rows: list[dict[str, str]]) -> dict[str, dict]:
     result: dict[str, dict] = {}
     for item in rows:
         stock_id = item["id"]
@@ -108,37 +401,18 @@ def add_stock(
     category: str,
     ws: Any = None,
 ) -> bool:
-    """新增股票到 watchlist。已存在則更新 name/category，回傳 False。"""
+    """新增股票到 watchlist (附加一列)。已存在則只更新該列的 name/category，回傳 False。"""
     ws = ws if ws is not None else _get_worksheet()
-    rows = _load_rows(ws)
-    stock_id = str(stock_id)
-    for item in rows:
-        if item["id"] == stock_id:
-            item["name"] = name
-            item["category"] = category
-            _save_rows(rows, ws)
-            return False
-    rows.append({"id": stock_id, "name": name, "category": category})
-    _save_rows(rows, ws)
-    return True
+    return _with_retries(ws, _adding(str(stock_id), name, category))[0]
 
 
 def remove_stock(stock_id: str, ws: Any = None) -> bool:
-    """從 watchlist 移除股票。找不到回傳 False。"""
+    """從 watchlist 移除股票 (只刪該列)。找不到回傳 False。"""
     ws = ws if ws is not None else _get_worksheet()
-    rows = _load_rows(ws)
-    stock_id = str(stock_id)
-    before = len(rows)
-    rows = [item for item in rows if item["id"] != stock_id]
-    if len(rows) == before:
-        return False
-    _save_rows(rows, ws)
-    return True
+    return _with_retries(ws, _removing(str(stock_id)))[0]
 
 
-def get_categories(ws: Any = None) -> list[str]:
-    """回傳目前所有使用中的分類名稱 (保留出現順序)，含預設分類兜底。"""
-    rows = _load_rows(ws)
+def _categories(rows: list[dict[str, str]]) -> list[str]:
     seen: list[str] = []
     for item in rows:
         cat = item["category"]
@@ -150,5 +424,86 @@ def get_categories(ws: Any = None) -> list[str]:
     return seen
 
 
+def get_categories(ws: Any = None) -> list[str]:
+    """回傳目前所有使用中的分類名稱 (保留出現順序)，含預設分類兜底。"""
+    return _categories(_load_rows(ws))
+
+
+class WatchlistCache:
+    """process 內共用的 watchlist 快取 (app.py)。
+
+    - ttl 內直接回傳快取，不發任何請求
+    - 過期時只讀版本格 (一個儲存格)；版本沒變就沿用，變了才讀整頁
+    - add / remove 以快取的 snapshot 做 compare-and-set，成功後直接換上本機推算的新 snapshot，
+      UI 不必等待重新讀取；衝突時重新讀取再試 (仍衝突則拋出 WatchlistConflict)
+    """
+
+    def __init__(
+        self,
+        worksheet: Callable[[], Any] = _get_worksheet,
+        ttl: float = WATCHLIST_REVALIDATE_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._worksheet = worksheet
+        self.ttl = ttl
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._ws: Any = None
+        self._snapshot: WatchlistSnapshot | None = None
+        self._checked_at = float("-inf")
+
+    def _sheet(self) -> Any:
+        if self._ws is None:
+            self._ws = self._worksheet()
+        return self._ws
+
+    def _current(self) -> WatchlistSnapshot:
+        """呼叫端需持有 _lock"""
+        now = self.clock()
+        if self._snapshot is None:
+            self._snapshot = read_snapshot(self._sheet())
+        elif now - self._checked_at >= self.ttl:
+            if read_version(self._sheet()) != self._snapshot.version:
+                log.info("🔄 Watchlist 版本已變更，重新讀取。")
+                self._snapshot = read_snapshot(self._sheet())
+        else:
+            return self._snapshot
+        self._checked_at = now
+        return self._snapshot
+
+    def snapshot(self) -> WatchlistSnapshot:
+        with self._lock:
+            return self._current()
+
+    def watchlist(self) -> dict[str, dict]:
+        return self.snapshot().watchlist
+
+    def categories(self) -> list[str]:
+        return _categories(self.snapshot().rows)
+
+    def _apply(self, mutate: _Mutation) -> bool:
+        with self._lock:
+            try:
+                changed, self._snapshot = _with_retries(self._sheet(), mutate, self._current())
+            except WatchlistConflict:
+                self._snapshot = None  # 快取的版本已不可信，下次整頁重讀
+                raise
+            self._checked_at = self.clock()
+            return changed
+
+    def add(self, stock_id: str, name: str, category: str) -> bool:
+        """同 add_stock；寫入後快取立即反映"""
+        return self._apply(_adding(str(stock_id), name, category))
+
+    def remove(self, stock_id: str) -> bool:
+        """同 remove_stock；寫入後快取立即反映"""
+        return self._apply(_removing(str(stock_id)))
+
+    def invalidate(self) -> None:
+        """丟掉快取，下一次讀取整頁重新載入"""
+        with self._lock:
+            self._snapshot = None
+
+
 def get_category_emoji(category: str) -> str:
     return _DEFAULT_CATEGORY_EMOJIS.get(category, "")
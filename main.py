@@ -1,39 +1,49 @@
 import datetime
-import sys
+from concurrent.futures import ThreadPoolExecutor
 
+import pandas as pd
 import requests
 import yfinance as yf
 
+from lib.brokers import crawl_brokers, fubon_url
 from lib.logger import get_logger
+from lib.market import MARKET_COLUMNS, fetch_market_data
 from lib.parsers import parse_fubon_html
-from lib.sheet import SheetNotReady, open_sheet
+from lib.prices import PriceResolver, load_price_cache, update_price_cache
+from lib.repair_queue import enqueue_missing
+from lib.sheet import APPEND, REWRITE, SheetNotReady, bump_revision, open_broker_sheet
+from lib.snapshot import write_snapshot
+from lib.watchlist import load_watchlist
+from settings import (
+    BROKER_CRAWL_CONCURRENCY,
+    BROKER_ID,
+    BROKERS,
+    PRICE_CALL_TIMEOUT,
+    PRICE_LOOKUP_CONCURRENCY,
+    PRICE_STAGE_BUDGET,
+)
 
 log = get_logger(__name__)
-log.info("✅ 正在執行 main.py [v20.0 共用模組版]")
 
-HEADER_ROW = ["日期", "代號", "名稱", "買賣別", "買賣超金額(千)", "收盤價", "估算張數"]
+BROKER_COL = "分點"
+HEADER_ROW = ["日期", "代號", "名稱", "買賣別", "買賣超金額(千)", "收盤價", "估算張數", BROKER_COL]
 
 
-def check_and_get_date() -> str:
-    today = datetime.date.today()
+def check_and_get_date(today: datetime.date | None = None) -> str | None:
+    """回傳今日的目標日期字串；週末不開盤時回傳 None"""
+    today = today or datetime.date.today()
     weekday = today.weekday()  # 0=週一, ..., 5=週六, 6=週日
     if weekday >= 5:
         day_str = "週六" if weekday == 5 else "週日"
         log.info(f"😴 今天是 {today} ({day_str})，股市不開盤，程式自動休眠。")
-        sys.exit(0)
+        return None
     return today.strftime("%Y-%m-%d")
 
 
-TARGET_DATE_STR = check_and_get_date()
-log.info(f"📅 目標日期: {TARGET_DATE_STR}")
+def get_today_stock_list_from_fubon(target_date_str: str, broker: str = BROKER_ID):
+    log.info(f"🔍 正在從富邦證券抓取 {broker} 交易名單...")
 
-
-def get_today_stock_list_from_fubon():
-    log.info("🔍 正在從富邦證券抓取交易名單...")
-
-    base = "https://fubon-ebrokerdj.fbs.com.tw/z/zg/zgb/zgb0.djhtm"
-    params_str = f"?a=9A00&b=0039004100390031&c=B&e={TARGET_DATE_STR}&f={TARGET_DATE_STR}"
-    real_url = base + params_str
+    real_url = fubon_url(broker, target_date_str)
 
     log.info(f"   ☁️ 實際請求網址: {real_url}")
 
@@ -54,46 +64,95 @@ def get_today_stock_list_from_fubon():
     stocks = parse_fubon_html(raw_html)
 
     if not stocks:
-        log.warning("❌ Regex 找不到資料，請確認今日是否為交易日。")
+        log.warning(f"❌ {broker} Regex 找不到資料，請確認今日是否為交易日。")
         return []
 
-    log.info(f"✅ 解析完成，抓到 {len(stocks)} 檔股票。")
+    log.info(f"✅ {broker} 解析完成，抓到 {len(stocks)} 檔股票。")
     return stocks
 
 
-def get_close_price_fallback(stock_id: str) -> float:
-    """智慧嘗試 .TW (上市) 和 .TWO (上櫃)"""
+def crawl_all_brokers(target_date_str: str, brokers=None) -> dict[str, list]:
+    """並行爬取所有分點 (共用富邦限速)，回傳 {分點: 股票清單}"""
+    return crawl_brokers(
+        brokers or BROKERS,
+        lambda broker: get_today_stock_list_from_fubon(target_date_str, broker),
+    )
+
+
+def unique_stocks(stock_lists: dict[str, list]) -> list[dict]:
+    """合併各分點的股票 (依代號去重)，股價只需查一次"""
+    merged: dict[str, dict] = {}
+    for stocks in stock_lists.values():
+        for stock in stocks:
+            merged.setdefault(stock["id"], stock)
+    return list(merged.values())
+
+
+def get_quote_fallback(stock_id: str) -> tuple[float, float, float] | None:
+    """逐檔查 (收盤, 前一日收盤, 成交量)，智慧嘗試 .TW (上市) 和 .TWO (上櫃)。
+
+    多抓幾日才有前一日收盤 (只有一日時為 NaN)；查無回傳 None，兩者皆出錯時 raise 最後一個錯誤。
+    """
+    error: Exception | None = None
     for suffix in (".TW", ".TWO"):
         ticker = f"{stock_id}{suffix}"
         try:
-            hist = yf.Ticker(ticker).history(period="1d")
+            hist = yf.Ticker(ticker).history(period="5d", timeout=PRICE_CALL_TIMEOUT)
         except Exception as e:  # yfinance 內部例外類型多變
             log.debug(f"   yfinance {ticker} 失敗: {e}")
+            error = e
             continue
         if not hist.empty:
-            return float(hist.iloc[-1]["Close"])
+            last = hist.iloc[-1]
+            prev_close = float(hist.iloc[-2]["Close"]) if len(hist) > 1 else float("nan")
+            return float(last["Close"]), prev_close, float(last["Volume"])
+        error = None
 
-    log.warning(f"   ⚠️ 無法取得股價: {stock_id} (嘗試過 .TW/.TWO 皆失敗)")
-    return 0.0
+    if error is not None:
+        raise error
+    return None
 
 
-def update_google_sheet_overwrite(new_rows, target_date_str: str) -> None:
+def read_existing_sheet(broker: str = BROKER_ID):
+    """連線並讀取分點分頁現有資料 (可與爬蟲併行)。連線失敗回傳 None。"""
     try:
-        sheet = open_sheet()
+        sheet = open_broker_sheet(broker, HEADER_ROW)
     except SheetNotReady as e:
         log.error(f"❌ Sheet 連線失敗: {e}")
-        return
+        return None
+
+    log.info(f"💾 正在讀取 Google Sheet 現有資料 ({broker})...")
+    return sheet, sheet.get_all_values()
 
-    log.info("💾 正在讀取 Google Sheet 現有資料...")
-    all_values = sheet.get_all_values()
 
+def _with_broker_column(header: list, rows: list[list], broker: str) -> tuple[list, list[list]]:
+    """舊資料沒有「分點」欄時補上，既有列標記為該分頁的分點"""
+    if BROKER_COL in header:
+        return header, rows
+    width = len(header)
+    rows = [
+        row + [""] * (width - len(row)) + [broker] if len(row) <= width else row
+        for row in rows
+    ]
+    return header + [BROKER_COL], rows
+
+
+def write_sheet_overwrite(
+    sheet, all_values, new_rows, target_date_str: str, broker: str = BROKER_ID
+) -> str:
+    """以 read_existing_sheet 讀到的內容為底，覆寫 target_date 的資料。
+
+    回傳寫入前 Sheet 中當日以前的最新日期 (Sheet 原本為空則為 "")。
+    """
     if not all_values:
         final_data = [HEADER_ROW] + new_rows
         sheet.update(final_data)
         log.info(f"✅ 寫入完成 (全新資料)！共 {len(new_rows)} 筆")
-        return
+        if broker == BROKER_ID:
+            bump_revision(sheet, REWRITE)
+        return ""
 
-    header, old_data = all_values[0], all_values[1:]
+    header, old_data = _with_broker_column(all_values[0], all_values[1:], broker)
 
     kept_data = []
     deleted_count = 0
@@ -108,51 +167,222 @@ def update_google_sheet_overwrite(new_rows, target_date_str: str) -> None:
         else:
             deleted_count += 1
 
-    log.info(f"🧹 已清除 Sheet 中 {deleted_count} 筆舊的 {target_date_str} 資料。")
+    log.info(f"🧹 已清除 {broker} 分頁中 {deleted_count} 筆舊的 {target_date_str} 資料。")
 
     final_data = [header] + kept_data + new_rows
-    log.info(f"💾 正在回寫 Google Sheet (總筆數: {len(final_data) - 1})...")
+    log.info(f"💾 正在回寫 Google Sheet {broker} (總筆數: {len(final_data) - 1})...")
     sheet.clear()
     sheet.update(final_data)
-    log.info("✅ 更新成功！")
+    log.info(f"✅ {broker} 更新成功！")
+    if broker == BROKER_ID:
+        # 既有列原封不動 (沒有刪除、空白列或補欄) 時，app 只需讀取尾端新增的列
+        unchanged = deleted_count == 0 and header == all_values[0] and len(kept_data) == len(old_data)
+        bump_revision(sheet, APPEND if unchanged else REWRITE, len(kept_data))
+
+    kept_dates = [str(row[0]).replace("/", "-") for row in kept_data if row[0]]
+    return max(kept_dates, default="")
+
+
+def update_google_sheet_overwrite(
+    new_rows, target_date_str: str, broker: str = BROKER_ID
+) -> str | None:
+    """覆寫分點分頁中 target_date 的資料。
+
+    成功時回傳寫入前分頁中當日以前的最新日期 (分頁原本為空則為 "")；失敗回傳 None。
+    """
+    existing = read_existing_sheet(broker)
+    if existing is None:
+        return None
+    sheet, all_values = existing
+    return write_sheet_overwrite(sheet, all_values, new_rows, target_date_str, broker)
+
+
+def write_other_brokers(rows_by_broker: dict[str, list[list]], target_date_str: str) -> list[str]:
+    """預設分點以外的分點各自寫入自己的分頁 (並行)，回傳寫入失敗的分點"""
+    others = {b: rows for b, rows in rows_by_broker.items() if b != BROKER_ID and rows}
+    if not others:
+        return []
 
+    def write(item) -> str | None:
+        broker, rows = item
+        try:
+            return update_google_sheet_overwrite(rows, target_date_str, broker)
+        except Exception as e:  # gspread 例外類型多樣；單一分點失敗不影響其他分點
+            log.error(f"❌ {broker} 寫入失敗: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=BROKER_CRAWL_CONCURRENCY) as pool:
+        results = dict(zip(others, pool.map(write, others.items()), strict=True))
+    return [broker for broker, prev in results.items() if prev is None]
+
+
+# resolve_prices 的模式，依降級程度排列
+PRICE_MODES = ("full", "watchlist", "cached")
+
+
+def resolve_prices(
+    stock_list,
+    target_date_str: str,
+    mode: str = "full",
+    watchlist_ids: set[str] | None = None,
+    budget_seconds: float = PRICE_STAGE_BUDGET,
+) -> tuple[pd.DataFrame, dict[str, str]]:
+    """批次下載當日行情；批次缺少的股票交給 PriceResolver 並行補查 (有期限、預算與斷路器)。
+
+    趕時限時 (--deadline) 可降級：
+    - watchlist：只對 watchlist 股票逐檔補查，其餘缺價改用股價快取
+    - cached：只批次下載 watchlist 股票，其餘全部用股價快取
+
+    回傳 (market, skipped)。補查到的行情 (收盤 / 前一日收盤 / 成交量) 補進 market；
+    skipped 為需要事後補修的 stock_id → 原因 (查無，或寫入的是快取價 "cached")。
+    """
+    watchlist_ids = watchlist_ids or set()
+    all_ids = [s["id"] for s in stock_list]
+
+    log.info("📈 批次下載當日行情...")
+    live_ids = [sid for sid in all_ids if sid in watchlist_ids] if mode == "cached" else all_ids
+    market = fetch_market_data(live_ids, target_date_str) if live_ids else pd.DataFrame(
+        columns=MARKET_COLUMNS, index=pd.Index([], name="代號")
+    )
+    missing = [sid for sid in all_ids if sid not in market.index]
+    if mode == "full":
+        to_lookup = missing
+    elif mode == "watchlist":
+        to_lookup = [sid for sid in missing if sid in watchlist_ids]
+    else:
+        to_lookup = []
+
+    skipped: dict[str, str] = {}
+    if to_lookup:
+        log.info(f"🔎 逐檔補查 {len(to_lookup)} 檔股價 (並行 {PRICE_LOOKUP_CONCURRENCY})...")
+        quotes: dict[str, tuple[float, float, float]] = {}
+
+        def lookup(stock_id: str) -> float | None:
+            quote = get_quote_fallback(stock_id)
+            if quote is None:
+                return None
+            quotes[stock_id] = quote
+            return quote[0]
+
+        resolver = PriceResolver(lookup, budget_seconds=max(budget_seconds, 0.0))
+        resolution = resolver.resolve(to_lookup)
+        for stock_id in resolution.prices:
+            market.loc[stock_id] = list(quotes[stock_id])
+        skipped.update(resolution.skipped)
+
+    deferred = [sid for sid in missing if sid not in to_lookup]
+    if deferred:
+        cache = load_price_cache()
+        for stock_id in deferred:
+            if stock_id in cache:
+                market.loc[stock_id] = [cache[stock_id][1], float("nan"), float("nan")]
+                skipped[stock_id] = "cached"
+            else:
+                skipped[stock_id] = "deferred"
+        log.info(f"⏩ {len(deferred)} 檔未即時查價，改用股價快取並排入補修。")
+    return market, skipped
+
+
+def remember_prices(market: pd.DataFrame, skipped: dict[str, str], target_date_str: str) -> None:
+    """把即時取得的收盤價寫進股價快取 (快取價本身不回寫)"""
+    live = market.drop(index=[sid for sid, reason in skipped.items() if reason == "cached"])
+    try:
+        update_price_cache(live, target_date_str)
+    except OSError as e:
+        log.warning(f"⚠️ 股價快取寫入失敗: {e}")
 
-def main():
-    log.info("🚀 啟動 main() 主程式...")
-    stock_list = get_today_stock_list_from_fubon()
-    if not stock_list:
-        return
 
+def build_rows(
+    stock_list, market: pd.DataFrame, target_date_str: str, broker: str = BROKER_ID
+) -> list[list]:
+    """依行情換算估算張數，回傳依金額絕對值排序的 Sheet 列 (查無股價時成本與張數為 0)"""
     all_data = []
-    log.info(f"📝 準備分析 {len(stock_list)} 檔股票...")
-
-    for i, stock_info in enumerate(stock_list):
+    for stock_info in stock_list:
         stock_id = stock_info["id"]
-        stock_name = stock_info["name"]
         fubon_net_amt = stock_info["net_amt"]
-
-        log.info(f"[{i + 1}/{len(stock_list)}] 分析 {stock_name} ({stock_id})...")
-
-        final_cost = get_close_price_fallback(stock_id)
+        final_cost = float(market.at[stock_id, "close"]) if stock_id in market.index else 0.0
         final_vol = int(fubon_net_amt / final_cost) if final_cost > 0 else 0
         bs_type = "買超" if fubon_net_amt > 0 else ("賣超" if fubon_net_amt < 0 else "平盤")
 
         all_data.append(
             [
-                TARGET_DATE_STR,
+                target_date_str,
                 stock_id,
-                stock_name,
+                stock_info["name"],
                 bs_type,
                 fubon_net_amt,
                 final_cost,
                 final_vol,
+                broker,
             ]
         )
 
-    log.info(f"✅ 分析完成，共 {len(all_data)} 筆。")
-    if all_data:
-        all_data.sort(key=lambda x: abs(x[4]), reverse=True)
-        update_google_sheet_overwrite(all_data, TARGET_DATE_STR)
+    all_data.sort(key=lambda x: abs(x[4]), reverse=True)
+    return all_data
+
+
+def rows_frame(all_data: list[list]) -> pd.DataFrame:
+    """Sheet 列 → 與 load_dataframe 相同型別的 DataFrame (日期為 datetime)"""
+    rows_df = pd.DataFrame(all_data, columns=HEADER_ROW)
+    rows_df["日期"] = pd.to_datetime(rows_df["日期"])
+    return rows_df
+
+
+def save_snapshot(rows_df, market, target_date_str: str, prev_date: str, watchlist=None) -> None:
+    try:
+        write_snapshot(rows_df, market, target_date_str, prev_date, watchlist=watchlist)
+        log.info("📦 已寫出當日快照，notify.py 可直接取用。")
+    except (OSError, ImportError, ValueError) as e:  # 缺 pyarrow 或磁碟問題不影響主流程
+        log.warning(f"⚠️ 快照寫出失敗: {e}")
+
+
+def main():
+    log.info("🚀 啟動 main() 主程式...")
+    target_date_str = check_and_get_date()
+    if target_date_str is None:
+        return
+    log.info(f"📅 目標日期: {target_date_str}")
+
+    # Sheet 授權與讀取現有資料不依賴爬蟲結果，與爬蟲 / 股價查詢同時進行
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        existing_future = pool.submit(read_existing_sheet)
+
+        stock_lists = crawl_all_brokers(target_date_str)
+        stocks = unique_stocks(stock_lists)
+        if not stocks:
+            return
+
+        log.info(f"📝 準備分析 {len(stocks)} 檔股票 ({len(stock_lists)} 個分點)...")
+        market, skipped = resolve_prices(stocks, target_date_str)
+        rows_by_broker = {
+            broker: build_rows(stock_list, market, target_date_str, broker)
+            for broker, stock_list in stock_lists.items()
+        }
+        all_data = rows_by_broker.get(BROKER_ID, [])
+
+        log.info(f"✅ 分析完成，共 {sum(map(len, rows_by_broker.values()))} 筆。")
+        existing = existing_future.result()
+
+    # 各分點分頁互不相干，與預設分點的寫入並行
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        others_future = pool.submit(write_other_brokers, rows_by_broker, target_date_str)
+        prev_date = None
+        if all_data and existing is not None:
+            sheet, all_values = existing
+            prev_date = write_sheet_overwrite(sheet, all_values, all_data, target_date_str)
+        others_future.result()
+    if prev_date is None:
+        return
+
+    enqueue_missing(target_date_str, skipped)
+    remember_prices(market, skipped, target_date_str)
+
+    try:
+        watchlist = load_watchlist()
+    except Exception as e:  # gspread 例外類型多樣；watchlist 缺席時 notify 會自行讀取
+        log.warning(f"⚠️ 讀取 Watchlist 失敗，快照不含 watchlist: {e}")
+        watchlist = None
+    save_snapshot(rows_frame(all_data), market, target_date_str, prev_date, watchlist)
 
 
 if __name__ == "__main__":
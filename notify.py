@@ -1,22 +1,36 @@
+import argparse
 import datetime
 import json
 import os
 import warnings
 
+import numpy as np
 import pandas as pd
-import yfinance as yf
 from linebot import LineBotApi
 from linebot.models import TextSendMessage
 
+from lib.alert_state import AlertState, load_or_rebuild, load_state, verify_state
 from lib.alerts import (
     AlertHit,
     evaluate_conditions,
     evaluate_rankings,
+    history_window,
     load_alerts,
 )
+from lib.anomalies import evaluate_anomalies
+from lib.categories import category_mapping, evaluate_category_rules
+from lib.history_index import HistoryIndex
 from lib.logger import get_logger
-from lib.sheet import SheetNotReady, load_dataframe
-from lib.watchlist import load_watchlist
+from lib.market import fetch_market_data
+from lib.sheet import (
+    SheetNotReady,
+    SheetRevision,
+    load_dataframe,
+    load_recent_dataframe,
+    load_revision,
+)
+from lib.snapshot import Snapshot, load_snapshot
+from lib.watchlist import get_category_emoji, load_watchlist
 from settings import LINE_SECRET_FILE
 
 warnings.filterwarnings("ignore", category=UserWarning)
@@ -38,33 +52,22 @@ if (not LINE_ACCESS_TOKEN or not LINE_USER_ID) and os.path.exists(LINE_SECRET_FI
         log.warning(f"⚠️ 讀取 {LINE_SECRET_FILE} 失敗: {e}")
 
 
-def get_market_data(stock_id, target_date_str):
-    """取得當日收盤價、漲跌幅、總成交量。失敗回傳 None，代表 yfinance 無資料。"""
-    try:
-        stock = yf.Ticker(f"{stock_id}.TW")
-        hist = stock.history(period="1mo")
-    except Exception as e:  # yfinance 內部例外類型多變
-        log.warning(f"⚠️ yfinance 失敗 ({stock_id}): {e}")
-        return None
-
-    if hist.empty:
-        return None
-    hist.index = hist.index.strftime("%Y-%m-%d")
-
-    if target_date_str not in hist.index:
-        return None
-
-    target_idx = hist.index.get_loc(target_date_str)
-    total_vol = int(hist.iloc[target_idx]["Volume"] / 1000)
-    close_price = float(hist.iloc[target_idx]["Close"])
-
-    if target_idx > 0:
-        prev_close = float(hist.iloc[target_idx - 1]["Close"])
-        pct_change = round(((close_price - prev_close) / prev_close) * 100, 2)
-    else:
-        pct_change = 0.0
-
-    return close_price, pct_change, total_vol
+def _with_market_columns(watch_df, market):
+    """併入批次行情並以向量化方式算出 market_price / pct_change / total_vol / concentration"""
+    df = watch_df.join(market, on="代號")
+    has_price = df["close"].notna()
+    prev_close = df["prev_close"]
+    pct_change = ((df["close"] - prev_close) / prev_close * 100).round(2)
+    total_vol = np.trunc(df["volume"].fillna(0) / 1000).astype(int)
+
+    df["has_price"] = has_price
+    df["market_price"] = df["close"].fillna(0.0)
+    df["pct_change"] = pct_change.where(has_price & (prev_close > 0), 0.0)
+    df["total_vol"] = total_vol
+    df["concentration"] = (
+        (df["估算張數"].astype(int) / total_vol.where(total_vol > 0) * 100).round(1).fillna(0.0)
+    )
+    return df
 
 
 def _format_number_signed(value):
@@ -87,6 +90,43 @@ def _format_ranking_block(rule_name, payload):
     return "\n".join(lines)
 
 
+def _format_anomaly_block(rule_name, payload):
+    """將 anomaly 規則結果格式化成一段訊息"""
+    unit = "張" if payload["metric"] == "net_sheets" else "千"
+    lines = [f"{payload['emoji']} {rule_name}"]
+    for i, rec in enumerate(payload["records"], 1):
+        value = _format_number_signed(int(rec["value"]))
+        median = _format_number_signed(int(rec["median"]))
+        z = f"+{rec['z']:.1f}" if rec["z"] > 0 else f"{rec['z']:.1f}"
+        lines.append(
+            f"  {i}. {rec['名稱']} ({rec['代號']})  {value} {unit} "
+            f"(近{payload['window_days']}日中位 {median}，z={z})"
+        )
+    return "\n".join(lines)
+
+
+def _format_category_block(rule_name, payload):
+    """將分類規則 (category_ranking / category_streak) 結果格式化成一段訊息"""
+    unit = "張" if payload["metric"] == "net_sheets" else "千"
+    buy = payload["direction"] == "buy"
+    streak_key = "buy_streak" if buy else "sell_streak"
+    streak_label = "連買" if buy else "連賣"
+
+    lines = [f"{payload['emoji']} {rule_name}"]
+    for i, rec in enumerate(payload["records"], 1):
+        category = str(rec["分類"])
+        display = f"{get_category_emoji(category)} {category}".strip()
+        streak = int(rec[streak_key])
+        if payload["kind"] == "category_ranking":
+            total = _format_number_signed(int(rec["total"]))
+            streak_str = f"  ({streak_label} {streak} 日)" if streak >= 2 else ""
+            lines.append(f"  {i}. {display}  {total} {unit}{streak_str}")
+        else:
+            today = _format_number_signed(int(rec["today"]))
+            lines.append(f"  {display}  {streak_label} {streak} 日 (今日 {today} {unit})")
+    return "\n".join(lines)
+
+
 def _format_condition_group(hits_by_rule):
     """把 condition 命中按規則名稱分組後的結果格式化"""
     blocks = []
@@ -115,8 +155,23 @@ def _format_condition_group(hits_by_rule):
     return blocks
 
 
-def build_message(df_full, target_date, watchlist, alert_rules):
-    """組出完整通知訊息。若今日沒有任何可發內容回傳 None。"""
+def build_message(
+    df_full,
+    target_date,
+    watchlist,
+    alert_rules,
+    state: AlertState | None = None,
+    market: pd.DataFrame | None = None,
+    skip_blocks: bool = False,
+    partial_reasons: list[str] | None = None,
+):
+    """組出完整通知訊息。若今日沒有任何可發內容回傳 None。
+
+    state 為已同步到 target_date 的增量狀態；給了就直接取用其連續天數與排行視窗。
+    market 為已取得的批次行情 (fetch_market_data 格式)；未提供時在此批次下載。
+    skip_blocks=True (趕時限) 時略過排行 / 異常 / 分類區塊，只保留 watchlist 與條件告警；
+    partial_reasons 非空時在標題下標示為部分內容。
+    """
     target_date_str = target_date.strftime('%Y-%m-%d')
     target_ts = pd.Timestamp(target_date)
 
@@ -124,37 +179,34 @@ def build_message(df_full, target_date, watchlist, alert_rules):
     if daily_df.empty:
         return None
 
+    history = HistoryIndex(df_full)
+
     # --- (A) 組 watchlist 每檔的基本資料 + condition 規則命中 ---
     hits_per_stock = []
     condition_hits_grouped: dict[str, list[AlertHit]] = {}
 
-    for _, row in daily_df.iterrows():
-        stock_id = str(row['代號'])
-        if stock_id not in watchlist:
-            continue
+    watch_df = daily_df[daily_df["代號"].astype(str).isin(watchlist.keys())]
+    if market is None:
+        market = fetch_market_data(watch_df["代號"].astype(str), target_date_str)
+    watch_df = _with_market_columns(watch_df, market)
 
+    for row in watch_df.to_dict("records"):
+        stock_id = str(row['代號'])
         net_amt = int(row['買賣超金額(千)'])
         est_sheets = int(row['估算張數'])
         sheet_cost_val = float(row['收盤價'])
         info = watchlist[stock_id]
 
-        market_tuple = get_market_data(stock_id, target_date_str)
-        if market_tuple is None:
-            market_price = 0.0
-            pct_change = 0.0
-            total_vol = 0
+        market_price = row['market_price']
+        pct_change = row['pct_change']
+        concentration = row['concentration']
+        if not row['has_price']:
             price_display = "⚠️ 無法取得股價"
+        elif pct_change != 0:
+            pct_str = f"+{pct_change}%" if pct_change > 0 else f"{pct_change}%"
+            price_display = f"{market_price} ({pct_str})"
         else:
-            market_price, pct_change, total_vol = market_tuple
-            if pct_change != 0:
-                pct_str = f"+{pct_change}%" if pct_change > 0 else f"{pct_change}%"
-                price_display = f"{market_price} ({pct_str})"
-            else:
-                price_display = f"{market_price}"
-
-        concentration = 0.0
-        if total_vol > 0:
-            concentration = round((est_sheets / total_vol) * 100, 1)
+            price_display = f"{market_price}"
 
         trend_icon = "🔴" if net_amt > 0 else "🟢"
 
@@ -173,13 +225,14 @@ def build_message(df_full, target_date, watchlist, alert_rules):
 
         # 跑 condition 規則
         cond_hits = evaluate_conditions(
-            df_full=df_full,
+            df_full=history,
             stock_id=stock_id,
             stock_name=info['name'],
             target_date=target_ts,
             market_price=market_price,
             concentration=concentration,
             rules=alert_rules,
+            streaks=state.streaks(stock_id) if state is not None else None,
         )
         for h in cond_hits:
             condition_hits_grouped.setdefault(h.rule_name, []).append(h)
@@ -189,20 +242,41 @@ def build_message(df_full, target_date, watchlist, alert_rules):
 
     hits_per_stock.sort(key=lambda x: abs(x['amount']), reverse=True)
 
-    # --- (B) 跑 ranking 規則 (對全 Sheet，不限 watchlist) ---
-    ranking_results = evaluate_rankings(
-        df_full=df_full,
-        target_date=target_ts,
-        rules=alert_rules,
-    )
+    # --- (B) 跑 ranking 規則 (對全 Sheet，不限 watchlist) + 分類彙總規則 ---
+    ranking_results: dict[str, dict] = {}
+    category_results: dict[str, dict] = {}
+    anomaly_results: dict[str, dict] = {}
+    partial_reasons = list(partial_reasons or [])
+    if skip_blocks:
+        partial_reasons.append("略過排行 / 異常 / 分類區塊")
+    else:
+        window_df = state.window_frame() if state is not None else df_full
+        ranking_results = evaluate_rankings(
+            df_full=window_df,
+            target_date=target_ts,
+            rules=alert_rules,
+        )
+        category_results = evaluate_category_rules(
+            df_full=window_df,
+            target_date=target_ts,
+            rules=alert_rules,
+            mapping=category_mapping(watchlist),
+        )
+        anomaly_results = evaluate_anomalies(
+            df_full=window_df,
+            target_date=target_ts,
+            rules=alert_rules,
+        )
 
     # --- (C) 組訊息 ---
     SEP = "----------------------"
     HEADER = "======================"
 
     parts = ["【連接器供應鏈】主力動向", f"📅 {target_date_str}"]
+    if partial_reasons:
+        parts.append(f"⚠️ 部分內容 (趕時限)：{'、'.join(partial_reasons)}")
 
-    if ranking_results or condition_hits_grouped:
+    if ranking_results or anomaly_results or category_results or condition_hits_grouped:
         parts.append(HEADER)
         parts.append("🔥 重點告警")
         parts.append(HEADER)
@@ -211,6 +285,14 @@ def build_message(df_full, target_date, watchlist, alert_rules):
             parts.append(_format_ranking_block(rule_name, payload))
             parts.append(SEP)
 
+        for rule_name, payload in anomaly_results.items():
+            parts.append(_format_anomaly_block(rule_name, payload))
+            parts.append(SEP)
+
+        for rule_name, payload in category_results.items():
+            parts.append(_format_category_block(rule_name, payload))
+            parts.append(SEP)
+
         for block in _format_condition_group(condition_hits_grouped):
             parts.append(block)
             parts.append(SEP)
@@ -234,50 +316,193 @@ def build_message(df_full, target_date, watchlist, alert_rules):
     return "\n".join(parts)
 
 
-def send_line_notify():
+def evaluate_intraday(
+    rows_df: pd.DataFrame,
+    market: pd.DataFrame,
+    target_date,
+    watchlist,
+    alert_rules,
+    streaks: dict[str, tuple[int, int]] | None = None,
+) -> list[AlertHit]:
+    """盤中只對 rows_df (變動的 watchlist 股票當日列) 跑 condition 規則。
+
+    streaks 為含今日盤中的 (連買, 連賣) 天數；不給則只依 rows_df 計算 (最多 1 日)。
+    """
+    target_ts = pd.Timestamp(target_date)
+    streaks = streaks or {}
+    history = HistoryIndex(rows_df)
+    watch_df = _with_market_columns(rows_df[rows_df["代號"].astype(str).isin(watchlist.keys())], market)
+
+    hits: list[AlertHit] = []
+    for row in watch_df.to_dict("records"):
+        stock_id = str(row["代號"])
+        hits.extend(
+            evaluate_conditions(
+                df_full=history,
+                stock_id=stock_id,
+                stock_name=watchlist[stock_id]["name"],
+                target_date=target_ts,
+                market_price=row["market_price"],
+                concentration=row["concentration"],
+                rules=alert_rules,
+                streaks=streaks.get(stock_id),
+            )
+        )
+    return hits
+
+
+def build_intraday_message(now: datetime.datetime, hits: list[AlertHit]) -> str | None:
+    """盤中輪詢的新命中訊息 (只含 condition 規則)；沒有命中回傳 None"""
+    if not hits:
+        return None
+    grouped: dict[str, list[AlertHit]] = {}
+    for hit in hits:
+        grouped.setdefault(hit.rule_name, []).append(hit)
+    parts = ["【連接器供應鏈】盤中告警", f"🕒 {now:%Y-%m-%d %H:%M}"]
+    parts.extend(_format_condition_group(grouped))
+    parts.append("盤中數字為即時累計，收盤後以每日通知為準")
+    return "\n".join(parts)
+
+
+def push_line_message(message: str) -> bool:
+    """推播一則 LINE 訊息，回傳是否成功"""
     if not LINE_ACCESS_TOKEN or not LINE_USER_ID:
+        log.error("❌ 錯誤：找不到 LINE 金鑰。")
+        return False
+    try:
+        line_bot_api = LineBotApi(LINE_ACCESS_TOKEN)
+        line_bot_api.push_message(LINE_USER_ID, TextSendMessage(text=message))
+        log.info("🎉 LINE 通知發送成功！")
+        return True
+    except Exception as e:  # line-bot-sdk 例外類型多樣
+        log.error(f"❌ 發送失敗: {e}")
+        return False
+
+
+def _current_revision() -> SheetRevision | None:
+    """Sheet 目前的修訂標記；讀取失敗時回傳 None (只以日期判斷能否增量同步)"""
+    try:
+        return load_revision()
+    except Exception as e:  # gspread 例外類型多樣
+        log.warning(f"⚠️ 修訂標記讀取失敗: {e}")
+        return None
+
+
+def _state_from_snapshot(
+    snapshot: Snapshot, window: int, revision: SheetRevision | None = None
+) -> AlertState | None:
+    """增量狀態正好停在快照的前一個交易日 (或同日重跑)，且其後 Sheet 沒被改寫時，直接以快照推進狀態。"""
+    state = load_state(window)
+    if state is None or state.last_date not in {snapshot.prev_date, snapshot.date_str}:
+        return None
+    if state.outdated_by(revision):
+        return None
+    state.apply_day(snapshot.rows, snapshot.date)
+    if revision is not None:
+        state.revision = revision.revision
+    return state
+
+
+def send_line_notify(
+    verify_only: bool = False,
+    snapshot: Snapshot | None = None,
+    skip_blocks: bool = False,
+    partial_reasons: list[str] | None = None,
+):
+    """verify_only=True 時只比對增量狀態與全量重算，不發送也不寫回狀態。
+
+    snapshot 由同一個 process 的 pipeline 直接交接時不必再讀 .snapshot/；
+    skip_blocks / partial_reasons 為趕時限時的降級選項 (見 build_message)。
+    """
+    if not verify_only and (not LINE_ACCESS_TOKEN or not LINE_USER_ID):
         log.error("❌ 錯誤：找不到 LINE 金鑰。")
         return
 
-    watchlist = load_watchlist()
+    today_date = datetime.date.today()
+    if verify_only:
+        snapshot = None
+    elif snapshot is None:
+        snapshot = load_snapshot(today_date)
+
+    if snapshot is not None and snapshot.watchlist:
+        watchlist = snapshot.watchlist
+    else:
+        watchlist = load_watchlist()
     if not watchlist:
         log.warning("⚠️ Watchlist 為空，請檢查 config/watchlist.yaml")
         return
 
     alert_rules = load_alerts()
+    window = history_window(alert_rules)
 
-    try:
-        df = load_dataframe()
-    except SheetNotReady as e:
-        log.error(f"❌ Sheet 連線失敗: {e}")
-        return
-    if df is None:
-        log.warning("⚠️ 試算表無資料")
-        return
-
-    today_date = datetime.date.today()
-    today_ts = pd.Timestamp(today_date)
-
-    if not df[df["日期"] == today_ts].empty:
+    revision = None if verify_only else _current_revision()
+    state = _state_from_snapshot(snapshot, window, revision) if snapshot is not None else None
+    if state is not None:
+        log.info("⚡ 使用 main.py 產出的當日快照，不重新讀取 Sheet / 股價。")
+        df = snapshot.rows
         target_date = today_date
     else:
-        target_date = df["日期"].max().date()
-        log.warning(f"⚠️ 今日無資料，改用最新日期: {target_date}")
+        try:
+            if verify_only:
+                df = load_dataframe()
+            else:
+                # 規則最多回看 window 日；多讀 1 日讓上次處理的日期也在範圍內 (增量同步用)
+                df = load_recent_dataframe(window + 1)
+        except SheetNotReady as e:
+            log.error(f"❌ Sheet 連線失敗: {e}")
+            return
+        if df is None:
+            log.warning("⚠️ 試算表無資料")
+            return
+
+        today_ts = pd.Timestamp(today_date)
+        if not df[df["日期"] == today_ts].empty:
+            target_date = today_date
+        else:
+            target_date = df["日期"].max().date()
+            log.warning(f"⚠️ 今日無資料，改用最新日期: {target_date}")
+
+        state = load_or_rebuild(
+            df, pd.Timestamp(target_date), window, load_full=load_dataframe, revision=revision
+        )
+
+        if verify_only:
+            diffs = verify_state(state, df, pd.Timestamp(target_date), alert_rules)
+            for diff in diffs:
+                log.warning(f"⚠️ {diff}")
+            if not diffs:
+                log.info("✅ 增量狀態與全量重算一致。")
+            return
+
+    # 快照存在且日期相符時，即使改走 Sheet 也沿用其行情
+    market = snapshot.market if snapshot is not None and snapshot.date.date() == target_date else None
 
     log.info(f"🔍 開始分析 {target_date} 資料 (讀取 Sheet 成本)...")
 
-    message = build_message(df, target_date, watchlist, alert_rules)
+    message = build_message(
+        df,
+        target_date,
+        watchlist,
+        alert_rules,
+        state=state,
+        market=market,
+        skip_blocks=skip_blocks,
+        partial_reasons=partial_reasons,
+    )
+    state.save()
     if not message:
         log.info("✅ 今日無供應鏈股票動態，不發送。")
         return
 
-    try:
-        line_bot_api = LineBotApi(LINE_ACCESS_TOKEN)
-        line_bot_api.push_message(LINE_USER_ID, TextSendMessage(text=message))
-        log.info("🎉 LINE 通知發送成功！")
-    except Exception as e:  # line-bot-sdk 例外類型多樣
-        log.error(f"❌ 發送失敗: {e}")
+    push_line_message(message)
 
 
 if __name__ == "__main__":
-    send_line_notify()
+    parser = argparse.ArgumentParser(description="LINE 推播每日主力動向")
+    parser.add_argument(
+        "--verify-state",
+        action="store_true",
+        help="比對增量告警狀態與全量重算結果 (不發送)",
+    )
+    args = parser.parse_args()
+    send_line_notify(verify_only=args.verify_state)
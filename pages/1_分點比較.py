@@ -0,0 +1,111 @@
+"""跨分點比較 — 同一區間內多個分點同方向進出的股票 (DuckDB 查 Parquet 歷史檔)。
+
+歷史檔由每日排程上傳到 Drive，此頁每 DRIVE_SYNC_TTL 秒檢查一次，有更新才下載到本機 HISTORY_DIR。
+"""
+from datetime import timedelta
+
+import pandas as pd
+import streamlit as st
+
+from lib.drive_store import fetch_directory
+from lib.history_db import BUY, SELL, HistoryDB
+from lib.history_store import history_stamp
+from settings import BROKERS, DRIVE_HISTORY_FILE, DRIVE_SYNC_TTL, HISTORY_DIR
+
+st.set_page_config(page_title="分點比較", layout="wide", page_icon="🏦")
+st.title("🏦 分點比較")
+
+
+@st.cache_data(ttl=DRIVE_SYNC_TTL, show_spinner="☁️ 同步歷史檔...")
+def sync_history() -> str | None:
+    """Drive 上的歷史檔較新時下載；回傳錯誤訊息 (成功為 None)，失敗時沿用本機既有的副本"""
+    try:
+        fetch_directory(HISTORY_DIR, DRIVE_HISTORY_FILE)
+    except Exception as e:  # gspread / 網路例外類型多樣
+        return str(e)
+    return None
+
+
+@st.cache_resource(max_entries=1)
+def load_db(stamp: float) -> HistoryDB:
+    """歷史檔有更新 (stamp 改變) 時才重新開啟"""
+    return HistoryDB()
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_shared_flows(
+    stamp: float, start, end, brokers: tuple[str, ...], side: str, min_brokers: int
+) -> pd.DataFrame:
+    """查詢結果依 (歷史檔版本, 條件) 快取"""
+    return load_db(stamp).shared_flows(start, end, list(brokers), side, min_brokers)
+
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_broker_flows(stamp: float, start, end, brokers: tuple[str, ...]) -> pd.DataFrame:
+    return load_db(stamp).broker_flows(start, end, list(brokers))
+
+
+sync_error = sync_history()
+if sync_error:
+    st.caption(f"⚠️ 無法從 Drive 同步歷史檔，使用本機副本：{sync_error}")
+stamp = history_stamp()
+try:
+    db = load_db(stamp)
+except ImportError:
+    st.error("此頁需要 duckdb：pip install duckdb")
+    st.stop()
+
+span = db.date_range()
+if span is None:
+    st.warning(
+        f"⚠️ 找不到歷史檔 (Drive: {DRIVE_HISTORY_FILE} / 本機: {HISTORY_DIR})，"
+        "請先執行 python scripts/export_history.py"
+    )
+    st.stop()
+min_date, max_date = span[0].date(), span[1].date()
+available = db.brokers()
+
+with st.sidebar:
+    st.markdown("### 🔍 比較條件")
+    brokers = st.multiselect(
+        "分點",
+        available,
+        default=available,
+        format_func=lambda broker: f"{broker} {BROKERS.get(broker, '')}".strip(),
+    )
+    side_label = st.radio("方向", ["同步買超", "同步賣超"])
+    date_range = st.date_input(
+        "區間",
+        [max(min_date, max_date - timedelta(days=20)), max_date],
+        min_value=min_date,
+        max_value=max_date,
+    )
+    start_date = date_range[0] if len(date_range) > 0 else min_date
+    end_date = date_range[1] if len(date_range) == 2 else max_date
+    min_brokers = (
+        st.slider("至少幾個分點", 2, len(brokers), 2) if len(brokers) > 2 else len(brokers)
+    )
+
+if len(brokers) < 2:
+    st.info("💡 請至少選擇兩個分點。")
+    st.stop()
+
+side = BUY if side_label == "同步買超" else SELL
+shared = load_shared_flows(stamp, start_date, end_date, tuple(brokers), side, min_brokers)
+
+st.markdown(f"#### 📋 {side_label}清單")
+st.caption(f"📅 區間：{start_date} ~ {end_date}  |  至少 {min_brokers} 個分點")
+if shared.empty:
+    st.info("💡 區間內沒有符合條件的股票。")
+else:
+    st.markdown(f"**共 {len(shared)} 檔**")
+    st.dataframe(shared, use_container_width=True, hide_index=True, height=420)
+
+with st.expander("📄 各分點區間彙總"):
+    flows = load_broker_flows(stamp, start_date, end_date, tuple(brokers))
+    summary = flows.groupby("分點").agg(
+        股票數=("代號", "count"),
+        淨金額=("累計金額", "sum"),
+        淨張數=("累計張數", "sum"),
+    )
+    st.dataframe(summary.reset_index(), use_container_width=True, hide_index=True)
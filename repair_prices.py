@@ -0,0 +1,130 @@
+"""缺價補修 — 依補修佇列批次抓價，只回寫受影響的 收盤價 / 估算張數 儲存格。
+
+    python repair_prices.py          # 處理佇列
+    python repair_prices.py --scan   # 先掃描整份 Sheet，把既有缺價列一併加入佇列
+
+所有待補股票以一次批次下載 (.TW，缺的再 .TWO) 取得區間收盤價，
+各分點分頁以單一 batch_update 只寫入修到的儲存格，不覆寫整張表。
+有分頁改過就遞增修訂標記 (app / notify 重新載入)，並把補到的股價寫回 Drive 上的 Parquet 歷史檔。
+"""
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+import gspread
+import pandas as pd
+
+from lib.drive_store import fetch_directory, publish_directory
+from lib.history_store import repair_history
+from lib.logger import get_logger
+from lib.market import fetch_close_history
+from lib.repair_queue import RepairQueue, find_missing_rows, plan_cell_updates
+from lib.sheet import REWRITE, SheetNotReady, bump_revision, open_broker_sheet
+from settings import (
+    BROKERS,
+    DRIVE_HISTORY_FILE,
+    HISTORY_DIR,
+    PRICE_REPAIR_FILE,
+    PRICE_REPAIR_MAX_ATTEMPTS,
+)
+
+log = get_logger(__name__)
+
+
+def _lookup_prices(queue: RepairQueue) -> dict[tuple[str, str], float]:
+    """一次批次下載佇列涵蓋的所有股票與日期區間，取出各 (日期, 代號) 的收盤價"""
+    items = list(queue)
+    dates = [pd.Timestamp(item.date) for item in items]
+    closes = fetch_close_history({item.stock_id for item in items}, min(dates), max(dates))
+
+    prices: dict[tuple[str, str], float] = {}
+    for item, date in zip(items, dates, strict=True):
+        if item.stock_id not in closes.columns or date not in closes.index:
+            continue
+        value = closes.at[date, item.stock_id]
+        if pd.notna(value) and value > 0:
+            prices[item.key] = round(float(value), 2)
+    return prices
+
+
+def _open_broker_sheets() -> list[tuple[str, object, list[list[str]]]]:
+    """各分點分頁與其內容 (尚未建立的分點分頁略過)"""
+    opened = []
+    for broker in BROKERS:
+        try:
+            sheet = open_broker_sheet(broker)
+        except gspread.exceptions.WorksheetNotFound:
+            continue
+        opened.append((broker, sheet, sheet.get_all_values()))
+    return opened
+
+
+def _repair_history(touched: dict[str, dict[tuple[str, str], float]]) -> None:
+    """Drive 上的歷史檔一併修正：取回 → 改寫受影響的月檔 → 上傳。
+    失敗只記 warning (Sheet 已修好)；取回失敗時不上傳，避免本機不完整的副本蓋掉遠端。
+    """
+    try:
+        fetch_directory(HISTORY_DIR, DRIVE_HISTORY_FILE)
+        written = [path for broker, prices in touched.items() for path in repair_history(broker, prices)]
+        if written:
+            publish_directory(HISTORY_DIR, DRIVE_HISTORY_FILE)
+    except Exception as e:  # gspread / 網路 / Parquet 例外類型多樣
+        log.warning(f"⚠️ 歷史檔補價失敗，比較頁仍是舊價: {e}")
+
+
+def repair(scan: bool = False, path: Path = PRICE_REPAIR_FILE) -> int:
+    """處理補修佇列，回傳修好的筆數 (同一 (日期, 代號) 在各分點分頁都會補上)"""
+    queue = RepairQueue.load(path)
+    try:
+        sheets = _open_broker_sheets()
+    except SheetNotReady as e:
+        log.error(f"❌ Sheet 連線失敗: {e}")
+        return 0
+
+    if scan:
+        added = sum(
+            queue.add(date, stock_id, "scan")
+            for _, _, all_values in sheets
+            for date, stock_id in find_missing_rows(all_values)
+        )
+        log.info(f"🔎 掃描 Sheet 找到 {added} 筆新的缺價資料。")
+    if not len(queue):
+        log.info("✅ 補修佇列為空。")
+        queue.save()
+        return 0
+
+    log.info(f"🧰 補修佇列共 {len(queue)} 筆，批次查詢股價...")
+    prices = _lookup_prices(queue)
+    repaired: set[tuple[str, str]] = set()
+    touched: dict[str, dict[tuple[str, str], float]] = {}  # 分點 → 該分頁修到的股價
+    for broker, sheet, all_values in sheets:
+        updates, sheet_repaired = plan_cell_updates(all_values, prices)
+        if updates:
+            sheet.batch_update(updates)
+            log.info(f"✅ {broker} 已回寫 {len(sheet_repaired)} 筆 ({len(updates)} 個儲存格)。")
+            touched[broker] = {key: prices[key] for key in sheet_repaired}
+        repaired |= sheet_repaired
+
+    if touched:
+        # 修訂標記是整份試算表共用的 (Meta 分頁)：任一分點分頁改過都遞增一次，讀取端整份重新載入；
+        # 儀表板快照的修訂編號因此落後，app 背景比對時會改讀 Sheet
+        bump_revision(next(sheet for broker, sheet, _ in sheets if broker in touched), REWRITE)
+        _repair_history(touched)
+
+    # 查到股價但 Sheet 已無對應列 (例如當日已重寫) 的項目也一併移除
+    queue.remove(prices)
+    still_missing = [item.key for item in queue]
+    for item in queue.record_attempt(still_missing, PRICE_REPAIR_MAX_ATTEMPTS):
+        log.warning(f"⚠️ {item.date} {item.stock_id} 補修 {item.attempts} 次仍查無股價，移出佇列。")
+    queue.save()
+    if len(queue):
+        log.info(f"⏳ 尚有 {len(queue)} 筆待下次補修。")
+    return len(repaired)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="補修查無股價的 Sheet 資料")
+    parser.add_argument("--scan", action="store_true", help="先掃描整份 Sheet 的缺價列")
+    args = parser.parse_args()
+    repair(scan=args.scan)
@@ -0,0 +1,53 @@
+"""一次性匯出：把各分點分頁的既有資料寫成 Parquet 歷史檔 (HISTORY_DIR) 並上傳 Drive。
+
+使用方式：
+    python scripts/export_history.py
+
+之後由每日 pipeline (daily.py 的 history_files stage) 取回、逐日併入再上傳，不必再執行。
+重複執行是安全的：同一日期的列會整日替換，Drive 上的副本以 Sheet 的完整內容覆寫。
+"""
+from __future__ import annotations
+
+import sys
+from pathlib import Path
+
+# 讓 `python scripts/xxx.py` 能直接 import 專案 lib/settings
+ROOT = Path(__file__).resolve().parent.parent
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from lib.drive_store import publish_directory  # noqa: E402
+from lib.history_store import BROKER_COL, write_history  # noqa: E402
+from lib.logger import get_logger  # noqa: E402
+from lib.sheet import SheetNotReady, load_broker_dataframe  # noqa: E402
+from settings import BROKERS, DRIVE_HISTORY_FILE, HISTORY_DIR  # noqa: E402
+
+log = get_logger(__name__)
+
+
+def main() -> int:
+    exported = 0
+    for broker in BROKERS:
+        try:
+            df = load_broker_dataframe(broker)
+        except SheetNotReady as e:
+            log.error(f"❌ Sheet 連線失敗: {e}")
+            return 1
+        if df is None or df.empty:
+            log.info(f"ℹ️ {broker} 分頁不存在或沒有資料，略過。")
+            continue
+        if BROKER_COL not in df.columns:  # 補「分點」欄之前的舊資料
+            df[BROKER_COL] = broker
+        df[BROKER_COL] = df[BROKER_COL].replace("", broker)
+        write_history(df)
+        exported += len(df)
+        log.info(f"📤 {broker}：{len(df)} 筆")
+
+    log.info(f"✅ 匯出完成，共 {exported} 筆，寫入 {HISTORY_DIR}。")
+    if exported:
+        publish_directory(HISTORY_DIR, DRIVE_HISTORY_FILE)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
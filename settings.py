@@ -1,16 +1,90 @@
 """專案共用常數設定"""
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent
 
 SHEET_NAME = "Stock_Data"
 WATCHLIST_SHEET_TAB = "Watchlist"  # 存放 watchlist 的第二分頁
+META_SHEET_TAB = "Meta"  # 第一頁的修訂標記 (寫入端每次寫完遞增，app.py 據此判斷是否重新載入)
 JSON_FILE_NAME = "service_account.json"
 LINE_SECRET_FILE = "line_secret.json"
 
-BROKER_ID = "9A91"  # 永豐金-松山
+BROKER_ID = "9A91"  # 永豐金-松山 (預設分點：寫入第一頁，notify / app 以此分點為準)
+# 追蹤的分點 (代號 → 名稱)；預設分點以外的分點各自寫入「分點_<代號>」分頁
+BROKERS = {
+    "9A91": "永豐金-松山",
+}
+BROKER_TAB_PREFIX = "分點_"
+BROKER_CRAWL_CONCURRENCY = 4  # 同時爬取的分點數
+FUBON_MIN_INTERVAL = 1.0  # 所有分點共用：對富邦兩次請求的最小間隔 (秒)
 
 # 舊的 YAML 路徑保留作為 migration 用 (一次性搬進 Sheet 後可刪除)
 WATCHLIST_FILE = BASE_DIR / "config" / "watchlist.yaml"
 ALERTS_FILE = BASE_DIR / "config" / "alerts.yaml"
 PROGRESS_FILE = BASE_DIR / ".progress.json"
+ALERT_STATE_FILE = BASE_DIR / ".alert_state.json"  # notify 增量告警狀態
+
+# app.py watchlist 快取：超過這麼久才再讀一次版本格 (版本變了才重讀整頁)
+WATCHLIST_REVALIDATE_SECONDS = 10
+# app.py 資料集在 process 內快取的秒數；過期後背景重新載入，期間仍提供舊資料
+APP_DATA_TTL = 60
+APP_PAGE_SIZE = 50  # 選股清單每頁檔數
+APP_DATA_MAX_AGE = 6 * 3600  # 修訂標記沒變也至少每隔這麼久完整重新載入一次 (標記寫入失敗時的保險)
+# 每日 pipeline 預建的儀表板快照 (lib/dashboard.py)；app 啟動時直接載入，超過 MAX_AGE 秒視為過舊
+APP_ARTIFACT_DIR = BASE_DIR / ".dashboard"
+APP_ARTIFACT_MAX_AGE = 36 * 3600
+# 個股圖表區間超過這些天數時改用週 / 月彙總 (lib/rollups.py)
+ROLLUP_WEEKLY_AFTER_DAYS = 90
+ROLLUP_MONTHLY_AFTER_DAYS = 365
+
+# 各分點逐日資料的本機 Parquet 副本 (lib/history_store.py)，跨分點比較頁以 DuckDB 查詢
+HISTORY_DIR = BASE_DIR / ".history"
+
+# 排程與 app 經服務帳號的 Google Drive 交換本機目錄 (lib/drive_store.py)
+# DRIVE_FOLDER_ID：放檔案的資料夾 (共用給服務帳號，建議放在共用雲端硬碟)；由環境變數 / Secrets 提供。
+# 服務帳號自己的雲端硬碟沒有儲存配額，未設定時不上傳 (只記 warning)
+DRIVE_FOLDER_ID = os.environ.get("DRIVE_FOLDER_ID") or None
+DRIVE_HISTORY_FILE = "stock_history.tar"  # HISTORY_DIR 的打包副本
+DRIVE_ARTIFACT_FILE = "dashboard_artifact.tar"  # APP_ARTIFACT_DIR 的打包副本
+DRIVE_SYNC_TTL = 600  # app 每隔這麼久 (秒) 才再檢查一次 Drive 上的副本有沒有更新
+
+# main.py → notify.py 當日快照 (同一次排程內交接)
+SNAPSHOT_DIR = BASE_DIR / ".snapshot"
+SNAPSHOT_MAX_AGE_HOURS = 12
+
+# 批次行情缺漏時逐檔補查股價：並行上限、單次期限 (秒)、整段預算 (秒)、
+# 連續失敗斷路門檻與斷路冷卻 (秒)
+PRICE_LOOKUP_CONCURRENCY = 8
+PRICE_CALL_TIMEOUT = 10
+PRICE_STAGE_BUDGET = 120
+PRICE_BREAKER_THRESHOLD = 5
+PRICE_BREAKER_COOLDOWN = 300
+
+# 查無股價的 (日期, 代號) 補修佇列；補修失敗達上限次數後移出
+PRICE_REPAIR_FILE = BASE_DIR / ".price_repair.json"
+PRICE_REPAIR_MAX_ATTEMPTS = 5
+
+# 期限感知降級 (python -m daily --deadline HH:MM)
+DEADLINE_TZ = "Asia/Taipei"
+DEADLINE_RESERVE_SECONDS = 30  # 預留給 LINE 發送等收尾
+STAGE_TIMINGS_FILE = BASE_DIR / ".stage_timings.json"  # 上次各 stage 實測耗時
+# 首次執行 (尚無實測) 的耗時估計 (秒)；冒號後為降級模式
+STAGE_TIME_ESTIMATES = {
+    "crawl": 10,
+    "sheet_read": 10,
+    "prices:full": 90,
+    "prices:watchlist": 20,
+    "prices:cached": 5,
+    "rows": 1,
+    "sheet_write": 20,
+    "notify:full": 30,
+    "notify:minimal": 10,
+}
+PRICE_CACHE_FILE = BASE_DIR / ".price_cache.json"  # 各股最近一次取得的收盤價
+
+# 盤中輪詢 (python -m intraday)；時間為 DEADLINE_TZ
+INTRADAY_POLL_INTERVAL = 300  # 兩次輪詢間隔 (秒)
+INTRADAY_START = "09:00"
+INTRADAY_END = "13:35"
+INTRADAY_STATE_FILE = BASE_DIR / ".intraday_state.json"  # 上次輪詢的列摘要 + 已推播命中
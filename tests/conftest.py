@@ -1,5 +1,7 @@
 """Pytest 共用 fixture。"""
+import itertools
 from pathlib import Path
+from types import SimpleNamespace
 
 import pytest
 
@@ -14,3 +16,61 @@ def fubon_html() -> str:
 @pytest.fixture
 def histock_html() -> str:
     return (FIXTURES_DIR / "histock_sample.html").read_text(encoding="utf-8")
+
+
+class FakeResponse(SimpleNamespace):
+    """requests.Response 會用到的部分"""
+
+    def raise_for_status(self) -> None:
+        pass
+
+    def iter_content(self, chunk_size: int):
+        for i in range(0, len(self.content), chunk_size):
+            yield self.content[i:i + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+class FakeDrive:
+    """模擬已授權的 requests session 對 Drive v3 端點的請求"""
+
+    def __init__(self) -> None:
+        self.files: dict[str, dict] = {}  # id → {name, content, modifiedTime}
+        self.downloads = 0
+        self.streamed = 0
+        self._clock = itertools.count(1)
+
+    def request(self, method, url, params=None, data=None, json=None, headers=None, stream=False, timeout=None):
+        params = params or {}
+        if method == "get" and params.get("alt") == "media":
+            self.downloads += 1
+            self.streamed += stream
+            return FakeResponse(content=self.files[url.rsplit("/", 1)[1]]["content"])
+        if method == "get":
+            name = params["q"].split("'")[1]
+            found = [
+                {"id": file_id, "modifiedTime": f["modifiedTime"]}
+                for file_id, f in self.files.items()
+                if f["name"] == name
+            ]
+            return FakeResponse(json=lambda: {"files": found})
+        if method == "post":
+            file_id = f"id{len(self.files)}"
+            self.files[file_id] = {"name": json["name"], "content": b"", "modifiedTime": ""}
+            return FakeResponse(json=lambda: {"id": file_id})
+        if method == "patch":
+            file = self.files[url.rsplit("/", 1)[1]]
+            file["content"] = data
+            file["modifiedTime"] = f"2025-01-0{next(self._clock)}T00:00:00Z"
+            return FakeResponse()
+        raise AssertionError(f"unexpected {method} {url}")
+
+
+@pytest.fixture
+def fake_drive(monkeypatch) -> FakeDrive:
+    monkeypatch.setattr("lib.drive_store.DRIVE_FOLDER_ID", "folder")
+    return FakeDrive()
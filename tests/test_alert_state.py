@@ -0,0 +1,155 @@
+"""增量告警狀態測試 — 逐日套用須與全量重算完全一致"""
+from __future__ import annotations
+
+import random
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from lib.alert_state import AlertState, load_or_rebuild, load_state, verify_state
+from lib.alerts import _compute_consecutive_days, evaluate_rankings
+from lib.sheet import APPEND, REWRITE, SheetRevision
+
+RULES = [
+    {"kind": "ranking", "name": "近3日買超", "window_days": 3,
+     "metric": "net_sheets", "direction": "buy", "top_n": 5},
+    {"kind": "ranking", "name": "近5日賣超", "window_days": 5,
+     "metric": "net_amount_k", "direction": "sell", "top_n": 5},
+]
+
+
+def _random_history(seed: int = 7, days: int = 15) -> pd.DataFrame:
+    rng = random.Random(seed)
+    dates = pd.bdate_range("2025-01-01", periods=days)
+    rows = []
+    for date in dates:
+        for sid in ("1111", "2222", "3333", "4444", "5555"):
+            if rng.random() < 0.3:
+                continue  # 當日未出現
+            sheets = rng.choice([-300, -50, 0, 20, 80, 500])
+            rows.append({
+                "日期": date,
+                "代號": sid,
+                "名稱": f"股{sid}",
+                "買賣別": "",
+                "買賣超金額(千)": float(sheets * 40),
+                "收盤價": 40.0,
+                "估算張數": float(sheets),
+            })
+    return pd.DataFrame(rows)
+
+
+def test_incremental_matches_full_recompute() -> None:
+    df = _random_history()
+    state = AlertState(window=5)
+    for date, daily in df.groupby("日期", sort=True):
+        state.apply_day(daily, date)
+        assert verify_state(state, df, date, RULES) == []
+
+
+def test_rerun_same_day_is_idempotent() -> None:
+    df = _random_history()
+    last = df["日期"].max()
+    state = AlertState.rebuild(df, last, window=5)
+    before = state.to_dict()
+
+    daily = df[df["日期"] == last]
+    state.apply_day(daily, last)
+    assert state.to_dict() == before
+
+    # 同日資料被改寫後重跑 → 以新資料為準
+    changed = daily.assign(估算張數=-1.0, **{"買賣超金額(千)": -40.0})
+    state.apply_day(changed, last)
+    patched = pd.concat([df[df["日期"] < last], changed])
+    assert verify_state(state, patched, last, RULES) == []
+
+
+def test_sync_applies_new_dates(tmp_path: Path) -> None:
+    df = _random_history()
+    dates = sorted(df["日期"].unique())
+    path = tmp_path / "state.json"
+    AlertState.rebuild(df, dates[-4], window=5).save(path)
+
+    state = load_or_rebuild(df, dates[-1], window=5, path=path)
+    assert state.last_date == pd.Timestamp(dates[-1]).strftime("%Y-%m-%d")
+    assert verify_state(state, df, dates[-1], RULES) == []
+
+
+def test_sync_detects_gap() -> None:
+    df = _random_history()
+    dates = sorted(df["日期"].unique())
+    state = AlertState.rebuild(df, dates[2], window=5)
+    assert state.sync(df[df["日期"] > dates[5]], dates[-1]) is False
+    assert state.sync(df, dates[1]) is False  # 日期倒退
+
+
+def test_window_frame_rankings_and_streaks() -> None:
+    df = _random_history(seed=3)
+    last = df["日期"].max()
+    state = AlertState.rebuild(df, last, window=5)
+    assert evaluate_rankings(state.window_frame(), last, RULES) == evaluate_rankings(
+        df, last, RULES
+    )
+    for sid in ("1111", "2222", "3333"):
+        assert state.streaks(sid) == _compute_consecutive_days(df, sid, last)
+
+
+def test_load_state_rejects_smaller_window(tmp_path: Path) -> None:
+    df = _random_history()
+    path = tmp_path / "state.json"
+    AlertState.rebuild(df, df["日期"].max(), window=3).save(path)
+    assert load_state(3, path) is not None
+    assert load_state(5, path) is None
+
+
+def test_apply_day_rejects_older_date() -> None:
+    df = _random_history()
+    dates = sorted(df["日期"].unique())
+    state = AlertState.rebuild(df, dates[3], window=3)
+    with pytest.raises(ValueError):
+        state.apply_day(df[df["日期"] == dates[1]], dates[1])
+
+
+def test_rewrite_after_sync_forces_rebuild(tmp_path: Path) -> None:
+    df = _random_history()
+    dates = sorted(df["日期"].unique())
+    path = tmp_path / "state.json"
+    state = AlertState.rebuild(df, dates[-2], window=5)
+    state.revision = 7
+    state.save(path)
+
+    # 上次同步後只有一次附加寫入 → 增量同步並記下新的修訂編號
+    appended = SheetRevision(8, APPEND, 100, "")
+    state = load_or_rebuild(df, dates[-1], window=5, path=path, revision=appended)
+    assert state.revision == 8
+    assert verify_state(state, df, dates[-1], RULES) == []
+
+    # 歷史被改寫 (日期沒變) → 不能沿用舊的連續天數，須以完整歷史重建
+    rewritten = df.assign(估算張數=-df["估算張數"])
+    loaded = []
+
+    def _load_full() -> pd.DataFrame:
+        loaded.append(True)
+        return rewritten
+
+    state.save(path)
+    recent = rewritten[rewritten["日期"] >= dates[-2]]
+    state = load_or_rebuild(
+        recent, dates[-1], window=5, path=path, load_full=_load_full,
+        revision=SheetRevision(9, REWRITE, 0, ""),
+    )
+    assert loaded == [True]
+    assert state.revision == 9
+    assert verify_state(state, rewritten, dates[-1], RULES) == []
+
+
+def test_outdated_by() -> None:
+    state = AlertState(window=3)
+    assert state.outdated_by(None) is False
+    assert state.outdated_by(SheetRevision(1, APPEND, 0, "")) is True  # 舊狀態檔沒有記錄
+    state.revision = 4
+    assert state.outdated_by(SheetRevision(4, REWRITE, 0, "")) is False
+    assert state.outdated_by(SheetRevision(5, APPEND, 10, "")) is False
+    assert state.outdated_by(SheetRevision(5, REWRITE, 0, "")) is True
+    assert state.outdated_by(SheetRevision(6, APPEND, 10, "")) is True  # 錯過一次寫入
@@ -3,12 +3,16 @@ from __future__ import annotations
 
 import pandas as pd
 
+import lib.alerts as alerts_mod
 from lib.alerts import (
     _compute_consecutive_days,
     _safe_eval_condition,
+    build_stock_metrics,
     compute_rankings,
     evaluate_conditions,
     evaluate_rankings,
+    required_variables,
+    rule_variables,
 )
 
 # ---- _safe_eval_condition ----
@@ -155,6 +159,107 @@ def test_evaluate_conditions_skips_ranking_rules() -> None:
     assert hits == []
 
 
+def test_evaluate_conditions_skips_unused_streak_scan(monkeypatch) -> None:
+    df = _make_df([("2025-01-01", "1234", 100)])
+
+    def _boom(*args, **kwargs):
+        raise AssertionError("streak scan should not run")
+
+    monkeypatch.setattr(alerts_mod, "_compute_consecutive_days", _boom)
+    # 規則沒命中：只算 net_sheets，不必為了通知內文掃連續天數
+    rules = [{"kind": "condition", "name": "賣超", "when": "net_sheets < 0"}]
+    hits = evaluate_conditions(
+        df_full=df,
+        stock_id="1234",
+        stock_name="股1234",
+        target_date=pd.Timestamp("2025-01-01"),
+        market_price=50.0,
+        concentration=0.0,
+        rules=rules,
+    )
+    assert hits == []
+
+
+def test_evaluate_conditions_hit_carries_display_fields() -> None:
+    df = _make_df([
+        ("2025-01-01", "1234", 100),
+        ("2025-01-02", "1234", 200),
+    ])
+    rules = [{"kind": "condition", "name": "買超", "when": "net_sheets > 0"}]
+    hits = evaluate_conditions(
+        df_full=df,
+        stock_id="1234",
+        stock_name="股1234",
+        target_date=pd.Timestamp("2025-01-02"),
+        market_price=50.0,
+        concentration=12.5,
+        rules=rules,
+    )
+    assert len(hits) == 1
+    extra = hits[0].extra
+    assert extra["net_sheets"] == 200
+    assert extra["concentration"] == 12.5
+    assert extra["market_price"] == 50.0
+    assert extra["consecutive_buy_days"] == 2
+    assert extra["consecutive_sell_days"] == 0
+    assert "avg_cost" in extra
+
+
+# ---- rule variables / lazy metrics ----
+
+def test_rule_variables_only_allowed_names() -> None:
+    assert rule_variables("concentration >= 5 and net_sheets > 0") == {
+        "concentration",
+        "net_sheets",
+    }
+    assert rule_variables("foo > 0") == frozenset()
+    assert rule_variables("!@# not python") == frozenset()
+
+
+def test_required_variables_ignores_ranking_rules() -> None:
+    rules = [
+        {"kind": "condition", "when": "consecutive_buy_days >= 3"},
+        {"kind": "condition", "when": "market_price < avg_cost"},
+        {"kind": "ranking", "metric": "net_sheets"},
+    ]
+    assert required_variables(rules) == {
+        "consecutive_buy_days",
+        "market_price",
+        "avg_cost",
+    }
+
+
+def test_build_stock_metrics_subset() -> None:
+    df = _make_df([
+        ("2025-01-01", "1234", -10),
+        ("2025-01-02", "1234", -20),
+    ])
+    metrics = build_stock_metrics(
+        df, "1234", pd.Timestamp("2025-01-02"), 48.0, 0.0,
+        variables={"consecutive_sell_days"},
+    )
+    assert metrics == {"consecutive_sell_days": 2}
+
+
+def test_build_stock_metrics_default_is_full_set() -> None:
+    df = _make_df([("2025-01-01", "1234", 100)])
+    metrics = build_stock_metrics(df, "1234", pd.Timestamp("2025-01-01"), 51.0, 2.5)
+    assert metrics == {
+        "net_sheets": 100,
+        "net_amount_k": 5000,
+        "concentration": 2.5,
+        "market_price": 51.0,
+        "avg_cost": 50.0,
+        "consecutive_buy_days": 1,
+        "consecutive_sell_days": 0,
+    }
+
+
+def test_build_stock_metrics_missing_today() -> None:
+    df = _make_df([("2025-01-01", "1234", 100)])
+    assert build_stock_metrics(df, "1234", pd.Timestamp("2025-01-02"), 50.0, 0.0) == {}
+
+
 # ---- compute_rankings / evaluate_rankings ----
 
 def test_compute_rankings_buy_top_n() -> None:
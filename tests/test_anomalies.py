@@ -0,0 +1,108 @@
+"""籌碼異常偵測測試"""
+from __future__ import annotations
+
+import pandas as pd
+
+from lib.anomalies import compute_anomalies, evaluate_anomalies
+
+
+def _history() -> pd.DataFrame:
+    dates = pd.bdate_range("2025-01-01", periods=11)
+    base = {"1111": [10, 12, 9, 11, 10, 13, 8, 10, 12, 11], "2222": [5] * 10}
+    rows = []
+    for i, date in enumerate(dates):
+        for sid, series in base.items():
+            if i < 10:
+                sheets = series[i]
+            else:
+                sheets = {"1111": 200, "2222": 500}[sid]  # 當日異常
+            rows.append({
+                "日期": date,
+                "代號": sid,
+                "名稱": f"股{sid}",
+                "估算張數": sheets,
+                "買賣超金額(千)": sheets * 10,
+            })
+        if i in (3, 10):
+            rows.append({
+                "日期": date, "代號": "3333", "名稱": "股3333",
+                "估算張數": -100, "買賣超金額(千)": -1000,
+            })
+    return pd.DataFrame(rows)
+
+
+def test_compute_anomalies_flags_spike() -> None:
+    df = _history()
+    result = compute_anomalies(
+        df, df["日期"].max(), "net_sheets", window_days=10, threshold=3.5
+    )
+    # 2222 歷史無波動 (MAD=0) 仍以尺度下限判定 (5 → 500)；3333 出現天數不足 → 不判定
+    assert result["代號"].tolist() == ["2222", "1111"]
+    flat = result.iloc[0]
+    assert flat["median"] == 5
+    assert flat["z"] == (500 - 5) / 1.0
+    row = result.iloc[1]
+    assert row["名稱"] == "股1111"
+    assert row["value"] == 200
+    assert row["median"] == 10.5
+    assert row["z"] > 3.5
+
+
+def test_compute_anomalies_direction_filter() -> None:
+    df = _history()
+    assert compute_anomalies(
+        df, df["日期"].max(), "net_sheets", window_days=10, threshold=3.5, direction="sell"
+    ).empty
+
+
+def test_compute_anomalies_requires_target_date() -> None:
+    df = _history()
+    assert compute_anomalies(
+        df, pd.Timestamp("2030-01-01"), "net_sheets", window_days=10, threshold=3.5
+    ).empty
+
+
+def test_evaluate_anomalies_payload() -> None:
+    df = _history()
+    rules = [
+        {"kind": "anomaly", "name": "異常", "metric": "net_amount_k",
+         "window_days": 10, "threshold": 3.0, "min_periods": 5, "emoji": "📡"},
+        {"kind": "ranking", "name": "不相干"},
+    ]
+    result = evaluate_anomalies(df, df["日期"].max(), rules)
+    assert list(result) == ["異常"]
+    payload = result["異常"]
+    assert payload["window_days"] == 10
+    assert [r["代號"] for r in payload["records"]] == ["2222", "1111"]
+
+
+def test_compute_anomalies_flat_history_small_move() -> None:
+    dates = pd.bdate_range("2025-01-01", periods=11)
+    df = pd.DataFrame({
+        "日期": dates,
+        "代號": "4444",
+        "名稱": "股4444",
+        "估算張數": [0, 0, 0, 0, 0, 0, 0, 0, 3, 0, 2],
+        "買賣超金額(千)": 0,
+    })
+    # MAD 為 0 時改用平均絕對偏差，小幅變動不會被放大成異常
+    assert compute_anomalies(
+        df, dates[-1], "net_sheets", window_days=10, threshold=3.5
+    ).empty
+
+
+def test_compute_anomalies_counts_missing_days_as_zero() -> None:
+    dates = pd.bdate_range("2025-01-01", periods=21)
+    active = dict(zip([1, 4, 8, 11, 15, 18], [100, 80, 120, 90, 110, 100], strict=True))
+    rows = [{"日期": d, "代號": "6666", "名稱": "股6666", "估算張數": 1} for d in dates]
+    rows += [
+        {"日期": dates[i], "代號": "5555", "名稱": "股5555", "估算張數": v}
+        for i, v in [*active.items(), (20, 150)]
+    ]
+    df = pd.DataFrame(rows).assign(**{"買賣超金額(千)": 0})
+
+    result = compute_anomalies(df, dates[-1], "net_sheets", window_days=20, threshold=3.5)
+    # 只看有成交的 6 天時中位數 100、z ≈ 3.4 (不會標出)；沒成交的 14 天補 0 後基準為 0，150 張是爆量
+    assert result["代號"].tolist() == ["5555"]
+    assert result.iloc[0]["median"] == 0
+    assert result.iloc[0]["z"] > 3.5
@@ -0,0 +1,47 @@
+"""lib/brokers.py 測試 — 富邦分點參數、共用限速與並行爬取"""
+from __future__ import annotations
+
+import threading
+import time
+
+from lib.brokers import RateLimiter, crawl_brokers, fubon_params, fubon_url
+
+
+def test_fubon_params_encode_branch() -> None:
+    assert fubon_params("9A91") == ("9A00", "0039004100390031")
+    assert fubon_url("9a91", "2025-01-03").endswith(
+        "?a=9A00&b=0039004100390031&c=B&e=2025-01-03&f=2025-01-03"
+    )
+
+
+def test_rate_limiter_spaces_requests_across_threads() -> None:
+    limiter = RateLimiter(min_interval=0.05)
+    stamps: list[float] = []
+    lock = threading.Lock()
+
+    def hit() -> None:
+        limiter.wait()
+        with lock:
+            stamps.append(time.monotonic())
+
+    threads = [threading.Thread(target=hit) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    stamps.sort()
+    gaps = [b - a for a, b in zip(stamps, stamps[1:], strict=False)]
+    assert min(gaps) >= 0.04
+
+
+def test_crawl_brokers_runs_concurrently_and_keeps_order() -> None:
+    barrier = threading.Barrier(2, timeout=5)
+
+    def fetch(branch: str) -> list[dict]:
+        barrier.wait()  # 兩個分點必須同時爬取才會通過
+        return [{"id": branch}]
+
+    result = crawl_brokers(["9A92", "9A91", "9A92"], fetch, RateLimiter(min_interval=0))
+    assert list(result) == ["9A92", "9A91"]
+    assert result["9A91"] == [{"id": "9A91"}]
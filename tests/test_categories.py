@@ -0,0 +1,92 @@
+"""分類層級流向彙總測試"""
+from __future__ import annotations
+
+import pandas as pd
+
+from lib.categories import (
+    category_daily_flows,
+    category_mapping,
+    compute_category_flows,
+    evaluate_category_rules,
+)
+
+WATCHLIST = {
+    "1111": {"name": "Alpha", "category": "車用/工控"},
+    "2222": {"name": "Beta", "category": "車用/工控"},
+    "3333": {"name": "Gamma", "category": "消費電子"},
+}
+
+
+def _make_df(rows: list[tuple[str, str, int]]) -> pd.DataFrame:
+    return pd.DataFrame([
+        {
+            "日期": pd.Timestamp(date),
+            "代號": sid,
+            "名稱": f"股{sid}",
+            "估算張數": sheets,
+            "買賣超金額(千)": sheets * 10,
+        }
+        for date, sid, sheets in rows
+    ])
+
+
+def _history() -> pd.DataFrame:
+    return _make_df([
+        ("2025-01-01", "1111", 10),
+        ("2025-01-01", "3333", -5),
+        ("2025-01-02", "1111", 20),
+        ("2025-01-02", "2222", -5),   # 車用/工控 當日仍淨買 15
+        ("2025-01-03", "2222", 30),
+        ("2025-01-03", "3333", 7),
+        ("2025-01-03", "9999", 999),  # 不在 watchlist
+    ])
+
+
+def test_category_mapping_is_cached() -> None:
+    first = category_mapping(WATCHLIST)
+    assert category_mapping(dict(WATCHLIST)) is first
+    assert first["3333"] == "消費電子"
+
+
+def test_category_daily_flows_sums_per_date() -> None:
+    flows = category_daily_flows(_history(), category_mapping(WATCHLIST))
+    auto = flows[flows["分類"] == "車用/工控"].set_index("日期")["net_sheets"]
+    assert auto.tolist() == [10, 15, 30]
+    assert "9999" not in flows.to_string()
+
+
+def test_compute_category_flows_streaks() -> None:
+    flows = compute_category_flows(
+        _history(), category_mapping(WATCHLIST), pd.Timestamp("2025-01-03"), 3, "net_sheets"
+    ).set_index("分類")
+    assert flows.loc["車用/工控", "total"] == 55
+    assert flows.loc["車用/工控", "buy_streak"] == 3
+    # 消費電子 01-02 無成交 → 視為 0 中斷連續
+    assert flows.loc["消費電子", "buy_streak"] == 1
+    assert flows.loc["消費電子", "sell_streak"] == 0
+
+
+def test_evaluate_category_rules() -> None:
+    rules = [
+        {"kind": "category_ranking", "name": "分類買超", "window_days": 2,
+         "metric": "net_sheets", "direction": "buy", "top_n": 1},
+        {"kind": "category_streak", "name": "分類連買", "metric": "net_sheets",
+         "direction": "buy", "min_days": 3},
+        {"kind": "ranking", "name": "不相干", "window_days": 3},
+    ]
+    result = evaluate_category_rules(
+        _history(), pd.Timestamp("2025-01-03"), rules, category_mapping(WATCHLIST)
+    )
+    assert set(result) == {"分類買超", "分類連買"}
+    ranking = result["分類買超"]["records"]
+    assert [r["分類"] for r in ranking] == ["車用/工控"]
+    assert ranking[0]["total"] == 45
+    streak = result["分類連買"]["records"]
+    assert [(r["分類"], r["buy_streak"]) for r in streak] == [("車用/工控", 3)]
+
+
+def test_evaluate_category_rules_empty_watchlist() -> None:
+    rules = [{"kind": "category_ranking", "name": "x"}]
+    assert evaluate_category_rules(
+        _history(), pd.Timestamp("2025-01-03"), rules, category_mapping({})
+    ) == {}
@@ -0,0 +1,31 @@
+"""lib/charts.py 測試 — 單檔圖表序列與圖表規格"""
+from __future__ import annotations
+
+import pandas as pd
+
+from lib.charts import BUY_COLOR, SELL_COLOR, chart_series, flow_figure
+
+
+def _rows() -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "日期": pd.to_datetime(["2025-01-02", "2025-01-03", "2025-01-06"]),
+            "代號": ["1111"] * 3,
+            "收盤價": [50.0, 51.0, 49.5],
+            "估算張數": [10, -4, 0],
+        },
+        index=[7, 3, 9],
+    )
+
+
+def test_chart_series_cumsum_and_colors() -> None:
+    series = chart_series(_rows())
+    assert series["累積張數"].tolist() == [10, 6, 6]
+    assert series["顏色"].tolist() == [BUY_COLOR, SELL_COLOR, SELL_COLOR]
+    assert series.index.tolist() == [0, 1, 2]
+
+
+def test_flow_figure_has_bar_and_line() -> None:
+    fig = flow_figure(chart_series(_rows()))
+    assert [trace.type for trace in fig.data] == ["bar", "scatter"]
+    assert list(fig.data[1].y) == [10, 6, 6]
@@ -0,0 +1,95 @@
+"""儀表板快照測試 — 寫出後還原的索引與直接建立的結果一致；過舊 / 不存在時回傳 None"""
+from __future__ import annotations
+
+import json
+import time
+
+import pandas as pd
+import pandas.testing as pdt
+
+from lib import dashboard
+from lib.dashboard import (
+    DashboardData,
+    fetch_artifact,
+    load_artifact,
+    publish_artifact,
+    write_artifact,
+)
+from lib.sheet import REWRITE, SheetData, SheetRevision
+
+
+def _make_df() -> pd.DataFrame:
+    rows = [
+        ("2025-01-03", "2222", "乙", 300, 15),
+        ("2025-01-02", "1111", "甲", 100, 10),
+        ("2025-01-03", "1111", "甲", -40, -4),
+        ("2025-01-06", "1111", "甲", 50, 5),
+        ("2025-02-03", "2222", "乙", -20, -1),
+    ]
+    return pd.DataFrame(
+        [
+            {
+                "日期": pd.Timestamp(d), "代號": sid, "名稱": name, "買賣別": "買超",
+                "買賣超金額(千)": float(amt), "收盤價": 10.0, "估算張數": float(sheets), "分點": "9A91",
+            }
+            for d, sid, name, amt, sheets in rows
+        ]
+    )
+
+
+def _data(created_at: float | None = None) -> DashboardData:
+    sheet = SheetData(_make_df(), SheetRevision(3, REWRITE, 0, "t"), created_at or time.time())
+    return DashboardData.build(sheet)
+
+
+def test_artifact_round_trip_matches_fresh_build(tmp_path) -> None:
+    data = _data()
+    write_artifact(data, tmp_path / "dash")
+    loaded = load_artifact(tmp_path / "dash")
+
+    assert loaded is not None
+    assert loaded.sheet.revision == data.sheet.revision
+    pdt.assert_frame_equal(loaded.sheet.frame, data.sheet.frame)
+    pdt.assert_frame_equal(loaded.flows.window("2025-01-02", "2025-01-06"), data.flows.window("2025-01-02", "2025-01-06"))
+    assert loaded.flows.trading_days() == data.flows.trading_days()
+    assert loaded.flows.period("2025-01-03", "2025-01-03")["代號"].tolist() == ["2222", "1111"]
+    assert loaded.history.stock_range("1111", "2025-01-03")["估算張數"].tolist() == [-4.0, 5.0]
+    pdt.assert_frame_equal(
+        loaded.rollups.stock_range("W", "1111").reset_index(drop=True),
+        data.rollups.stock_range("W", "1111").reset_index(drop=True),
+    )
+
+
+def test_stale_missing_or_other_version_falls_back(tmp_path) -> None:
+    assert load_artifact(tmp_path / "none") is None
+
+    write_artifact(_data(created_at=time.time() - 3600), tmp_path / "dash")
+    assert load_artifact(tmp_path / "dash", max_age=60) is None
+    assert load_artifact(tmp_path / "dash", max_age=7200) is not None
+
+    manifest_path = tmp_path / "dash" / "manifest.json"
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    manifest_path.write_text(json.dumps({**manifest, "version": 0}), encoding="utf-8")
+    assert load_artifact(tmp_path / "dash") is None
+
+
+def test_artifact_travels_through_drive(tmp_path, monkeypatch, fake_drive) -> None:
+    monkeypatch.setattr("lib.drive_store._http", lambda: fake_drive)
+    write_artifact(_data(), tmp_path / "runner")
+    publish_artifact(tmp_path / "runner")
+
+    assert fetch_artifact(tmp_path / "app") is True
+    assert fetch_artifact(tmp_path / "app") is False  # 遠端沒更新
+    loaded = load_artifact(tmp_path / "app")
+    assert loaded is not None
+    pdt.assert_frame_equal(loaded.sheet.frame, _data().sheet.frame)
+
+
+def test_fetch_failure_keeps_local_artifact(tmp_path, monkeypatch) -> None:
+    def boom(directory, name):
+        raise ConnectionError("drive down")
+
+    monkeypatch.setattr(dashboard, "fetch_directory", boom)
+    write_artifact(_data(), tmp_path / "dash")
+    assert fetch_artifact(tmp_path / "dash") is False
+    assert load_artifact(tmp_path / "dash") is not None
@@ -0,0 +1,99 @@
+"""SWRCache 測試 — 過期時回傳舊資料並在背景重新載入"""
+from __future__ import annotations
+
+import threading
+
+from lib.data_cache import SWRCache
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_stale_get_serves_old_value_while_refreshing() -> None:
+    clock = FakeClock()
+    release = threading.Event()
+    loads: list[int] = []
+
+    def loader(previous: int | None) -> int:
+        loads.append(len(loads) + 1)
+        if len(loads) > 1:
+            release.wait(5)  # 背景載入被卡住時，請求仍要拿得到舊資料
+        return len(loads)
+
+    cache = SWRCache(loader, ttl=60, clock=clock)
+    assert cache.get().value == 1
+
+    clock.now = 61
+    entry = cache.get()
+    assert (entry.value, entry.version) == (1, 1)
+    assert cache.get().value == 1  # 背景載入進行中，不會再啟動第二個
+    release.set()
+    cache.wait(5)
+    entry = cache.get()
+    assert (entry.value, entry.version) == (2, 2)
+    assert loads == [1, 2]
+
+
+def test_failed_refresh_keeps_value_and_waits_for_next_ttl() -> None:
+    clock = FakeClock()
+    results = iter([1, RuntimeError("boom"), 3, 4])
+
+    def loader(previous: int | None) -> int:
+        result = next(results)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    cache = SWRCache(loader, ttl=60, clock=clock)
+    cache.get()
+    clock.now = 61
+    cache.get()
+    cache.wait(5)
+    assert cache.get().value == 1  # 失敗後保留舊資料，ttl 內不重試
+    cache.wait(5)
+
+    cache.invalidate()
+    cache.get()
+    cache.wait(5)
+    entry = cache.get()
+    assert (entry.value, entry.version) == (3, 2)
+    assert cache.refresh().value == 4
+
+
+def test_loader_returning_previous_value_keeps_version() -> None:
+    clock = FakeClock()
+    seen: list[int | None] = []
+
+    def loader(previous: int | None) -> int:
+        seen.append(previous)
+        return previous if previous is not None else 7
+
+    cache = SWRCache(loader, ttl=60, clock=clock)
+    first = cache.get()
+    clock.now = 61
+    cache.get()
+    cache.wait(5)
+    assert cache.get() is first
+    assert cache.refresh().version == 2  # 完整重新載入不帶上一版
+    assert seen == [None, 7, None]
+
+
+def test_initial_value_is_served_and_revalidated_in_background() -> None:
+    clock = FakeClock()
+    seen: list[int | None] = []
+
+    def loader(previous: int | None) -> int:
+        seen.append(previous)
+        return 5
+
+    cache = SWRCache(loader, ttl=60, clock=clock, initial=4)
+    entry = cache.get()
+    assert (entry.value, entry.version) == (4, 1)  # 不等待載入
+    cache.wait(5)
+    assert seen == [4]  # 背景以預建值當上一版驗證
+    assert (cache.get().value, cache.get().version) == (5, 2)
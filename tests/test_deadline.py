@@ -0,0 +1,62 @@
+"""期限降級規劃測試 — 以假時鐘驗證模式選擇與耗時估計更新"""
+from __future__ import annotations
+
+import datetime
+from zoneinfo import ZoneInfo
+
+from lib.deadline import DeadlinePlanner, parse_deadline
+
+TZ = ZoneInfo("Asia/Taipei")
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _planner(seconds_left: float, clock: FakeClock) -> DeadlinePlanner:
+    deadline = datetime.datetime.now(TZ) + datetime.timedelta(seconds=seconds_left)
+    estimates = {"prices:full": 90, "prices:cached": 5, "notify:full": 30, "notify:minimal": 10}
+    return DeadlinePlanner(deadline, estimates, reserve=10, clock=clock)
+
+
+PRICE_OPTIONS = [
+    ("full", ["prices:full", "notify:full"]),
+    ("cached", ["prices:cached", "notify:full"]),
+]
+
+
+def test_choose_degrades_as_deadline_approaches() -> None:
+    clock = FakeClock()
+    planner = _planner(200, clock)
+    assert planner.choose("prices", PRICE_OPTIONS) == "full"
+
+    clock.now = 100  # 剩約 100s：full 需要 120 + 10
+    assert planner.choose("prices", PRICE_OPTIONS) == "cached"
+
+    clock.now = 199  # 都來不及時取降級最多的模式
+    assert planner.choose("prices", PRICE_OPTIONS) == "cached"
+    assert planner.decisions == {"prices": "cached"}
+
+
+def test_live_timings_update_estimates() -> None:
+    clock = FakeClock()
+    planner = _planner(200, clock)
+    planner.record("notify:full", 230)
+    assert planner.estimates["notify:full"] == 130  # 30 與 230 平滑
+    assert planner.choose("prices", PRICE_OPTIONS) == "cached"
+
+
+def test_without_deadline_nothing_degrades() -> None:
+    planner = DeadlinePlanner(None, {"prices:full": 1e9})
+    assert not planner.enabled
+    assert planner.choose("prices", PRICE_OPTIONS) == "full"
+
+
+def test_parse_deadline() -> None:
+    now = datetime.datetime(2025, 1, 3, 18, 0, tzinfo=TZ)
+    assert parse_deadline("19:55", now) == datetime.datetime(2025, 1, 3, 19, 55, tzinfo=TZ)
+    assert parse_deadline("2025-01-03T11:50:00+00:00", now).hour == 11
@@ -0,0 +1,60 @@
+"""Drive 目錄副本測試 — 以假的 Drive API 驗證上傳 / 下載往返與 modifiedTime 判斷"""
+from __future__ import annotations
+
+import io
+import tarfile
+
+import pytest
+
+from lib import drive_store
+from lib.drive_store import fetch_directory, publish_directory
+
+
+def test_publish_and_fetch_round_trip(tmp_path, fake_drive) -> None:
+    drive = fake_drive
+    source = tmp_path / "source"
+    (source / "A").mkdir(parents=True)
+    (source / "A" / "2025-01.parquet").write_bytes(b"jan")
+
+    target = tmp_path / "target"
+    assert fetch_directory(target, "history.tar", http=drive) is False  # 遠端還沒有
+    assert not target.exists()
+
+    publish_directory(source, "history.tar", http=drive)
+    assert fetch_directory(target, "history.tar", http=drive) is True
+    assert (target / "A" / "2025-01.parquet").read_bytes() == b"jan"
+
+    # 遠端沒更新：只列出檔案，不再下載
+    assert fetch_directory(target, "history.tar", http=drive) is False
+    assert drive.downloads == drive.streamed == 1  # 串流寫到暫存檔
+
+    # 再次上傳覆寫同一個檔案；下載後整個換上 (舊檔不殘留)
+    (source / "A" / "2025-01.parquet").unlink()
+    (source / "A" / "2025-02.parquet").write_bytes(b"feb")
+    publish_directory(source, "history.tar", http=drive)
+    assert len(drive.files) == 1
+    assert fetch_directory(target, "history.tar", http=drive) is True
+    assert sorted(p.name for p in (target / "A").iterdir()) == ["2025-02.parquet"]
+    assert not list(tmp_path.glob("target.*"))
+
+
+def test_without_folder_nothing_is_published(tmp_path, fake_drive, monkeypatch) -> None:
+    monkeypatch.setattr(drive_store, "DRIVE_FOLDER_ID", None)
+    (tmp_path / "source").mkdir()
+    publish_directory(tmp_path / "source", "history.tar", http=fake_drive)
+    assert fake_drive.files == {}
+    assert fetch_directory(tmp_path / "target", "history.tar", http=fake_drive) is False
+
+
+def test_extract_without_data_filter_rejects_unsafe_members(tmp_path, monkeypatch) -> None:
+    monkeypatch.delattr(tarfile, "data_filter", raising=False)
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w") as tar:
+        for name in ("ok.txt", "../escape.txt"):
+            info = tarfile.TarInfo(name)
+            info.size = 2
+            tar.addfile(info, io.BytesIO(b"hi"))
+
+    with tarfile.open(fileobj=io.BytesIO(buffer.getvalue())) as tar, pytest.raises(ValueError):
+        drive_store._extract(tar, tmp_path / "out")
+    assert not (tmp_path / "escape.txt").exists()
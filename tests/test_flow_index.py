@@ -0,0 +1,63 @@
+"""FlowIndex 區間累計測試 — 與直接 groupby 的結果一致"""
+from __future__ import annotations
+
+import pandas as pd
+
+from lib.flow_index import FlowIndex, top_page
+
+
+def _make_df() -> pd.DataFrame:
+    rows = [
+        ("2025-01-02", "1111", "甲", 100, 10),
+        ("2025-01-03", "1111", "甲", -40, -4),
+        ("2025-01-03", "2222", "乙", 300, 15),
+        ("2025-01-06", "1111", "甲", 50, 5),
+        ("2025-01-06", "2222", "乙", -20, -1),
+        ("2025-01-07", "3333", "丙", 70, 7),
+    ]
+    return pd.DataFrame(
+        [
+            {"日期": pd.Timestamp(d), "代號": sid, "名稱": name, "買賣超金額(千)": amt, "估算張數": sheets}
+            for d, sid, name, amt, sheets in rows
+        ]
+    )
+
+
+def _groupby_stats(df: pd.DataFrame, start, end) -> pd.DataFrame:
+    period = df[(df["日期"] >= pd.Timestamp(start)) & (df["日期"] <= pd.Timestamp(end))].copy()
+    period["is_buy_day"] = period["估算張數"] > 0
+    period["is_sell_day"] = period["估算張數"] < 0
+    return period.groupby(["代號", "名稱"]).agg(
+        累計金額=("買賣超金額(千)", "sum"),
+        累計張數=("估算張數", "sum"),
+        買超天數=("is_buy_day", "sum"),
+        賣超天數=("is_sell_day", "sum"),
+    ).reset_index()
+
+
+def test_window_matches_groupby() -> None:
+    df = _make_df()
+    index = FlowIndex(df)
+    for start, end in [
+        ("2025-01-01", "2025-01-31"),
+        ("2025-01-03", "2025-01-06"),
+        ("2025-01-04", "2025-01-05"),  # 區間內無交易日
+        ("2025-01-07", "2025-01-07"),
+    ]:
+        pd.testing.assert_frame_equal(
+            index.window(start, end), _groupby_stats(df, start, end), check_dtype=False
+        )
+
+
+def test_trading_days_and_period() -> None:
+    index = FlowIndex(_make_df())
+    assert index.trading_days("2025-01-03", "2025-01-06") == 2
+    assert index.period("2025-01-06", None)["代號"].tolist() == ["1111", "2222", "3333"]
+    assert len(index) == 3
+
+
+def test_top_page_matches_full_sort() -> None:
+    frame = pd.DataFrame({"代號": [str(i) for i in range(7)], "金額": [5, 9, 1, 9, 3, 7, 2]})
+    full = frame.sort_values("金額", ascending=False, kind="mergesort")
+    assert top_page(frame, "金額", 1, 3)["代號"].tolist() == full["代號"].tolist()[:3]
+    assert top_page(frame, "金額", 3, 3)["代號"].tolist() == full["代號"].tolist()[6:]
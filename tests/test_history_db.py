@@ -0,0 +1,62 @@
+"""DuckDB 跨分點查詢測試 — 與 pandas 彙總結果一致"""
+from __future__ import annotations
+
+import pandas as pd
+import pytest
+
+from lib.history_store import write_history
+
+pytest.importorskip("duckdb")
+
+from lib.history_db import SELL, HistoryDB  # noqa: E402
+
+
+def _history() -> pd.DataFrame:
+    rows = [
+        ("2025-01-02", "A", "1111", 100, 10),
+        ("2025-01-03", "A", "1111", -20, -2),
+        ("2025-01-03", "B", "1111", 50, 5),
+        ("2025-01-03", "A", "2222", 300, 30),
+        ("2025-01-03", "B", "2222", -40, -4),
+        ("2025-01-06", "C", "1111", 70, 7),
+        ("2025-02-03", "B", "2222", 900, 90),  # 區間外
+    ]
+    return pd.DataFrame(
+        [
+            {"日期": pd.Timestamp(d), "分點": b, "代號": sid, "名稱": f"N{sid}", "買賣超金額(千)": amt, "估算張數": sh}
+            for d, b, sid, amt, sh in rows
+        ]
+    )
+
+
+@pytest.fixture
+def db(tmp_path) -> HistoryDB:
+    write_history(_history(), tmp_path)
+    return HistoryDB(tmp_path)
+
+
+def test_broker_flows_match_groupby(db: HistoryDB) -> None:
+    flows = db.broker_flows("2025-01-01", "2025-01-31", ["A", "B"])
+    df = _history()
+    period = df[(df["日期"] <= "2025-01-31") & df["分點"].isin(["A", "B"])]
+    expected = period.groupby(["分點", "代號"])["估算張數"].sum().reset_index()
+    assert flows[["分點", "代號", "累計張數"]].astype({"累計張數": int}).values.tolist() == expected.values.tolist()
+    assert db.brokers() == ["A", "B", "C"]
+
+
+def test_shared_flows_require_min_brokers_in_same_direction(db: HistoryDB) -> None:
+    shared = db.shared_flows("2025-01-01", "2025-01-31", ["A", "B", "C"])
+    assert shared["代號"].tolist() == ["1111"]
+    row = shared.iloc[0]
+    assert (row["分點數"], row["合計金額"], row["合計張數"]) == (3, 200, 20)
+    assert (row["張數_A"], row["張數_B"], row["張數_C"]) == (8, 5, 7)
+
+    assert db.shared_flows("2025-01-01", "2025-01-31", ["A", "B"], min_brokers=3).empty
+    assert db.shared_flows("2025-01-01", "2025-01-31", ["A", "B"], side=SELL).empty
+
+
+def test_missing_history_is_unavailable(tmp_path) -> None:
+    empty = HistoryDB(tmp_path)
+    assert not empty.available
+    assert empty.brokers() == [] and empty.date_range() is None
+    assert empty.shared_flows("2025-01-01", "2025-01-31", ["A", "B"]).empty
@@ -0,0 +1,61 @@
+"""HistoryIndex 單檔 / 區間查詢測試"""
+from __future__ import annotations
+
+import pandas as pd
+
+from lib.history_index import HistoryIndex
+
+
+def _make_df() -> pd.DataFrame:
+    rows = [
+        ("2025-01-03", "2222", 30),
+        ("2025-01-01", "1111", 10),
+        ("2025-01-03", "1111", 30),
+        ("2025-01-02", "2222", 20),
+        ("2025-01-02", "1111", 20),
+    ]
+    return pd.DataFrame(
+        [{"日期": pd.Timestamp(d), "代號": sid, "估算張數": v} for d, sid, v in rows]
+    )
+
+
+def test_stock_returns_sorted_rows() -> None:
+    index = HistoryIndex(_make_df())
+    rows = index.stock("1111")
+    assert rows["估算張數"].tolist() == [10, 20, 30]
+    assert rows["日期"].is_monotonic_increasing
+
+
+def test_stock_range_inclusive_bounds() -> None:
+    index = HistoryIndex(_make_df())
+    rows = index.stock_range("1111", "2025-01-02", "2025-01-03")
+    assert rows["估算張數"].tolist() == [20, 30]
+    assert index.stock_range("1111", end=pd.Timestamp("2025-01-01"))["估算張數"].tolist() == [10]
+    assert index.stock_range("2222", start="2025-01-04").empty
+
+
+def test_stock_range_keeps_original_labels() -> None:
+    df = _make_df()
+    index = HistoryIndex(df)
+    labels = index.stock("2222").index.tolist()
+    assert df.loc[labels, "代號"].tolist() == ["2222", "2222"]
+
+
+def test_row_and_missing_stock() -> None:
+    index = HistoryIndex(_make_df())
+    assert index.row("2222", "2025-01-02")["估算張數"] == 20
+    assert index.row("2222", "2025-01-01") is None
+    assert index.stock("9999").empty
+    assert "1111" in index and "9999" not in index
+    assert sorted(index.stock_ids) == ["1111", "2222"]
+
+
+def test_of_reuses_existing_index() -> None:
+    index = HistoryIndex(_make_df())
+    assert HistoryIndex.of(index) is index
+
+
+def test_empty_frame() -> None:
+    index = HistoryIndex(_make_df().iloc[0:0])
+    assert len(index) == 0
+    assert index.stock("1111").empty
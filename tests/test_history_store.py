@@ -0,0 +1,55 @@
+"""本機 Parquet 歷史檔測試 — 依 (分點, 月) 分檔、同日期重寫時整日替換"""
+from __future__ import annotations
+
+import pandas as pd
+
+from lib.history_store import history_files, history_stamp, repair_history, write_history
+
+
+def _rows(date: str, broker: str, sheets: list[int]) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "日期": pd.Timestamp(date),
+            "代號": [str(1111 * (i + 1)) for i in range(len(sheets))],
+            "名稱": "x",
+            "買賣超金額(千)": [s * 10 for s in sheets],
+            "估算張數": sheets,
+            "分點": broker,
+        }
+    )
+
+
+def test_write_history_splits_by_broker_and_month(tmp_path) -> None:
+    assert history_stamp(tmp_path) == 0.0
+    write_history(pd.concat([_rows("2025-01-31", "A", [1, 2]), _rows("2025-02-03", "B", [3])]), tmp_path)
+    assert [p.relative_to(tmp_path).as_posix() for p in history_files(tmp_path)] == [
+        "A/2025-01.parquet",
+        "B/2025-02.parquet",
+    ]
+    assert history_stamp(tmp_path) > 0
+
+
+def test_rewriting_a_date_replaces_its_rows(tmp_path) -> None:
+    write_history(pd.concat([_rows("2025-01-02", "A", [1, 2]), _rows("2025-01-03", "A", [5])]), tmp_path)
+    write_history(_rows("2025-01-03", "A", [7, 8]), tmp_path)
+
+    stored = pd.read_parquet(tmp_path / "A" / "2025-01.parquet")
+    assert stored["估算張數"].tolist() == [1, 2, 7, 8]
+    assert not list(tmp_path.glob("**/*.tmp"))
+
+
+def test_repair_history_rewrites_only_affected_rows(tmp_path) -> None:
+    rows = pd.concat([_rows("2025-01-02", "A", [1, 2]), _rows("2025-02-03", "A", [3])]).assign(收盤價=0.0)
+    write_history(rows, tmp_path)
+    february = tmp_path / "A" / "2025-02.parquet"
+    before = february.stat().st_mtime_ns
+
+    written = repair_history("A", {("2025-01-02", "2222"): 4.0, ("2025-03-01", "1111"): 9.0}, tmp_path)
+
+    assert written == [tmp_path / "A" / "2025-01.parquet"]
+    january = pd.read_parquet(written[0]).set_index("代號")
+    assert january.loc["2222", "收盤價"] == 4.0
+    assert january.loc["2222", "估算張數"] == 5  # int(20 / 4)
+    assert january.loc["1111", "收盤價"] == 0.0  # 沒補到的列不動
+    assert february.stat().st_mtime_ns == before
+    assert repair_history("B", {("2025-01-02", "2222"): 4.0}, tmp_path) == []
@@ -0,0 +1,109 @@
+"""盤中輪詢測試 — 變動偵測、只推播新命中 (以假物件取代富邦 / yfinance)"""
+from __future__ import annotations
+
+import datetime
+from zoneinfo import ZoneInfo
+
+import pandas as pd
+
+import intraday
+from lib.alerts import AlertHit
+from lib.intraday import IntradayState, in_trading_hours, project_streaks
+
+TZ = ZoneInfo("Asia/Taipei")
+WATCHLIST = {"1111": {"name": "甲", "category": "", "category_display": ""}}
+RULES = [{"name": "買超", "kind": "condition", "when": "net_sheets > 0", "emoji": "🔥"}]
+
+
+def _stock(stock_id: str, net_amt: int) -> dict:
+    return {"id": stock_id, "name": stock_id, "buy_sheets": 1, "sell_sheets": 0, "net_amt": net_amt}
+
+
+def test_diff_returns_only_new_or_changed_rows() -> None:
+    state = IntradayState("2025-01-03")
+    assert [s["id"] for s in state.diff([_stock("1111", 100), _stock("2222", 50)])] == ["1111", "2222"]
+    state.commit(["1111", "2222"])
+    assert state.diff([_stock("1111", 100), _stock("2222", 50)]) == []
+    assert [s["id"] for s in state.diff([_stock("1111", 100), _stock("2222", 80)])] == ["2222"]
+    # 未 commit (尚未處理完) 的變動下次仍會回傳
+    assert [s["id"] for s in state.diff([_stock("1111", 100), _stock("2222", 80)])] == ["2222"]
+
+
+def test_new_hits_skip_notified_and_state_resets_next_day(tmp_path) -> None:
+    path = tmp_path / "intraday.json"
+    state = IntradayState("2025-01-03", path=path)
+    hit = AlertHit("買超", "🔥", "1111", "甲")
+    assert state.new_hits([hit, hit]) == [hit]
+    state.diff([_stock("1111", 100)])
+    state.mark_notified([hit])
+    state.save()
+
+    reloaded = IntradayState.load("2025-01-03", path)
+    assert reloaded.new_hits([hit]) == []
+    assert reloaded.diff([_stock("1111", 100)]) == []
+    assert IntradayState.load("2025-01-06", path).new_hits([hit]) == [hit]
+
+
+def test_project_streaks_and_trading_hours() -> None:
+    assert project_streaks((2, 0), 10) == (3, 0)
+    assert project_streaks((2, 0), -5) == (0, 1)
+    assert in_trading_hours(datetime.datetime(2025, 1, 3, 10, 0, tzinfo=TZ))
+    assert not in_trading_hours(datetime.datetime(2025, 1, 3, 18, 0, tzinfo=TZ))
+    assert not in_trading_hours(datetime.datetime(2025, 1, 4, 10, 0, tzinfo=TZ))  # 週六
+
+
+def test_poll_once_looks_up_prices_only_for_changed_watchlist_stocks(monkeypatch) -> None:
+    pages = iter([
+        [_stock("1111", 300), _stock("9999", 500)],
+        [_stock("1111", 300), _stock("9999", 700)],
+        [_stock("1111", 600), _stock("9999", 700)],
+    ])
+    looked_up: list[list[str]] = []
+
+    def resolve_prices(stocks, date, budget_seconds=0):
+        looked_up.append([s["id"] for s in stocks])
+        market = pd.DataFrame(
+            {"close": [30.0], "prev_close": [29.0], "volume": [1e6]},
+            index=pd.Index(["1111"], name="代號"),
+        )
+        return market, {}
+
+    monkeypatch.setattr(intraday.crawler, "get_today_stock_list_from_fubon", lambda date, broker: next(pages))
+    monkeypatch.setattr(intraday.crawler, "resolve_prices", resolve_prices)
+    state = IntradayState("2025-01-03")
+
+    first = intraday.poll_once(state, WATCHLIST, RULES)
+    assert [h.stock_id for h in first] == ["1111"]
+    state.mark_notified(first)
+    assert intraday.poll_once(state, WATCHLIST, RULES) == []  # 只有非 watchlist 股票變動
+    assert intraday.poll_once(state, WATCHLIST, RULES) == []  # 有變動但已推播過
+    assert looked_up == [["1111"], ["1111"]]
+
+
+def test_poll_once_retries_after_failed_push_or_missing_price(monkeypatch) -> None:
+    page = [_stock("1111", 300), _stock("2222", 300)]
+    watchlist = {**WATCHLIST, "2222": {"name": "乙", "category": "", "category_display": ""}}
+    priced = iter([["1111"], ["1111", "2222"], ["1111", "2222"]])
+    looked_up: list[list[str]] = []
+
+    def resolve_prices(stocks, date, budget_seconds=0):
+        looked_up.append([s["id"] for s in stocks])
+        ids = next(priced)
+        market = pd.DataFrame(
+            {"close": 30.0, "prev_close": 29.0, "volume": 1e6}, index=pd.Index(ids, name="代號")
+        )
+        return market, {sid: "not_found" for sid in ("1111", "2222") if sid not in ids}
+
+    monkeypatch.setattr(intraday.crawler, "get_today_stock_list_from_fubon", lambda date, broker: page)
+    monkeypatch.setattr(intraday.crawler, "resolve_prices", resolve_prices)
+    state = IntradayState("2025-01-03")
+
+    # 1) 2222 查無股價、1111 命中但推播失敗 (未 mark_notified) → 兩檔都不 commit
+    assert [h.stock_id for h in intraday.poll_once(state, watchlist, RULES)] == ["1111"]
+    # 2) 數字沒變也會重試；這次兩檔都命中並推播成功
+    hits = intraday.poll_once(state, watchlist, RULES)
+    assert sorted(h.stock_id for h in hits) == ["1111", "2222"]
+    state.mark_notified(hits)
+    # 3) 都處理完了，不再查價
+    assert intraday.poll_once(state, watchlist, RULES) == []
+    assert looked_up == [["1111", "2222"], ["1111", "2222"]]
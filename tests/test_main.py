@@ -0,0 +1,91 @@
+"""main.py 測試 — 股價補查並行與 Sheet 覆寫 (以假物件取代 yfinance / gspread)"""
+from __future__ import annotations
+
+import threading
+
+import pandas as pd
+
+import main
+
+
+class FakeSheet:
+    def __init__(self) -> None:
+        self.written: list[list] = []
+
+    def clear(self) -> None:
+        self.written = []
+
+    def update(self, data) -> None:
+        self.written = [list(row) for row in data]
+
+
+def test_resolve_prices_looks_up_missing_tickers_concurrently(monkeypatch) -> None:
+    market = pd.DataFrame(
+        {"close": [50.0], "prev_close": [49.0], "volume": [1e6]},
+        index=pd.Index(["1111"], name="代號"),
+    )
+    monkeypatch.setattr(main, "fetch_market_data", lambda ids, date: market.copy())
+    barrier = threading.Barrier(2, timeout=5)
+
+    def fallback(stock_id: str) -> tuple[float, float, float] | None:
+        barrier.wait()  # 兩檔補查必須同時進行才會通過
+        return None if stock_id == "3333" else (30.0, 28.0, 5e5)
+
+    monkeypatch.setattr(main, "get_quote_fallback", fallback)
+    stocks = [{"id": sid, "name": sid, "net_amt": 300} for sid in ("1111", "2222", "3333")]
+
+    resolved, skipped = main.resolve_prices(stocks, "2025-01-03")
+    assert resolved["close"].to_dict() == {"1111": 50.0, "2222": 30.0}
+    # 補查的股票也要有前一日收盤與成交量 (通知的漲跌幅 / 成交量欄)
+    assert resolved.loc["2222"].tolist() == [30.0, 28.0, 5e5]
+    assert skipped == {"3333": "not_found"}
+
+    rows = main.build_rows(stocks, resolved, "2025-01-03")
+    by_id = {row[1]: row for row in rows}
+    assert by_id["2222"][5:] == [30.0, 10, main.BROKER_ID]
+    assert by_id["3333"][5:] == [0.0, 0, main.BROKER_ID]
+
+
+def test_write_sheet_overwrite_replaces_target_date(monkeypatch) -> None:
+    bumps: list[tuple[str, int]] = []
+    monkeypatch.setattr(main, "bump_revision", lambda sheet, kind, stable_rows=0: bumps.append((kind, stable_rows)))
+    sheet = FakeSheet()
+    existing = [
+        main.HEADER_ROW,
+        ["2025/01/02", "1111", "甲", "買超", "100", "10", "10"],
+        ["2025-01-03", "1111", "甲", "買超", "999", "10", "99"],
+    ]
+    new_rows = [["2025-01-03", "2222", "乙", "賣超", -200, 20.0, -10, "9A91"]]
+
+    prev_date = main.write_sheet_overwrite(sheet, existing, new_rows, "2025-01-03")
+
+    assert prev_date == "2025-01-02"
+    assert sheet.written[0] == main.HEADER_ROW
+    assert [row[1] for row in sheet.written[1:]] == ["1111", "2222"]
+    assert main.write_sheet_overwrite(FakeSheet(), [], new_rows, "2025-01-03") == ""
+    assert bumps == [("rewrite", 1), ("rewrite", 0)]  # 當日舊資料被換掉 → 改寫
+
+    bumps.clear()
+    main.write_sheet_overwrite(FakeSheet(), existing[:2], new_rows, "2025-01-03")
+    assert bumps == [("append", 1)]  # 既有列不變 → app 只需讀尾端
+
+
+def test_write_sheet_overwrite_adds_broker_column_to_old_rows(monkeypatch) -> None:
+    monkeypatch.setattr(main, "bump_revision", lambda sheet, kind, stable_rows=0: None)
+    sheet = FakeSheet()
+    old_header = main.HEADER_ROW[:-1]
+    existing = [old_header, ["2025-01-02", "1111", "甲", "買超", "100", "10"]]
+    new_rows = [["2025-01-03", "2222", "乙", "賣超", -200, 20.0, -10, "9A91"]]
+
+    main.write_sheet_overwrite(sheet, existing, new_rows, "2025-01-03", broker="9A91")
+
+    assert sheet.written[0] == main.HEADER_ROW
+    assert sheet.written[1] == ["2025-01-02", "1111", "甲", "買超", "100", "10", "", "9A91"]
+
+
+def test_unique_stocks_merges_brokers_by_id() -> None:
+    stock_lists = {
+        "9A91": [{"id": "1111", "name": "甲", "net_amt": 1}],
+        "9A92": [{"id": "1111", "name": "甲", "net_amt": 5}, {"id": "2222", "name": "乙", "net_amt": 2}],
+    }
+    assert [s["id"] for s in main.unique_stocks(stock_lists)] == ["1111", "2222"]
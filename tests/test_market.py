@@ -0,0 +1,65 @@
+"""批次行情測試 — 以假的 yfinance 下載結果驗證欄位整理與 .TW/.TWO fallback"""
+from __future__ import annotations
+
+import numpy as np
+import pandas as pd
+
+from lib import market
+
+
+def _fake_download(frames: dict[str, dict[str, list[float]]]):
+    """frames: {ticker: {"Close": [...], "Volume": [...]}} → yf.download 格式 (Price, Ticker)"""
+    dates = pd.DatetimeIndex(["2025-01-02", "2025-01-03", "2025-01-06"])
+    requested: list[list[str]] = []
+
+    def download(tickers: list[str], period: str | None = None, **window) -> pd.DataFrame:
+        requested.append(list(tickers))
+        download.options = window
+        columns = {}
+        for ticker in tickers:
+            data = frames.get(ticker, {"Close": [np.nan] * 3, "Volume": [np.nan] * 3})
+            columns[("Close", ticker)] = data["Close"]
+            columns[("Volume", ticker)] = data["Volume"]
+        return pd.DataFrame(columns, index=dates)
+
+    return download, requested
+
+
+def test_fetch_market_data_batches_and_falls_back(monkeypatch) -> None:
+    download, requested = _fake_download({
+        "1111.TW": {"Close": [10.0, 11.0, 12.0], "Volume": [1e6, 2e6, 3e6]},
+        "2222.TWO": {"Close": [20.0, np.nan, 22.0], "Volume": [5e5, np.nan, 7e5]},
+    })
+    monkeypatch.setattr(market, "_download", download)
+
+    result = market.fetch_market_data(["1111", "2222", "3333"], "2025-01-06")
+
+    assert requested == [["1111.TW", "2222.TW", "3333.TW"], ["2222.TWO", "3333.TWO"]]
+    assert sorted(result.index) == ["1111", "2222"]
+    assert result.loc["1111"].tolist() == [12.0, 11.0, 3e6]
+    # 前一日停牌 (NaN) → 取更早一個有資料交易日的收盤
+    assert result.loc["2222", "prev_close"] == 20.0
+
+
+def test_fetch_market_data_missing_target_date(monkeypatch) -> None:
+    download, _ = _fake_download({
+        "1111.TW": {"Close": [10.0, 11.0, 12.0], "Volume": [1e6, 2e6, 3e6]},
+    })
+    monkeypatch.setattr(market, "_download", download)
+    assert market.fetch_market_data(["1111"], "2025-01-07").empty
+
+
+def test_fetch_close_history_returns_date_by_stock_matrix(monkeypatch) -> None:
+    download, requested = _fake_download({
+        "1111.TW": {"Close": [10.0, 11.0, 12.0], "Volume": [1e6, 2e6, 3e6]},
+        "2222.TWO": {"Close": [20.0, np.nan, 22.0], "Volume": [5e5, np.nan, 7e5]},
+    })
+    monkeypatch.setattr(market, "_download", download)
+
+    closes = market.fetch_close_history(["1111", "2222", "9999"], "2025-01-02", "2025-01-06")
+
+    assert requested[1] == ["2222.TWO", "9999.TWO"]
+    assert download.options["auto_adjust"] is False  # 回填用未還原的實際收盤價
+    assert sorted(closes.columns) == ["1111", "2222"]
+    assert closes.at[pd.Timestamp("2025-01-03"), "1111"] == 11.0
+    assert np.isnan(closes.at[pd.Timestamp("2025-01-03"), "2222"])
@@ -0,0 +1,99 @@
+"""stage DAG 執行器測試 — 依賴驗證、併行、記憶體交接、提早結束與失敗傳遞"""
+from __future__ import annotations
+
+import threading
+
+import pytest
+
+from lib.pipeline import Pipeline, PipelineStop, Stage
+
+
+def test_outputs_are_handed_to_downstream_stages() -> None:
+    pipeline = Pipeline([
+        Stage("double", lambda x: {"y": x * 2}, inputs=("x",), outputs=("y",)),
+        Stage("add", lambda x, y: {"z": x + y}, inputs=("x", "y"), outputs=("z",)),
+    ], provided=("x",))
+    result = pipeline.run({"x": 3})
+    assert result.ok
+    assert result.outputs["z"] == 9
+    assert set(result.timings()) == {"double", "add"}
+
+
+def test_independent_stages_run_concurrently() -> None:
+    barrier = threading.Barrier(2, timeout=5)
+
+    def wait_for_peer(name):
+        return lambda: (barrier.wait(), {name: True})[1]
+
+    pipeline = Pipeline([
+        Stage("a", wait_for_peer("a"), outputs=("a",)),
+        Stage("b", wait_for_peer("b"), outputs=("b",)),
+    ])
+    result = pipeline.run(max_workers=2)
+    assert result.ok
+    assert result.outputs["a"] and result.outputs["b"]
+
+
+def test_invalid_graphs_are_rejected() -> None:
+    with pytest.raises(ValueError, match="缺少輸入來源"):
+        Pipeline([Stage("a", lambda x: None, inputs=("x",))])
+    with pytest.raises(ValueError, match="重複"):
+        Pipeline([Stage("a", dict, outputs=("x",)), Stage("b", dict, outputs=("x",))])
+    with pytest.raises(ValueError, match="循環"):
+        Pipeline([
+            Stage("a", lambda y: None, inputs=("y",), outputs=("x",)),
+            Stage("b", lambda x: None, inputs=("x",), outputs=("y",)),
+        ])
+
+
+def test_stop_skips_remaining_stages() -> None:
+    def stop():
+        raise PipelineStop("週末")
+
+    ran = []
+    pipeline = Pipeline([
+        Stage("date", stop, outputs=("date",)),
+        Stage("crawl", lambda date: ran.append(date), inputs=("date",)),
+    ])
+    result = pipeline.run()
+    assert result.stopped and result.ok
+    assert result.results["crawl"].status == "skipped"
+    assert ran == []
+
+
+def test_failure_skips_dependents_only() -> None:
+    def boom():
+        raise RuntimeError("sheet down")
+
+    pipeline = Pipeline([
+        Stage("write", boom, outputs=("prev",)),
+        Stage("notify", lambda prev: None, inputs=("prev",)),
+        Stage("other", lambda: {"o": 1}, outputs=("o",)),
+        Stage("extra", boom, optional=True),
+    ])
+    result = pipeline.run()
+    assert not result.ok
+    assert result.results["write"].status == "failed"
+    assert result.results["notify"].status == "skipped"
+    assert result.results["other"].status == "ok"
+    assert result.results["extra"].status == "failed"
+
+
+def test_after_orders_without_requiring_success() -> None:
+    order: list[str] = []
+
+    def boom(prev):
+        order.append("notify")
+        raise RuntimeError("LINE down")
+
+    pipeline = Pipeline([
+        Stage("write", lambda: {"prev": 1}, outputs=("prev",)),
+        Stage("notify", boom, inputs=("prev",)),
+        Stage("rewrite", lambda prev: order.append("rewrite"), inputs=("prev",),
+              after=("notify", "not_in_pipeline")),
+    ])
+    result = pipeline.run(max_workers=4)
+    assert order == ["notify", "rewrite"]
+    assert result.results["rewrite"].status == "ok"
+    with pytest.raises(ValueError, match="循環"):
+        Pipeline([Stage("a", dict, after=("b",)), Stage("b", dict, after=("a",))])
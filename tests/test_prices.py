@@ -0,0 +1,129 @@
+"""股價查詢保護層測試 — 斷路器、單次期限與整段預算"""
+from __future__ import annotations
+
+import threading
+import time
+
+from lib.prices import (
+    BUDGET,
+    CIRCUIT_OPEN,
+    ERROR,
+    NOT_FOUND,
+    STALLED,
+    TIMEOUT,
+    CircuitBreaker,
+    PriceResolver,
+)
+
+
+def test_prices_and_not_found_are_separated() -> None:
+    resolver = PriceResolver(lambda sid: {"1111": 50.0}.get(sid), max_workers=2)
+    result = resolver.resolve(["1111", "2222"])
+    assert result.prices == {"1111": 50.0}
+    assert result.skipped == {"2222": NOT_FOUND}
+
+
+def test_breaker_trips_after_consecutive_failures() -> None:
+    calls: list[str] = []
+
+    def failing(stock_id: str) -> float:
+        calls.append(stock_id)
+        raise ConnectionError("yfinance down")
+
+    breaker = CircuitBreaker(threshold=3, cooldown=60)
+    ids = [str(i) for i in range(10)]
+    result = PriceResolver(failing, max_workers=1, breaker=breaker).resolve(ids)
+
+    assert len(calls) == 3
+    assert [result.skipped[sid] for sid in ids[:3]] == [ERROR] * 3
+    assert all(result.skipped[sid] == CIRCUIT_OPEN for sid in ids[3:])
+    assert breaker.is_open
+
+
+def test_not_found_does_not_trip_breaker() -> None:
+    breaker = CircuitBreaker(threshold=3, cooldown=60)
+    prices = {"9": 90.0}
+    ids = [str(i) for i in range(10)]  # 0~8 查無 (連續 9 檔)，最後一檔有價
+    result = PriceResolver(prices.get, max_workers=1, breaker=breaker).resolve(ids)
+
+    assert result.prices == {"9": 90.0}
+    assert all(result.skipped[sid] == NOT_FOUND for sid in ids[:9])
+    assert not breaker.is_open
+    assert breaker.consecutive_failures == 0
+
+
+def test_breaker_half_opens_after_cooldown() -> None:
+    breaker = CircuitBreaker(threshold=2, cooldown=0)
+    breaker.record_failure()
+    breaker.record_failure()
+    assert not breaker.is_open  # cooldown 0：立即半開
+    breaker.record_success()
+    assert breaker.consecutive_failures == 0
+
+
+def test_budget_stops_the_rest() -> None:
+    release = threading.Event()
+
+    def hanging(stock_id: str) -> float:
+        release.wait(5)
+        return 10.0
+
+    breaker = CircuitBreaker(threshold=1)
+    resolver = PriceResolver(hanging, call_timeout=5, budget_seconds=0.2, max_workers=2, breaker=breaker)
+    started = time.monotonic()
+    try:
+        result = resolver.resolve([str(i) for i in range(20)])
+    finally:
+        release.set()
+
+    assert time.monotonic() - started < 1.0
+    assert result.prices == {}
+    assert result.skipped == {str(i): BUDGET for i in range(20)}
+    assert not breaker.is_open  # 預算用完不是服務失敗
+
+
+def test_stuck_lookups_do_not_time_out_the_rest() -> None:
+    release = threading.Event()
+    stuck = {"0", "1"}
+
+    def lookup(stock_id: str) -> float:
+        if stock_id in stuck:
+            release.wait(10)  # 模擬永遠不返回的呼叫
+        time.sleep(0.12)  # 排隊等執行緒的時間加上這次呼叫會超過期限，期限必須從開始執行起算
+        return 10.0
+
+    breaker = CircuitBreaker(threshold=3, cooldown=60)
+    resolver = PriceResolver(lookup, call_timeout=0.2, budget_seconds=5, max_workers=4, breaker=breaker)
+    ids = [str(i) for i in range(20)]
+    try:
+        result = resolver.resolve(ids)
+    finally:
+        release.set()
+
+    assert result.skipped == {"0": TIMEOUT, "1": TIMEOUT}
+    assert result.prices == {sid: 10.0 for sid in ids[2:]}
+    assert not breaker.is_open
+
+
+def test_all_workers_stuck_skips_the_rest_without_queueing() -> None:
+    release = threading.Event()
+    calls: list[str] = []
+
+    def hanging(stock_id: str) -> float:
+        calls.append(stock_id)
+        release.wait(5)
+        return 10.0
+
+    resolver = PriceResolver(
+        hanging, call_timeout=0.05, budget_seconds=2, max_workers=2,
+        breaker=CircuitBreaker(threshold=100),
+    )
+    started = time.monotonic()
+    try:
+        result = resolver.resolve([str(i) for i in range(10)])
+    finally:
+        release.set()
+
+    assert time.monotonic() - started < 1.0
+    assert sorted(calls) == ["0", "1"]
+    assert result.skipped == {"0": TIMEOUT, "1": TIMEOUT, **{str(i): STALLED for i in range(2, 10)}}
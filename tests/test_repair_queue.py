@@ -0,0 +1,53 @@
+"""缺價補修佇列測試 — 去重、持久化、掃描與儲存格更新規劃"""
+from __future__ import annotations
+
+from lib.repair_queue import (
+    RepairQueue,
+    enqueue_missing,
+    find_missing_rows,
+    plan_cell_updates,
+)
+
+HEADER = ["日期", "代號", "名稱", "買賣別", "買賣超金額(千)", "收盤價", "估算張數"]
+ROWS = [
+    HEADER,
+    ["2025/01/02", "1111", "甲", "買超", "1,000", "0.0", "0"],
+    ["2025-01-02", "2222", "乙", "賣超", "-500", "25", "-20"],
+    ["2025-01-03", "3333", "丙", "買超", "300", "查無", "N/A"],
+]
+
+
+def test_queue_dedupes_and_persists(tmp_path) -> None:
+    path = tmp_path / "repair.json"
+    assert enqueue_missing("2025/01/02", {"1111": "timeout", "2222": "not_found"}, path) == 2
+    assert enqueue_missing("2025-01-02", {"1111": "error"}, path) == 0
+
+    queue = RepairQueue.load(path)
+    assert [item.key for item in queue] == [("2025-01-02", "1111"), ("2025-01-02", "2222")]
+    assert next(iter(queue)).reason == "timeout"
+
+
+def test_record_attempt_drops_after_max(tmp_path) -> None:
+    queue = RepairQueue(path=tmp_path / "repair.json")
+    queue.add("2025-01-02", "1111")
+    assert queue.record_attempt([("2025-01-02", "1111")], max_attempts=2) == []
+    dropped = queue.record_attempt([("2025-01-02", "1111")], max_attempts=2)
+    assert [item.key for item in dropped] == [("2025-01-02", "1111")]
+    assert len(queue) == 0
+
+
+def test_find_missing_rows() -> None:
+    assert find_missing_rows(ROWS) == [("2025-01-02", "1111"), ("2025-01-03", "3333")]
+
+
+def test_plan_cell_updates_touches_only_affected_cells() -> None:
+    prices = {("2025-01-02", "1111"): 50.0, ("2025-01-03", "3333"): 30.0, ("2025-01-06", "9"): 1.0}
+    updates, repaired = plan_cell_updates(ROWS, prices)
+
+    assert repaired == {("2025-01-02", "1111"), ("2025-01-03", "3333")}
+    assert updates == [
+        {"range": "F2", "values": [[50.0]]},
+        {"range": "G2", "values": [[20]]},
+        {"range": "F4", "values": [[30.0]]},
+        {"range": "G4", "values": [[10]]},
+    ]
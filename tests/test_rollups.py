@@ -0,0 +1,89 @@
+"""週 / 月彙總測試 — 增量 extend 與整批重建結果一致"""
+from __future__ import annotations
+
+import pandas as pd
+import pandas.testing as pdt
+
+from lib.history_index import HistoryIndex
+from lib.rollups import MONTHLY, WEEKLY, Rollups, rollup_freq, sync_rollups
+
+
+def _make_df() -> pd.DataFrame:
+    rows = [
+        ("2025-01-02", "1111", "甲", 100, 10, 10.0),  # 週四
+        ("2025-01-03", "1111", "甲", -40, -4, 11.0),
+        ("2025-01-03", "2222", "乙", 300, 15, 20.0),
+        ("2025-01-06", "1111", "甲", 50, 5, 12.0),  # 下一週
+        ("2025-01-31", "2222", "乙", -20, -1, 21.0),
+        ("2025-02-03", "1111", "甲", 70, 7, 13.0),  # 下一月
+    ]
+    return pd.DataFrame(
+        [
+            {
+                "日期": pd.Timestamp(d), "代號": sid, "名稱": name,
+                "買賣超金額(千)": amt, "估算張數": sheets, "收盤價": close,
+            }
+            for d, sid, name, amt, sheets, close in rows
+        ]
+    )
+
+
+def test_weekly_and_monthly_totals() -> None:
+    rollups = Rollups.build(_make_df())
+
+    weeks = rollups.stock_range(WEEKLY, "1111")
+    assert weeks["日期"].dt.strftime("%m-%d").tolist() == ["12-30", "01-06", "02-03"]
+    first = weeks.iloc[0]
+    assert (first["買賣超金額(千)"], first["估算張數"], first["買超天數"], first["賣超天數"]) == (60, 6, 1, 1)
+    assert (first["交易日數"], first["收盤價"], first["成本"]) == (2, 11.0, 10.0)
+
+    months = rollups.stock_range(MONTHLY, "1111", "2025-01-01", "2025-02-28")
+    assert months["日期"].dt.strftime("%m-%d").tolist() == ["01-01", "02-01"]
+    assert months["估算張數"].tolist() == [11, 7]
+
+
+def test_partial_boundary_periods_only_count_days_in_range() -> None:
+    df = _make_df()
+    rollups = Rollups.build(df)
+    daily = HistoryIndex(df)
+
+    # 1/3 (週五) ~ 2/3：頭一週只算 1/3，最後一週只算 2/3
+    weeks = rollups.stock_range(WEEKLY, "1111", "2025-01-03", "2025-02-03", daily=daily)
+    assert weeks["日期"].dt.strftime("%m-%d").tolist() == ["01-03", "01-06", "02-03"]
+    assert weeks["估算張數"].tolist() == [-4, 5, 7]
+    assert weeks["交易日數"].tolist() == [1, 1, 1]
+
+    # 1/15 之後 1111 在一月沒有資料 → 只剩二月
+    months = rollups.stock_range(MONTHLY, "1111", "2025-01-15", "2025-02-28", daily=daily)
+    assert months["估算張數"].tolist() == [7]
+
+    # 沒給逐日資料：略過被切過的期
+    weeks = rollups.stock_range(WEEKLY, "1111", "2025-01-03", "2025-02-03")
+    assert weeks["日期"].dt.strftime("%m-%d").tolist() == ["01-06"]
+
+
+def test_extend_matches_full_build() -> None:
+    df = _make_df()
+    full = Rollups.build(df)
+    stepped = sync_rollups(Rollups.build(df.iloc[:3]), df, stable_rows=3)
+
+    assert stepped.rows == len(df)
+    for freq in (WEEKLY, MONTHLY):
+        pdt.assert_frame_equal(
+            stepped.indexes[freq].frame.reset_index(drop=True),
+            full.indexes[freq].frame.reset_index(drop=True),
+        )
+
+
+def test_sync_rebuilds_when_rows_do_not_line_up() -> None:
+    df = _make_df()
+    previous = Rollups.build(df.iloc[:2])
+    rebuilt = sync_rollups(previous, df, stable_rows=3)
+    assert rebuilt.rows == len(df)
+    assert rebuilt.stock_range(WEEKLY, "2222")["估算張數"].tolist() == [15, -1]
+
+
+def test_rollup_freq_thresholds() -> None:
+    assert rollup_freq(30) is None
+    assert rollup_freq(120, weekly_after=90, monthly_after=365) == WEEKLY
+    assert rollup_freq(400, weekly_after=90, monthly_after=365) == MONTHLY
@@ -0,0 +1,95 @@
+"""lib.sheet 讀取測試 — 以 FakeSheet 取代真實 Google Sheet。"""
+from __future__ import annotations
+
+import pytest
+
+from lib import sheet as sheet_mod
+
+HEADER = ["日期", "代號", "名稱", "買賣別", "買賣超金額(千)", "收盤價", "估算張數"]
+
+
+class FakeSheet:
+    """模擬 gspread.Worksheet 的唯讀 API，並記錄實際讀取的範圍。"""
+
+    def __init__(self, rows: list[list[str]]) -> None:
+        self._rows = rows
+        self.requested: list[str] = []
+
+    @property
+    def row_count(self) -> int:
+        return len(self._rows)
+
+    def get_all_values(self) -> list[list[str]]:
+        self.requested.append("ALL")
+        return [list(r) for r in self._rows]
+
+    def row_values(self, row: int) -> list[str]:
+        return list(self._rows[row - 1]) if len(self._rows) >= row else []
+
+    def col_values(self, col: int) -> list[str]:
+        return [r[col - 1] for r in self._rows]
+
+    def get(self, range_name: str) -> list[list[str]]:
+        self.requested.append(range_name)
+        start = int(range_name.split(":")[0][1:])
+        return [list(r) for r in self._rows[start - 1:]]
+
+
+class FakeClient:
+    def open(self, sheet_name: str) -> None:
+        return None  # read_revision 另外以 monkeypatch 取代
+
+
+@pytest.fixture
+def fake_sheet(monkeypatch) -> FakeSheet:
+    rows = [HEADER]
+    for day in ("2025-01-02", "2025-01-03", "2025-01-06", "2025-01-07"):
+        rows.append([day, "1111", "Alpha", "買超", "1,000", "50", "20"])
+        rows.append([day, "2222", "Beta", "賣超", "-500", "25", "-20"])
+    fake = FakeSheet(rows)
+    monkeypatch.setattr(sheet_mod, "open_sheet", lambda sheet_name=None: fake)
+    return fake
+
+
+def test_load_dataframe_types(fake_sheet: FakeSheet) -> None:
+    df = sheet_mod.load_dataframe()
+    assert len(df) == 8
+    assert df["買賣超金額(千)"].iloc[0] == 1000
+    assert str(df["日期"].dtype).startswith("datetime64")
+
+
+def test_load_recent_dataframe_reads_tail_only(fake_sheet: FakeSheet) -> None:
+    df = sheet_mod.load_recent_dataframe(2)
+    assert sorted(df["日期"].dt.strftime("%Y-%m-%d").unique()) == ["2025-01-06", "2025-01-07"]
+    assert len(df) == 4
+    assert fake_sheet.requested == ["A6:G9"]
+
+
+def test_load_recent_dataframe_more_days_than_history(fake_sheet: FakeSheet) -> None:
+    df = sheet_mod.load_recent_dataframe(30)
+    assert len(df) == 8
+
+
+def test_refresh_dataframe_fetches_tail_after_single_append(fake_sheet: FakeSheet, monkeypatch) -> None:
+    revisions = iter([
+        sheet_mod.SheetRevision(1, sheet_mod.REWRITE, 0, "t1"),
+        sheet_mod.SheetRevision(2, sheet_mod.APPEND, 8, "t2"),
+        sheet_mod.SheetRevision(2, sheet_mod.APPEND, 8, "t2"),
+        sheet_mod.SheetRevision(3, sheet_mod.REWRITE, 0, "t3"),
+    ])
+    monkeypatch.setattr(sheet_mod, "get_client", FakeClient)
+    monkeypatch.setattr(sheet_mod, "read_revision", lambda spreadsheet: next(revisions))
+
+    data = sheet_mod.refresh_dataframe(None)
+    assert len(data.frame) == 8 and fake_sheet.requested == ["ALL"]
+
+    fake_sheet._rows.append(["2025-01-08", "1111", "Alpha", "買超", "300", "50", "6"])
+    appended = sheet_mod.refresh_dataframe(data)
+    assert fake_sheet.requested == ["ALL", "A10:G10"]
+    assert (len(appended.frame), appended.stable_rows) == (9, 8)
+    assert appended.frame["買賣超金額(千)"].iloc[-1] == 300
+
+    assert sheet_mod.refresh_dataframe(appended) is appended  # 標記沒變：不讀 Sheet
+    assert len(fake_sheet.requested) == 2
+    assert len(sheet_mod.refresh_dataframe(appended).frame) == 9
+    assert fake_sheet.requested[-1] == "ALL"
@@ -0,0 +1,59 @@
+"""每日快照測試 — 寫入 / 讀取往返、日期不符與過期時不使用"""
+from __future__ import annotations
+
+import datetime
+import json
+
+import pandas as pd
+
+from lib.snapshot import load_snapshot, write_snapshot
+
+
+def _rows() -> pd.DataFrame:
+    return pd.DataFrame({
+        "日期": pd.to_datetime(["2025-01-03", "2025-01-03"]),
+        "代號": ["1111", "2222"],
+        "名稱": ["甲", "乙"],
+        "買賣超金額(千)": [500.0, -200.0],
+        "估算張數": [10.0, -4.0],
+    })
+
+
+def _market() -> pd.DataFrame:
+    return pd.DataFrame(
+        {"close": [50.0], "prev_close": [48.0], "volume": [1e6]},
+        index=pd.Index(["1111"], name="代號"),
+    )
+
+
+def test_snapshot_roundtrip(tmp_path) -> None:
+    watchlist = {"1111": {"name": "甲", "category": "車用"}}
+    write_snapshot(_rows(), _market(), "2025-01-03", "2025-01-02", watchlist, directory=tmp_path)
+
+    snapshot = load_snapshot(datetime.date(2025, 1, 3), directory=tmp_path, max_age_hours=1)
+    assert snapshot is not None
+    assert snapshot.date_str == "2025-01-03"
+    assert snapshot.prev_date == "2025-01-02"
+    assert snapshot.watchlist == watchlist
+    assert snapshot.rows["代號"].tolist() == ["1111", "2222"]
+    assert snapshot.market.loc["1111", "prev_close"] == 48.0
+
+
+def test_snapshot_without_watchlist(tmp_path) -> None:
+    write_snapshot(_rows(), _market(), "2025-01-03", "", directory=tmp_path)
+    snapshot = load_snapshot("2025-01-03", directory=tmp_path)
+    assert snapshot is not None
+    assert snapshot.watchlist is None
+    assert snapshot.prev_date == ""
+
+
+def test_snapshot_rejects_other_date_and_stale(tmp_path) -> None:
+    assert load_snapshot("2025-01-03", directory=tmp_path) is None
+
+    manifest_path = write_snapshot(_rows(), _market(), "2025-01-03", "2025-01-02", directory=tmp_path)
+    assert load_snapshot("2025-01-06", directory=tmp_path) is None
+
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    manifest["created_at"] = (datetime.datetime.now() - datetime.timedelta(hours=30)).isoformat()
+    manifest_path.write_text(json.dumps(manifest), encoding="utf-8")
+    assert load_snapshot("2025-01-03", directory=tmp_path, max_age_hours=12) is None
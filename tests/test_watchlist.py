@@ -6,19 +6,93 @@ import pytest
 from lib import watchlist as wl
 
 
+class FakeAPIError(Exception):
+    """模擬 gspread.exceptions.APIError"""
+
+
+class FakeSpreadsheet:
+    """模擬 gspread.Spreadsheet.batch_update：支援 appendCells / updateCells / deleteDimension
+    與 developer metadata；任一請求失敗時整批不套用。"""
+
+    def __init__(self, ws: FakeWorksheet) -> None:
+        self.ws = ws
+        self.batches: list[list[dict]] = []
+        self.metadata: dict[int, str] = {}  # metadataId → metadataValue
+
+    def batch_update(self, body: dict) -> None:
+        self.batches.append(body["requests"])
+        rows = [list(r) for r in self.ws._rows]
+        metadata = dict(self.metadata)
+        for request in body["requests"]:
+            (kind, spec), = request.items()
+            if kind == "appendCells":
+                rows.append(_cell_values(spec["rows"][0]))
+            elif kind == "updateCells":
+                r, c = spec["range"]["startRowIndex"], spec["range"]["startColumnIndex"]
+                while len(rows) <= r:
+                    rows.append([])
+                values = _cell_values(spec["rows"][0])
+                row = rows[r] + [""] * (c + len(values) - len(rows[r]))
+                row[c:c + len(values)] = values
+                rows[r] = row
+            elif kind == "deleteDimension":
+                del rows[spec["range"]["startIndex"]:spec["range"]["endIndex"]]
+            elif kind == "deleteDeveloperMetadata":
+                metadata.pop(spec["dataFilter"]["developerMetadataLookup"]["metadataId"], None)
+            elif kind == "createDeveloperMetadata":
+                item = spec["developerMetadata"]
+                if item["metadataId"] in metadata:
+                    raise FakeAPIError(f"metadataId {item['metadataId']} already exists")
+                metadata[item["metadataId"]] = item["metadataValue"]
+        self.ws._rows = rows
+        self.metadata = metadata
+
+
+def _cell_values(row: dict) -> list[str]:
+    return [str(next(iter(cell["userEnteredValue"].values()))) for cell in row["values"]]
+
+
 class FakeWorksheet:
-    """模擬 gspread.Worksheet：支援 get_all_values / clear / update。"""
+    """模擬 gspread.Worksheet：get_all_values / batch_get / get / clear / update + 列層級 batch_update。"""
+
+    id = 0
 
     def __init__(self, rows: list[list[str]] | None = None) -> None:
         self._rows: list[list[str]] = [list(r) for r in (rows or [])]
+        self.spreadsheet = FakeSpreadsheet(self)
+        self.cleared = 0
+        self.reads: list[str] = []  # 讀取請求 (get / batch_get)
 
     def get_all_values(self) -> list[list[str]]:
         return [list(r) for r in self._rows]
 
+    def _version_cell(self) -> list[list[str]]:
+        return [[self._rows[0][4]]] if self._rows and len(self._rows[0]) > 4 else []
+
+    def get(self, cell: str) -> list[list[str]]:
+        assert cell == "E1"
+        self.reads.append("get")
+        return self._version_cell()
+
+    def batch_get(self, ranges: list[str]) -> list[list[list[str]]]:
+        self.reads.append("batch_get")
+        result = []
+        for cell in ranges:
+            if cell == "A:C":
+                result.append([list(r[:3]) for r in self._rows])
+            elif cell == "E1":
+                result.append(self._version_cell())
+            else:  # A{列號}
+                assert cell[0] == "A"
+                row = int(cell[1:]) - 1
+                result.append([[self._rows[row][0]]] if row < len(self._rows) and self._rows[row] else [])
+        return result
+
     def update(self, data: list[list[str]]) -> None:
-        self._rows = [list(r) for r in data]
+        self._rows = [[str(v) for v in r] for r in data]
 
     def clear(self) -> None:
+        self.cleared += 1
         self._rows = []
 
 
@@ -56,6 +130,12 @@ def test_add_new_stock(seeded_ws: FakeWorksheet) -> None:
     assert reloaded["3333"]["name"] == "Gamma"
 
 
+def test_add_to_empty_tab_writes_header(empty_ws: FakeWorksheet) -> None:
+    assert wl.add_stock("3333", "Gamma", "消費電子", ws=empty_ws) is True
+    assert wl.list_ids(empty_ws) == ["3333"]
+    assert wl.read_version(empty_ws) == 1
+
+
 def test_add_existing_stock_updates(seeded_ws: FakeWorksheet) -> None:
     added = wl.add_stock("1111", "Alpha2", "車用/工控", ws=seeded_ws)
     assert added is False  # 已存在 → False
@@ -91,3 +171,157 @@ def test_get_category_emoji() -> None:
     assert wl.get_category_emoji("AI/高速傳輸") == "🚀"
     # 未定義分類 fallback 空字串
     assert wl.get_category_emoji("未知分類") == ""
+
+
+def test_mutations_are_single_row_batches_with_version_bump(seeded_ws: FakeWorksheet) -> None:
+    wl.add_stock("3333", "Gamma", "消費電子", ws=seeded_ws)
+    wl.add_stock("2222", "Beta2", "上游材料", ws=seeded_ws)
+    wl.remove_stock("1111", ws=seeded_ws)
+
+    assert seeded_ws.cleared == 0  # 不再清空整頁重寫
+    kinds = [[next(iter(r)) for r in batch] for batch in seeded_ws.spreadsheet.batches]
+    lock = ["deleteDeveloperMetadata", "createDeveloperMetadata"]
+    assert kinds == [
+        ["appendCells", "updateCells", *lock],
+        ["updateCells", "updateCells", *lock],
+        ["deleteDimension", "updateCells", *lock],
+    ]
+    assert wl.read_version(seeded_ws) == 3
+    assert wl.list_ids(seeded_ws) == ["2222", "3333"]
+    assert wl.load_watchlist(seeded_ws)["2222"]["category"] == "上游材料"
+
+
+def test_stale_snapshot_conflicts(seeded_ws: FakeWorksheet) -> None:
+    first = wl.read_snapshot(seeded_ws)
+    second = wl.read_snapshot(seeded_ws)
+    wl.delete_stocks(seeded_ws, first, ["1111"])
+
+    with pytest.raises(wl.WatchlistConflict):
+        wl.update_stock(seeded_ws, second, "2222", "Beta2", "消費電子")  # 列號已位移
+    assert wl.load_watchlist(seeded_ws)["2222"]["name"] == "Beta"
+
+
+def test_commit_racing_past_the_version_check_is_rejected(seeded_ws: FakeWorksheet) -> None:
+    first = wl.read_snapshot(seeded_ws)
+    second = wl.read_snapshot(seeded_ws)
+    spreadsheet = seeded_ws.spreadsheet
+    batch_update = spreadsheet.batch_update
+
+    def racing(body: dict) -> None:
+        # second 已比對過版本格，它的 batch 送達前 first 先寫入
+        spreadsheet.batch_update = batch_update
+        wl.delete_stocks(seeded_ws, first, ["1111"])
+        batch_update(body)
+
+    spreadsheet.batch_update = racing
+    with pytest.raises(wl.WatchlistConflict):
+        wl.update_stock(seeded_ws, second, "2222", "Beta2", "消費電子")  # 列號已位移
+
+    assert wl.list_ids(seeded_ws) == ["2222"]
+    assert wl.load_watchlist(seeded_ws)["2222"]["name"] == "Beta"  # 整批未套用
+    assert wl.read_version(seeded_ws) == 1
+    assert list(spreadsheet.metadata.values()) == ["1"]
+
+
+def test_add_stock_retries_after_concurrent_edit(seeded_ws: FakeWorksheet, monkeypatch) -> None:
+    read_snapshot = wl.read_snapshot
+    raced = []
+
+    def racing_read(ws):
+        snapshot = read_snapshot(ws)
+        if not raced:  # 讀取後、寫入前，另一個 session 刪掉了 1111
+            raced.append(True)
+            wl.delete_stocks(ws, read_snapshot(ws), ["1111"])
+        return snapshot
+
+    monkeypatch.setattr(wl, "read_snapshot", racing_read)
+    assert wl.add_stock("2222", "Beta2", "消費電子", ws=seeded_ws) is False
+    assert wl.list_ids(seeded_ws) == ["2222"]
+    assert wl.load_watchlist(seeded_ws)["2222"]["name"] == "Beta2"
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_cache_revalidates_with_version_cell_only(seeded_ws: FakeWorksheet) -> None:
+    clock = FakeClock()
+    cache = wl.WatchlistCache(lambda: seeded_ws, ttl=10, clock=clock)
+    assert set(cache.watchlist()) == {"1111", "2222"}
+    cache.categories()
+    assert seeded_ws.reads == ["batch_get"]  # ttl 內不再發請求
+
+    clock.now = 11
+    cache.watchlist()
+    assert seeded_ws.reads == ["batch_get", "get"]  # 版本沒變：只讀版本格
+
+    wl.add_stock("3333", "Gamma", "消費電子", ws=seeded_ws)  # 其他 session 修改
+    seeded_ws.reads.clear()
+    clock.now = 22
+    assert "3333" in cache.watchlist()
+    assert seeded_ws.reads == ["get", "batch_get"]
+
+
+def test_cache_writes_through_without_rereading(seeded_ws: FakeWorksheet) -> None:
+    cache = wl.WatchlistCache(lambda: seeded_ws, ttl=10, clock=FakeClock())
+    cache.watchlist()
+    seeded_ws.reads.clear()
+
+    assert cache.add("3333", "Gamma", "消費電子") is True
+    assert cache.add("4444", "Delta", "上游材料") is True
+    assert cache.remove("1111") is True
+    assert cache.add("3333", "Gamma2", "車用/工控") is False
+    assert cache.remove("9999") is False
+
+    # 每次寫入只比對版本格 (改 / 刪列時連同目標列的 A 欄)，沒有重讀整頁
+    assert seeded_ws.reads == ["get", "get", "batch_get", "batch_get"]
+    assert list(cache.watchlist()) == ["2222", "3333", "4444"]
+    assert cache.watchlist()["3333"]["name"] == "Gamma2"
+    fresh = wl.read_snapshot(seeded_ws)
+    cached = cache.snapshot()
+    assert (cached.version, cached.rows, cached.row_numbers, cached.used_rows) == (
+        fresh.version, fresh.rows, fresh.row_numbers, fresh.used_rows
+    )
+
+
+def test_cache_retries_when_another_session_wrote_first(seeded_ws: FakeWorksheet) -> None:
+    cache = wl.WatchlistCache(lambda: seeded_ws, ttl=10, clock=FakeClock())
+    cache.watchlist()
+    wl.remove_stock("1111", ws=seeded_ws)  # 快取還在 ttl 內，不知道這次修改
+
+    assert cache.remove("2222") is True  # 列號已位移：衝突 → 重新讀取後刪對的列
+    assert wl.list_ids(seeded_ws) == []
+    assert cache.watchlist() == {}
+
+
+def test_manual_row_moves_are_detected(seeded_ws: FakeWorksheet) -> None:
+    cache = wl.WatchlistCache(lambda: seeded_ws, ttl=10, clock=FakeClock())
+    cache.watchlist()
+    # 在 Sheets UI 手動插入一列：版本格不變，但 2222 往下移了一列
+    seeded_ws._rows.insert(1, ["5555", "Epsilon", "其他"])
+
+    assert cache.remove("2222") is True  # 目標列的 A 欄不符 → 重新讀取後刪對的列
+    assert wl.list_ids(seeded_ws) == ["5555", "1111"]
+    assert cache.add("1111", "Alpha2", "消費電子") is False
+    assert wl.load_watchlist(seeded_ws)["1111"]["name"] == "Alpha2"
+    assert wl.load_watchlist(seeded_ws)["5555"]["name"] == "Epsilon"
+
+
+def test_cache_raises_after_repeated_conflicts(seeded_ws: FakeWorksheet, monkeypatch) -> None:
+    cache = wl.WatchlistCache(lambda: seeded_ws, ttl=10, clock=FakeClock())
+    cache.watchlist()
+
+    def always_moved(ws, snapshot, rows):
+        raise wl.WatchlistConflict("moved")
+
+    monkeypatch.setattr(wl, "_check", always_moved)
+    with pytest.raises(wl.WatchlistConflict):
+        cache.remove("1111")
+    monkeypatch.undo()
+    seeded_ws.reads.clear()
+    assert set(cache.watchlist()) == {"1111", "2222"}  # 衝突後丟掉快取，整頁重讀
+    assert seeded_ws.reads == ["batch_get"]
@@ -5,9 +5,10 @@ import time
 import pandas as pd
 import requests
 
+from lib.history_index import HistoryIndex
 from lib.logger import get_logger
 from lib.parsers import parse_histock_history
-from lib.sheet import SheetNotReady, open_sheet, overwrite_sheet
+from lib.sheet import REWRITE, SheetNotReady, bump_revision, open_sheet, overwrite_sheet
 from settings import BROKER_ID, PROGRESS_FILE
 
 log = get_logger(__name__)
@@ -88,6 +89,7 @@ def fetch_histock_history(stock_id):
 def _flush_sheet(sheet, df: pd.DataFrame) -> None:
     """把目前的 DataFrame 覆寫回 Sheet"""
     overwrite_sheet(sheet, df)
+    bump_revision(sheet, REWRITE)
 
 
 def main():
@@ -121,6 +123,9 @@ def main():
     unique_stocks = df["代號"].unique()
     log.info(f"📊 總股票數: {len(unique_stocks)}")
 
+    # 排序一次建立索引，逐檔查列不再整表比對；label 仍指向原 df 的列
+    history = HistoryIndex(df.assign(日期=pd.to_datetime(df["日期"], format="mixed")))
+
     if start_index >= len(unique_stocks):
         log.info("✅ 所有股票都已處理過，重置進度並從頭開始。")
         _clear_progress()
@@ -146,12 +151,11 @@ def main():
                 _save_progress(current_idx)
                 continue
 
-            mask = df["代號"] == stock_id
-            target_indices = df[mask].index
+            stock_rows = history.stock(stock_id)
+            row_dates = stock_rows["日期"].dt.strftime("%Y-%m-%d")
 
             match_count = 0
-            for idx_row in target_indices:
-                row_date = pd.to_datetime(df.at[idx_row, "日期"]).strftime("%Y-%m-%d")
+            for idx_row, row_date in zip(stock_rows.index, row_dates, strict=True):
                 if row_date in hist_data:
                     new_data = hist_data[row_date]
                     df.at[idx_row, "買賣超金額(千)"] = new_data["net_amt_k"]